@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark da geração de pedidos: planilhas sintéticas, servidor FTP local e relatório
+comparável entre rodadas. Fica fora do script principal (e do executável): é carregado
+só por 'python "gerar Pedido Epan ou XML.py" --benchmark ...', que repassa os argumentos
+para executar_cli deste módulo.
+"""
+import os
+import sys
+import io
+import json
+import time
+import threading
+import importlib.util
+from datetime import datetime
+
+import numpy as np
+import openpyxl
+
+ARQUIVO_NUCLEO = "gerar Pedido Epan ou XML.py"
+
+def _carregar_nucleo():
+    """
+    Módulo do gerador. Chamado pelo script principal, é o próprio __main__ (os processos
+    de renderização continuam importando as funções de lá); importado de outro lugar,
+    carrega o script pelo caminho, já que o nome com espaços não permite 'import'.
+    """
+    principal = sys.modules.get("__main__")
+    if hasattr(principal, "OrderGeneratorCore"):
+        return principal
+    if "gerar_pedido" in sys.modules:
+        return sys.modules["gerar_pedido"]
+    spec = importlib.util.spec_from_file_location(
+        "gerar_pedido", os.path.join(os.path.dirname(os.path.abspath(__file__)), ARQUIVO_NUCLEO))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+nucleo = _carregar_nucleo()
+
+TAMANHOS_BENCHMARK = (1_000, 10_000, 100_000, 1_000_000)
+ARQUIVO_CSV_BENCHMARK = "benchmark_geracao.csv"
+
+# Planilhas sintéticas reaproveitadas e relatórios comparáveis, ao lado dos pedidos gerados
+PASTA_BENCHMARKS = os.path.join(nucleo.OUTPUT_BASE_DIR_UNIFIED, "Benchmarks")
+
+
+# ==============================================================================
+# PLANILHAS SINTÉTICAS E SERVIDOR FTP LOCAL
+# ==============================================================================
+def _digitos(numeros, quantidade):
+    """Matriz (n, quantidade) com os dígitos decimais de cada número."""
+    return (numeros[:, None] // 10 ** np.arange(quantidade - 1, -1, -1, dtype=np.int64)) % 10
+
+def cnpjs_sinteticos(raizes):
+    """CNPJs (matriz 0001) com dígitos verificadores válidos para raízes de 8 dígitos."""
+    base = np.asarray(raizes, dtype=np.int64) * 10_000 + 1
+    digitos = _digitos(base, 12)
+    d1 = nucleo._digito_modulo11(digitos, nucleo._PESOS_CNPJ_DV1)
+    d2 = nucleo._digito_modulo11(np.column_stack([digitos, d1]), nucleo._PESOS_CNPJ_DV2)
+    return np.char.zfill((base * 100 + d1 * 10 + d2).astype(str), 14)
+
+def eans_sinteticos(produtos):
+    """EANs de 13 dígitos (prefixo 789) com dígito verificador GTIN-13 válido."""
+    base = 789_000_000_000 + np.asarray(produtos, dtype=np.int64)
+    soma = _digitos(base, 12) @ np.array(nucleo._PESOS_GTIN13, dtype=np.int64)
+    return (base * 10 + (10 - soma % 10) % 10).astype(str)
+
+def gerar_planilha_sintetica(caminho, linhas, formato="XML", itens_por_pedido=10, pedidos_por_arquivo=5,
+                             fracao_invalida=0.02, semente=0):
+    """
+    Grava uma planilha de pedidos fictícios com 'linhas' itens no layout 'XML' ou 'TXT'
+    (as mesmas colunas das planilhas exemplo). Cada pedido (CNPJ) tem 'itens_por_pedido'
+    itens e cada nome de arquivo reúne 'pedidos_por_arquivo' pedidos; 'fracao_invalida'
+    das linhas tem quantidade não numérica ou EAN vazio. A mesma semente gera sempre a
+    mesma planilha. Devolve o caminho.
+    """
+    rng = np.random.default_rng(semente)
+    pedido = np.arange(linhas, dtype=np.int64) // max(1, int(itens_por_pedido))
+    arquivo = pedido // max(1, int(pedidos_por_arquivo))
+    cnpj = cnpjs_sinteticos(10_000_000 + pedido % 90_000_000).tolist()
+    ean = eans_sinteticos(rng.integers(0, 50_000, linhas)).tolist()
+    quantidade = rng.integers(1, 100, linhas).tolist()
+    nome = np.char.add("PEDIDO_", np.char.zfill(arquivo.astype(str), 7)).tolist()
+    for i in np.flatnonzero(rng.random(linhas) < fracao_invalida).tolist():
+        if i % 2:
+            quantidade[i] = "abc"
+        else:
+            ean[i] = None
+
+    if formato == "XML":
+        colunas = nucleo.COLUNAS_XML
+        valores = zip(cnpj, ean, quantidade, ["399"] * linhas, nome)
+    else:
+        colunas = nucleo.COLUNAS_TXT_OBRIGATORIAS + nucleo.COLUNAS_TXT_OPCIONAIS
+        valores = zip(cnpj, ean, quantidade, nome, ["OFERTA1"] * linhas, [None] * linhas, ["30D"] * linhas, [None] * linhas)
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(colunas)
+    for linha in valores:
+        ws.append(linha)
+    conteudo = io.BytesIO()
+    wb.save(conteudo)
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    nucleo.gravar_arquivo_atomico(caminho, conteudo.getvalue(), sincronizar=False) # Planilha pela metade nunca é reaproveitada
+    return caminho
+
+
+class ServidorFtpLocal:
+    """
+    Servidor FTP mínimo, no próprio processo, que substitui o servidor de pedidos nos
+    benchmarks. Aceita qualquer login e pasta, descarta o conteúdo recebido (guarda só
+    o tamanho de cada arquivo) e espera 'latencia' segundos antes de cada resposta,
+    simulando a rede até o servidor real. Os primeiros 'quedas' STOR são derrubados no
+    meio da transferência (conexão fechada sem resposta), para testar as retentativas.
+    """
+    def __init__(self, latencia=0.0, quedas=0):
+        import socketserver
+        self.latencia = latencia
+        self.quedas = quedas
+        self.arquivos = {} # caminho remoto -> bytes recebidos
+        self._lock = threading.Lock()
+        servidor = self
+
+        class Sessao(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True # Respostas curtas não esperam o ACK atrasado do cliente
+
+            def handle(self):
+                servidor._atender(self)
+
+        self._servidor = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Sessao)
+        self._servidor.daemon_threads = True
+        self.host, self.porta = self._servidor.server_address
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+
+    def encerrar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.encerrar()
+
+    def _atender(self, sessao):
+        import socket
+        import posixpath
+
+        def responder(linha):
+            if self.latencia:
+                time.sleep(self.latencia)
+            sessao.wfile.write(f"{linha}\r\n".encode("utf-8"))
+            sessao.wfile.flush()
+
+        pasta, passivo = "/", None
+        try:
+            responder("220 Servidor FTP local (benchmark)")
+            for linha in sessao.rfile:
+                comando, _, argumento = linha.decode("utf-8", "replace").strip().partition(" ")
+                comando = comando.upper()
+                if comando == "USER":
+                    responder("331 Informe a senha")
+                elif comando == "PASS":
+                    responder("230 Login OK")
+                elif comando == "CWD":
+                    pasta = posixpath.normpath(posixpath.join(pasta, argumento))
+                    responder("250 OK")
+                elif comando == "MKD":
+                    responder(f'257 "{posixpath.join(pasta, argumento)}" criado')
+                elif comando in ("TYPE", "NOOP"):
+                    responder("200 OK")
+                elif comando == "PASV":
+                    if passivo is not None:
+                        passivo.close()
+                    passivo = socket.create_server(("127.0.0.1", 0))
+                    porta = passivo.getsockname()[1]
+                    responder(f"227 Entering Passive Mode (127,0,0,1,{porta >> 8},{porta & 255})")
+                elif comando == "STOR" and passivo is not None:
+                    responder("150 Recebendo")
+                    conexao, _ = passivo.accept()
+                    with self._lock:
+                        derrubar = self.quedas > 0
+                        self.quedas -= derrubar
+                    if derrubar:
+                        conexao.recv(1)
+                        conexao.close()
+                        break # Fecha também a conexão de controle, sem o 226
+                    total = 0
+                    with conexao:
+                        while True:
+                            bloco = conexao.recv(65536)
+                            if not bloco:
+                                break
+                            total += len(bloco)
+                    passivo.close()
+                    passivo = None
+                    with self._lock:
+                        self.arquivos[posixpath.join(pasta, argumento)] = total
+                    responder("226 Transferência concluída")
+                elif comando == "QUIT":
+                    responder("221 Até logo")
+                    break
+                else:
+                    responder("502 Comando não suportado")
+        except OSError:
+            pass # Cliente desconectou
+        finally:
+            if passivo is not None:
+                passivo.close()
+
+
+class GeradorBenchmark(nucleo.HeadlessOrderGenerator):
+    """Gerador headless que envia para um ServidorFtpLocal e guarda as métricas de cada execução."""
+    def __init__(self, servidor_ftp, output_base_dir, log_queue):
+        super().__init__(output_base_dir=output_base_dir, log_queue=log_queue)
+        self.servidor_ftp = servidor_ftp
+        self.metricas = []
+
+    def _criar_uploader(self, host, port, *args, **kwargs):
+        return super()._criar_uploader(self.servidor_ftp.host, self.servidor_ftp.porta, *args, **kwargs)
+
+    def _exibir_metricas(self, metricas):
+        self.metricas.append(metricas)
+
+
+def _ler_benchmarks_anteriores(caminho_csv):
+    """Última duração registrada de cada cenário no CSV histórico (só execuções com sucesso)."""
+    import csv
+    anteriores = {}
+    if os.path.exists(caminho_csv):
+        with open(caminho_csv, encoding="utf-8-sig", newline="") as f:
+            for linha in csv.DictReader(f, delimiter=";"):
+                if linha.get("sucesso") != "True":
+                    continue
+                try:
+                    anteriores[linha["cenario"]] = float(linha["duracao_total_s"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+    return anteriores
+
+def executar_benchmark(tamanhos=TAMANHOS_BENCHMARK, formatos=("XML", "TXT"), pasta=PASTA_BENCHMARKS,
+                       itens_por_pedido=10, pedidos_por_arquivo=5, fracao_invalida=0.02, semente=0,
+                       latencia_ftp=0.0, enviar_ftp=True, configuracao=None, log=None):
+    """
+    Roda as gerações XML/TXT sobre planilhas sintéticas de cada tamanho, enviando para um
+    ServidorFtpLocal, e registra o tempo de cada fase. Cada cenário vira uma linha em
+    'benchmark_geracao.csv' (com a variação em relação à rodada anterior do mesmo cenário)
+    e a rodada inteira é salva em JSON. 'configuracao' sobrescreve atributos do gerador
+    (leitor_planilha, processos_renderizacao, conexoes_ftp...). Devolve as linhas.
+    """
+    import csv
+    import platform
+    import shutil
+    import tempfile
+    log = log or nucleo.LogConsole().put
+    configuracao = dict(configuracao or {})
+    motor = nucleo.escolher_leitor(configuracao.get("leitor_planilha", nucleo.OrderGeneratorCore.leitor_planilha)) # ValueError antes de começar
+    os.makedirs(pasta, exist_ok=True)
+    rodada = datetime.now()
+    caminho_csv = os.path.join(pasta, ARQUIVO_CSV_BENCHMARK)
+    anteriores = _ler_benchmarks_anteriores(caminho_csv)
+    linhas_relatorio = []
+
+    with ServidorFtpLocal(latencia_ftp) as servidor, \
+         open(os.path.join(pasta, "benchmark.log"), "w", encoding="utf-8") as arquivo_log:
+        for linhas in tamanhos:
+            for formato in formatos:
+                nome_planilha = (f"sintetica_{formato.lower()}_{linhas}l_{itens_por_pedido}i_{pedidos_por_arquivo}p_"
+                                 f"{fracao_invalida:g}inv_s{semente}.xlsx")
+                planilha = os.path.join(pasta, "planilhas", nome_planilha)
+                if not os.path.exists(planilha):
+                    log(f"Gerando planilha sintética {nome_planilha}...")
+                    gerar_planilha_sintetica(planilha, linhas, formato, itens_por_pedido, pedidos_por_arquivo,
+                                             fracao_invalida, semente)
+
+                saida = tempfile.mkdtemp(prefix="execucao_", dir=pasta)
+                gerador = GeradorBenchmark(servidor, saida, nucleo.LogConsole(arquivo_log))
+                for atributo, valor in configuracao.items():
+                    setattr(gerador, atributo, valor)
+                nucleo.CACHE_PLANILHAS.limpar() # Mede a leitura real da planilha
+                log(f"Executando {formato} com {linhas} linha(s)...")
+                try:
+                    if formato == "XML":
+                        gerador._generate_xml_logic(planilha, "", "", "", enviar_ftp)
+                    else:
+                        gerador._generate_txt_logic(planilha, "bench", "EPP", "Boleto", enviar_ftp, False, "", "")
+                finally:
+                    nucleo.encerrar_sessoes_ftp()
+                    shutil.rmtree(saida, ignore_errors=True)
+                if not gerador.metricas:
+                    log(f"  ERRO: a execução {formato} com {linhas} linha(s) não registrou métricas (veja benchmark.log).")
+                    continue
+
+                metricas = gerador.metricas[-1]
+                cenario = "|".join([formato, f"linhas={linhas}", f"itens={itens_por_pedido}", f"pedidos={pedidos_por_arquivo}",
+                                    f"invalidas={fracao_invalida:g}", f"latencia_ms={latencia_ftp * 1000:g}",
+                                    f"ftp={'sim' if enviar_ftp else 'nao'}",
+                                    f"leitor={motor}",
+                                    f"processos={nucleo.resolver_processos(gerador.processos_renderizacao)}",
+                                    f"conexoes={gerador.conexoes_ftp}"])
+                linha = {
+                    "rodada": rodada.isoformat(timespec="seconds"),
+                    "cenario": cenario,
+                    "python": platform.python_version(),
+                    "nucleos": os.cpu_count(),
+                }
+                linha.update(metricas._linha_csv())
+                anterior = anteriores.get(cenario)
+                linha["variacao_pct"] = (round(100 * (metricas.duracao_total - anterior) / anterior, 1)
+                                         if anterior else "")
+                linhas_relatorio.append(linha)
+                comparacao = f" (anterior {anterior:.2f}s, {linha['variacao_pct']:+}%)" if anterior else ""
+                log(f"  {metricas.resumo()}{comparacao}".replace("\n", "\n  "))
+
+    if linhas_relatorio:
+        novo = not os.path.exists(caminho_csv)
+        with open(caminho_csv, "a", encoding="utf-8-sig", newline="") as f:
+            escritor = csv.DictWriter(f, fieldnames=list(linhas_relatorio[0]), delimiter=";")
+            if novo:
+                escritor.writeheader()
+            escritor.writerows(linhas_relatorio)
+        caminho_json = os.path.join(pasta, f"benchmark_{rodada.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(caminho_json, "w", encoding="utf-8") as f:
+            json.dump(linhas_relatorio, f, ensure_ascii=False, indent=2)
+        log(f"Relatório do benchmark: {caminho_json} (histórico em {caminho_csv})")
+    return linhas_relatorio
+
+
+# ==============================================================================
+# LINHA DE COMANDO (--benchmark)
+# ==============================================================================
+def criar_parser_cli():
+    """Parser do modo linha de comando do gerador acrescido das opções do benchmark."""
+    parser = nucleo.criar_parser_cli()
+    grupo_bench = parser.add_argument_group("opções do benchmark (--benchmark; --saida é a pasta dos relatórios)")
+    grupo_bench.add_argument("--tamanhos", default=",".join(str(n) for n in TAMANHOS_BENCHMARK),
+                             help="Linhas de cada planilha sintética, separadas por vírgula (padrão: %(default)s).")
+    grupo_bench.add_argument("--formatos", default="XML,TXT", help="Gerações medidas (padrão: %(default)s).")
+    grupo_bench.add_argument("--itens-por-pedido", type=int, default=10, help="Itens de cada pedido (padrão: 10).")
+    grupo_bench.add_argument("--pedidos-por-arquivo", type=int, default=5, help="Pedidos (CNPJs) por nome de arquivo (padrão: 5).")
+    grupo_bench.add_argument("--fracao-invalida", type=float, default=0.02, help="Fração de linhas inválidas (padrão: 0.02).")
+    grupo_bench.add_argument("--semente", type=int, default=0, help="Semente das planilhas sintéticas (padrão: 0).")
+    grupo_bench.add_argument("--latencia-ftp", type=float, default=0.0,
+                             help="Latência simulada por resposta do servidor FTP local, em ms (padrão: 0).")
+    grupo_bench.add_argument("--sem-ftp", action="store_true", help="Mede só a geração, sem envio FTP.")
+    return parser
+
+
+def executar_cli(argv):
+    """Executa o benchmark com os argumentos de '--benchmark'. Retorna o código de saída (0 = sucesso)."""
+    parser = criar_parser_cli()
+    args = parser.parse_args(argv)
+    if not args.benchmark:
+        parser.error("Use --benchmark.")
+    try:
+        tamanhos = [int(n) for n in args.tamanhos.split(",") if n.strip()]
+    except ValueError:
+        parser.error(f"--tamanhos inválido: {args.tamanhos}")
+    formatos = [f.strip().upper() for f in args.formatos.split(",") if f.strip()]
+    if not formatos or any(f not in ("XML", "TXT") for f in formatos):
+        parser.error(f"--formatos inválido: {args.formatos}")
+    try:
+        nucleo.escolher_leitor(args.leitor)
+    except ValueError as e:
+        parser.error(str(e))
+    linhas = executar_benchmark(tamanhos, formatos, pasta=args.saida or PASTA_BENCHMARKS,
+                                itens_por_pedido=args.itens_por_pedido, pedidos_por_arquivo=args.pedidos_por_arquivo,
+                                fracao_invalida=args.fracao_invalida, semente=args.semente,
+                                latencia_ftp=args.latencia_ftp / 1000, enviar_ftp=not args.sem_ftp,
+                                configuracao={"leitor_planilha": args.leitor, "processos_renderizacao": args.processos,
+                                              "conexoes_ftp": args.conexoes_ftp, "envio_continuo": not args.envio_em_lote,
+                                              "copia_local": args.copia_local})
+    return 0 if linhas and all(linha["sucesso"] for linha in linhas) else 1
@@ -1,21 +1,21 @@
 # -*- coding: utf-8 -*-
-import tkinter as tk
-from tkinter import filedialog, messagebox
-import customtkinter as ctk
+import time
+_INICIO_PROCESSO = time.perf_counter() # Referência do benchmark de inicialização
 import threading
 import queue
 import os
-import ftplib
-import pandas as pd
-import openpyxl # Necessário para o script XML
-import xml.etree.ElementTree as ET # Necessário para o script XML
 from datetime import datetime
 import sys
 import re
 import subprocess
 import json
-import socket
-import requests # Mantido para verificação de acesso (se reativada, no momento comentada)
+import io
+import hashlib
+import glob
+from contextlib import contextmanager
+from collections import OrderedDict
+# pandas, numpy, openpyxl, ftplib e a interface gráfica (tkinter, customtkinter) são importados sob demanda (ver ModuloSobDemanda)
+_TEMPO_IMPORTACOES_INICIAIS = time.perf_counter() - _INICIO_PROCESSO
 
 # --- FUNÇÃO PARA ARQUIVOS PERMANENTES (ESSENCIAL PARA O .EXE) ---
 def get_persistent_path(filename):
@@ -26,10 +26,76 @@ def get_persistent_path(filename):
         application_path = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(application_path, filename)
 
+# ==============================================================================
+# IMPORTAÇÕES SOB DEMANDA (JANELA ABRE SEM ESPERAR OS MÓDULOS PESADOS)
+# ==============================================================================
+# Módulos sob demanda (nome -> substituto) e quanto tempo cada importação levou
+MODULOS_SOB_DEMANDA = {}
+TEMPOS_IMPORTACAO = {}
+
+class ModuloSobDemanda:
+    """
+    Substituto de um módulo pesado: a importação real só acontece no primeiro uso
+    de um atributo (ex.: pd.read_excel), na geração/envio ou no pré-carregamento
+    em segundo plano feito pela janela.
+    """
+    def __init__(self, nome, pre_carregar=True):
+        self._nome = nome
+        self._modulo = None
+        if pre_carregar: # Os da interface gráfica ficam de fora: a linha de comando não precisa deles
+            MODULOS_SOB_DEMANDA[nome] = self
+
+    def carregar(self):
+        if self._modulo is None:
+            import importlib
+            inicio = time.perf_counter()
+            modulo = importlib.import_module(self._nome) # Importação já é protegida contra threads concorrentes
+            TEMPOS_IMPORTACAO.setdefault(self._nome, time.perf_counter() - inicio)
+            self._modulo = modulo
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        if atributo.startswith("__"):
+            raise AttributeError(atributo)
+        return getattr(self.carregar(), atributo)
+
+np = ModuloSobDemanda("numpy")
+pd = ModuloSobDemanda("pandas")
+openpyxl = ModuloSobDemanda("openpyxl")
+ftplib = ModuloSobDemanda("ftplib")
+# Interface gráfica: carregada só quando a janela é criada (ver criar_janela). Pela linha de
+# comando (cron, contêineres sem tela) o Tk e o customtkinter nem precisam estar instalados.
+tk = ModuloSobDemanda("tkinter", pre_carregar=False)
+filedialog = ModuloSobDemanda("tkinter.filedialog", pre_carregar=False)
+messagebox = ModuloSobDemanda("tkinter.messagebox", pre_carregar=False)
+ctk = ModuloSobDemanda("customtkinter", pre_carregar=False)
+
+def _importacoes_para_o_empacotador():
+    """
+    Nunca é chamada. O importlib.import_module de ModuloSobDemanda é invisível para a
+    análise estática do PyInstaller; estes imports explícitos fazem os módulos sob
+    demanda entrarem no executável.
+    """
+    import numpy, pandas, openpyxl, ftplib, tkinter, tkinter.filedialog, tkinter.messagebox, customtkinter
+
+def pre_carregar_modulos():
+    """Importa os módulos sob demanda que faltam carregar. Devolve {nome: ImportError} dos ausentes."""
+    ausentes = {}
+    for nome, modulo in MODULOS_SOB_DEMANDA.items():
+        try:
+            modulo.carregar()
+        except ImportError as e:
+            ausentes[nome] = e
+    return ausentes
+
 # ==============================================================================
 # CLASSE DE TEMPLATE DA APLICAÇÃO (BASE) - ADAPTADA PARA UNIFICAÇÃO
 # ==============================================================================
-class ModernAppTemplate(ctk.CTk):
+class ModernAppTemplate:
+    """
+    Base da janela. A classe ctk.CTk só entra na hierarquia em criar_janela, para que
+    este módulo não importe o customtkinter (nem o Tk) pela linha de comando.
+    """
     def __init__(self):
         super().__init__()
         self.grid_columnconfigure(1, weight=1)
@@ -48,6 +114,7 @@ class ModernAppTemplate(ctk.CTk):
         self.BUTTON_CORNER_RADIUS = 10
         self.PADX = 10 # Adicionado como atributo da instância
         self.PADY = 5  # Adicionado como atributo da instância
+        self._auto_save_agendado = None # Timer do salvamento automático (agrupa alterações seguidas)
 
         self.FONT_TITLE = ctk.CTkFont(size=30, weight="bold")
         self.FONT_H1 = ctk.CTkFont(size=20, weight="bold")
@@ -159,13 +226,25 @@ class ModernAppTemplate(ctk.CTk):
             ctk.set_appearance_mode(ctk_mode)
             self._auto_save_on_change() # Aciona o salvamento quando o tema muda
 
+    # Espera após a última alteração antes de salvar (digitação seguida vira um único salvamento)
+    AUTO_SAVE_ATRASO_MS = 800
+
     def _auto_save_on_change(self, *args):
-        """Método a ser chamado quando uma variável configurável muda, para acionar o salvamento."""
-        # Este método precisa ser implementado na classe que herda
-        # para salvar configurações específicas do aplicativo.
-        print("Auto-save acionado (implemente a lógica de salvamento na classe filha).")
+        """Método a ser chamado quando uma variável configurável muda: agenda o salvamento, reiniciando o timer."""
+        if self._auto_save_agendado is not None:
+            self.after_cancel(self._auto_save_agendado)
+        self._auto_save_agendado = self.after(self.AUTO_SAVE_ATRASO_MS, self._executar_auto_save)
+
+    def _executar_auto_save(self):
+        self._auto_save_agendado = None
         self._salvar_configuracoes()
 
+    def _cancelar_auto_save(self):
+        """Descarta o salvamento agendado (quem chama salva na hora, ex.: ao fechar a janela)."""
+        if self._auto_save_agendado is not None:
+            self.after_cancel(self._auto_save_agendado)
+            self._auto_save_agendado = None
+
     def _salvar_configuracoes(self):
         """Salva as configurações atuais do aplicativo em um arquivo JSON. (Implementado na classe filha)"""
         pass
@@ -200,6 +279,18 @@ OUTPUT_TXT_DIR = os.path.join(OUTPUT_BASE_DIR_UNIFIED, "TXT_Pedidos")
 # Nome do arquivo para log de erros (pode ser compartilhado ou separado)
 arquivo_erro_xlsx = get_persistent_path('erros_geracao_unificada.xlsx')
 
+# Diários de envio FTP (um por envio), usados para retomar envios interrompidos
+PASTA_DIARIOS_ENVIO = os.path.join(OUTPUT_BASE_DIR_UNIFIED, "Diarios_Envio_FTP")
+
+# Relatórios de métricas de cada execução (JSON por execução + CSV histórico)
+PASTA_RELATORIOS = os.path.join(OUTPUT_BASE_DIR_UNIFIED, "Relatorios_Execucao")
+
+# Cache em disco das planilhas já lidas (opcional), ao lado do arquivo de configuração
+PASTA_CACHE_PLANILHAS = get_persistent_path("cache_planilhas")
+
+# Registro (SQLite) dos pedidos já gerados/enviados, usado pelo modo incremental
+ARQUIVO_REGISTRO_PEDIDOS = os.path.join(OUTPUT_BASE_DIR_UNIFIED, "registro_pedidos.sqlite3")
+
 # Configurações FTP para Upload de XML (do Script 1)
 FTP_XML_UPLOAD_HOST = "10.41.15.19"
 FTP_XML_UPLOAD_PORT = 21 # Default para FTP
@@ -228,6 +319,125 @@ def criar_diretorios(log_queue, path):
         log_queue.put(f"ERRO CRÍTICO ao criar diretório {path}: {e}")
         raise # Levanta a exceção para que o chamador possa tratá-la
 
+def gravar_arquivo(caminho, conteudo, renomear=None):
+    """
+    Grava um arquivo de saída novo, criando a pasta se preciso. O arquivo é publicado já
+    completo (temporário + link para o nome final), sem fsync: quem observa a pasta
+    (envio FTP, integrações) nunca vê um pedido pela metade. Um arquivo existente nunca
+    é substituído: se outra execução publicou o nome primeiro, 'renomear(caminho, conteudo)'
+    devolve (novo caminho, novo conteúdo) e a publicação é tentada de novo; sem
+    'renomear', levanta FileExistsError. Devolve o caminho gravado.
+    """
+    pasta, nome = os.path.split(os.path.abspath(caminho))
+    os.makedirs(pasta, exist_ok=True)
+    temporario = os.path.join(pasta, f".{nome}.{os.getpid()}_{threading.get_ident()}.tmp")
+    try:
+        with open(temporario, "wb") as f:
+            f.write(conteudo)
+        while True:
+            try:
+                _publicar_sem_substituir(temporario, caminho)
+                return caminho
+            except FileExistsError:
+                if renomear is None:
+                    raise
+                caminho, novo_conteudo = renomear(caminho, conteudo)
+                if novo_conteudo is not conteudo:
+                    conteudo = novo_conteudo
+                    with open(temporario, "wb") as f:
+                        f.write(conteudo)
+    except BaseException:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        raise
+
+def _publicar_sem_substituir(temporario, caminho):
+    """Dá ao temporário o nome final só se esse nome ainda não existe (senão, FileExistsError)."""
+    try:
+        os.link(temporario, caminho)
+    except FileExistsError:
+        raise
+    except OSError: # Sistema de arquivos sem links (FAT, alguns compartilhamentos de rede)
+        if sys.platform == "win32":
+            os.rename(temporario, caminho) # No Windows, rename não substitui um arquivo existente
+            return
+        os.close(os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY)) # Reserva o nome antes da troca
+        os.replace(temporario, caminho)
+        return
+    os.remove(temporario)
+
+def gravar_arquivo_atomico(caminho, conteudo, sincronizar=True):
+    """
+    Grava bytes em um temporário na mesma pasta e o renomeia por cima do destino:
+    quem lê o arquivo vê o conteúdo antigo ou o novo, nunca um arquivo pela metade.
+    Com sincronizar=True o conteúdo também vai para o disco (fsync) antes da troca.
+    """
+    pasta, nome = os.path.split(os.path.abspath(caminho))
+    # Nome único por processo e thread; oculto e com '.tmp' para ser ignorado por quem observa a pasta
+    temporario = os.path.join(pasta, f".{nome}.{os.getpid()}_{threading.get_ident()}.tmp")
+    try:
+        with open(temporario, "wb") as f:
+            f.write(conteudo)
+            if sincronizar:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+    except BaseException:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        raise
+
+def caminho_erros_execucao(caminho_base, tipo):
+    """
+    Planilha de erros das execuções de um modo: o tipo no nome, para que execuções
+    simultâneas de modos diferentes não gravem (nem removam) a planilha uma da outra.
+    Execuções do mesmo modo nunca rodam juntas (RECURSOS_POR_MODO), então cada uma
+    substitui a da anterior, ou a remove quando não rejeita nenhuma linha.
+    """
+    raiz, extensao = os.path.splitext(caminho_base)
+    return f"{raiz}_{tipo.lower()}{extensao}"
+
+class SequenciaNomes:
+    """
+    Numeração dos arquivos de saída de uma execução: o primeiro arquivo com um dado
+    nome recebe 1, o seguinte com o mesmo nome 2, e assim por diante. Números cujo
+    arquivo já existe no disco são pulados; se outra execução (outro processo, no mesmo
+    segundo) publicar o nome antes, gravar_arquivo pede outro com renomear().
+    """
+    def __init__(self):
+        self._ultimos = {}
+        self._formatos = {} # caminho numerado -> (chave, formatar)
+        self._lock = threading.Lock()
+
+    def proximo(self, caminho, formatar):
+        """
+        Caminho numerado livre para 'caminho' (sem a numeração; maiúsculas/minúsculas como
+        no sistema de arquivos). 'formatar(numero)' monta o caminho de cada número.
+        """
+        return self._proximo(os.path.normcase(os.path.abspath(caminho)), formatar)
+
+    def renomear(self, caminho_numerado):
+        """Próximo caminho livre com a mesma base de um caminho devolvido por proximo()."""
+        with self._lock:
+            chave, formatar = self._formatos[caminho_numerado]
+        return self._proximo(chave, formatar)
+
+    def _proximo(self, chave, formatar):
+        with self._lock:
+            numero = self._ultimos.get(chave, 0)
+            while True:
+                numero += 1
+                candidato = formatar(numero)
+                if not os.path.exists(candidato):
+                    break
+            self._ultimos[chave] = numero
+            self._formatos[candidato] = (chave, formatar)
+        return candidato
+
 def verificar_numerico(valor):
     """Verifica se um valor pode ser convertido para numérico."""
     try:
@@ -255,266 +465,3535 @@ def abrir_arquivo(caminho, log_queue):
         messagebox.showerror("Erro", f"Não foi possível abrir:\n{e}")
 
 # ==============================================================================
-# CLASSE DA APLICAÇÃO GUI UNIFICADA
+# LEITURA DE PLANILHAS (MOTORES PLUGÁVEIS)
 # ==============================================================================
-class UnifiedOrderGeneratorApp(ModernAppTemplate):
-    APP_VERSION = "2.1 (Abas Separadas XML/TXT)"
-    CONFIG_FILE = get_persistent_path("unified_order_gen_config.json")
+# Colunas lidas por cada formato. Só essas colunas são decodificadas da planilha.
+COLUNAS_XML = ["CNPJ", "EAN", "Quantidade", "Oferta", "NomeArquivo"]
+COLUNAS_TXT_OBRIGATORIAS = ["CNPJ", "EAN", "QUANTIDADE", "NOME DO ARQUIVO"]
+COLUNAS_TXT_OPCIONAIS = ["OFERTA", "DEAL", "CONDICAO DE PAGAMENTO", "SUFIXO"]
+# Colunas lidas em cada modo de geração (AMBOS = XML + TXT com uma única leitura)
+COLUNAS_POR_MODO = {
+    "XML": COLUNAS_XML,
+    "TXT": COLUNAS_TXT_OBRIGATORIAS + COLUNAS_TXT_OPCIONAIS,
+    "AMBOS": COLUNAS_XML + COLUNAS_TXT_OBRIGATORIAS + COLUNAS_TXT_OPCIONAIS,
+}
+# Colunas com o mesmo significado nos dois layouts (nome no XML -> nome no TXT)
+COLUNAS_EQUIVALENTES = {"Quantidade": "QUANTIDADE", "NomeArquivo": "NOME DO ARQUIVO", "Oferta": "OFERTA"}
 
-    def __init__(self):
-        super().__init__()
-        self.title(f"Gerador de Pedidos Unificado - v{self.APP_VERSION}")
-        self.geometry("1024x768") # Tamanho inicial ajustado para o layout lateral
+def tabelas_por_formato(df):
+    """
+    Modelo único da geração combinada: a partir de uma tabela lida com as colunas dos
+    dois layouts, devolve (tabela_xml, tabela_txt). Coluna ausente em um layout é
+    preenchida pela equivalente do outro (ex.: 'Quantidade' <- 'QUANTIDADE'); as
+    colunas são compartilhadas entre as duas tabelas, sem cópia dos dados.
+    """
+    equivalentes = {**COLUNAS_EQUIVALENTES, **{txt: xml for xml, txt in COLUNAS_EQUIVALENTES.items()}}
+    def montar(colunas):
+        dados = {}
+        for coluna in colunas:
+            origem = coluna if coluna in df.columns else equivalentes.get(coluna)
+            if origem in df.columns:
+                dados[coluna] = df[origem]
+        return pd.DataFrame(dados, copy=False)
+    return montar(COLUNAS_XML), montar(COLUNAS_TXT_OBRIGATORIAS + COLUNAS_TXT_OPCIONAIS)
 
-        # Variáveis de estado
-        self.file_path_var = tk.StringVar()
-        self.log_queue = queue.Queue()
+# Textos que o pandas trata como vazio por padrão (mantidos para que todos os
+# motores produzam exatamente a mesma tabela que 'read_excel(dtype=str).fillna("")')
+_TEXTOS_VAZIOS_PANDAS = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"
+])
 
-        # Variáveis específicas para Geração XML
-        self.manual_login_var = tk.StringVar()
-        self.manual_oferta_var = tk.StringVar()
-        self.manual_nome_base_var = tk.StringVar()
-        self.enviar_xml_ftp_var = tk.BooleanVar(value=False)
+def _celula_para_texto(valor):
+    """Converte o valor de uma célula para texto, como o pandas faz com dtype=str."""
+    if valor is None:
+        return ""
+    if isinstance(valor, float):
+        texto = str(int(valor)) if valor.is_integer() else str(valor)
+    else:
+        texto = str(valor)
+    return "" if texto in _TEXTOS_VAZIOS_PANDAS else texto
 
-        # Variáveis específicas para Geração TXT
-        self.usuario_txt_var = tk.StringVar()
-        self.destino_txt_var = tk.StringVar(value="EPP")
-        self.forma_pagamento_txt_var = tk.StringVar(value="Boleto")
-        self.enviar_txt_ftp_padrao_var = tk.BooleanVar(value=False)
-        self.enviar_txt_ftp_pessoal_var = tk.BooleanVar(value=False)
-        self.ftp_pessoal_user_var = tk.StringVar()
-        self.ftp_pessoal_pass_var = tk.StringVar()
+def _ler_planilha_pandas(caminho, colunas):
+    """Motor legado: pandas + openpyxl carregando a planilha inteira."""
+    desejadas = set(colunas)
+    return pd.read_excel(caminho, dtype=str, usecols=lambda c: c in desejadas).fillna("")
 
-        # --- Defina seus itens de navegação para o UnifiedOrderGeneratorApp ---
-        self.NAV_ITEMS = {
-            "xml": ("📄", "Pedidos XML"),
-            "epan_txt": ("📝", "Pedidos EPAN (TXT)"),
-            "configuracoes": ("🔧", "Configurações"),
-            "sobre": ("ℹ️", "Sobre")
-        }
+def _ler_planilha_calamine(caminho, colunas):
+    """Motor nativo (Rust) via python-calamine, bem mais rápido que o openpyxl."""
+    desejadas = set(colunas)
+    return pd.read_excel(caminho, dtype=str, engine="calamine", usecols=lambda c: c in desejadas).fillna("")
 
-        # Carrega as configurações primeiro
-        self._carregar_configuracoes()
-        # Inicializa os elementos da interface do usuário (deve ser chamado depois de carregar as configurações)
-        self._initialize_ui()
-        # Configura os gatilhos de salvamento automático para variáveis específicas do aplicativo
-        self._setup_auto_save_triggers()
-        # Atualiza elementos específicos da UI que dependem da configuração carregada
-        self._update_ui_from_config() # Para o botão de tema
-        
-        # Log de mensagens (unificado e na janela principal, conforme template)
-        # O logbox é um atributo da classe principal, acessível em self.log_textbox
-        # A template já lida com a grid do content_area. Preciso apenas garantir
-        # que o log textbox seja gridado corretamente fora do content_area
-        # E que o content_area se ajuste.
+def _ler_planilha_openpyxl_stream(caminho, colunas):
+    """Motor de memória limitada: percorre as linhas em modo read-only, decodificando só as colunas pedidas."""
+    wb = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        linhas = ws.iter_rows(values_only=True)
+        cabecalho = next(linhas, None) or ()
+        indices = {}
+        for i, nome in enumerate(cabecalho):
+            if isinstance(nome, str) and nome in colunas and nome not in indices:
+                indices[nome] = i
+        dados = {nome: [] for nome in indices}
+        pares = list(indices.items())
+        total = 0 # Linhas lidas (inclui linhas em branco intermediárias, como o pandas)
+        ultima_com_dados = 0
+        for linha in linhas:
+            total += 1
+            n = len(linha)
+            for nome, i in pares:
+                dados[nome].append(_celula_para_texto(linha[i]) if i < n else "")
+            if any(v is not None and v != "" for v in linha):
+                ultima_com_dados = total
+    finally:
+        wb.close()
+    # Linhas em branco no final da planilha são descartadas (mesmo comportamento do pandas)
+    df = pd.DataFrame({nome: valores[:ultima_com_dados] for nome, valores in dados.items()},
+                      columns=list(indices), dtype=object)
+    return df
 
-        # Ajuste para o log textbox na janela principal
-        self.grid_rowconfigure(0, weight=1) # Content area
-        self.grid_rowconfigure(1, weight=0) # Label Log
-        self.grid_rowconfigure(2, weight=1) # Log Textbox
+def _ler_cabecalho_csv(caminho, codificacao):
+    """Devolve (separador, colunas) lendo só a primeira linha do CSV."""
+    import csv
+    with open(caminho, "rb") as f:
+        texto = f.readline().decode(codificacao).rstrip("\r\n")
+    separador = max(";,\t|", key=texto.count)
+    return separador, next(csv.reader([texto], delimiter=separador), [])
 
-        ctk.CTkLabel(self, text="Log:", font=ctk.CTkFont(weight="bold")).grid(row=1, column=0, columnspan=2, padx=self.PADX, pady=(self.PADY*2, 2), sticky="w")
-        self.log_textbox = ctk.CTkTextbox(self, wrap=tk.WORD, font=("Consolas", 9), corner_radius=self.CARD_CORNER_RADIUS, border_width=1)
-        self.log_textbox.grid(row=2, column=0, columnspan=2, padx=self.PADX, pady=(0, self.PADY), sticky="nsew")
-        self.log_textbox.configure(state=tk.DISABLED)
+def _ler_csv_pyarrow(caminho, codificacao, separador, colunas):
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    tabela = pa_csv.read_csv(
+        caminho,
+        read_options=pa_csv.ReadOptions(encoding="utf8" if codificacao == "utf-8-sig" else codificacao),
+        parse_options=pa_csv.ParseOptions(delimiter=separador, newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(include_columns=colunas, strings_can_be_null=False,
+                                              column_types={c: pa.string() for c in colunas}))
+    return tabela.to_pandas()
 
-        self.after(100, self.process_log_queue)
-        
-        # Garante que o frame de FTP pessoal esteja oculto inicialmente para TXT
-        # Isso precisa ser chamado APÓS a UI ser criada
-        self.after(200, self.handle_txt_ftp_padrao_check)
-        self.after(200, self.handle_txt_ftp_pessoal_check)
+def _ler_csv_pandas(caminho, codificacao, separador, colunas):
+    return pd.read_csv(caminho, sep=separador, encoding=codificacao, usecols=colunas,
+                       dtype={c: str for c in colunas}, keep_default_na=False, engine="c")
 
-    # --- Métodos de População das Páginas (Implementando o template) ---
-    def setup_xml_page(self, parent_frame):
-        self._create_toolbar(parent_frame, "Pedidos XML")
-        parent_frame.grid_columnconfigure(0, weight=1)
-        
-        # Frame de controles para XML
-        controls_frame = ctk.CTkFrame(parent_frame, fg_color="transparent")
-        controls_frame.pack(fill="x", padx=self.PADX, pady=self.PADY, anchor="n")
-        controls_frame.grid_columnconfigure(1, weight=1)
+def _ler_planilha_csv(caminho, colunas):
+    """
+    CSV exportado pelo ERP (UTF-8 ou Windows-1252; separador ';', ',', tab ou '|'): só
+    as colunas pedidas, todas como texto (sem inferência de tipos, preservando zeros à
+    esquerda de CNPJ/EAN), pelo leitor multithread do pyarrow se instalado ou pelo
+    motor C do pandas.
+    """
+    ler = _ler_csv_pyarrow if leitor_disponivel("pyarrow") else _ler_csv_pandas
+    desejadas = set(colunas)
+    primeiro_erro = None
+    for codificacao in ("utf-8-sig", "cp1252"):
+        try:
+            separador, cabecalho = _ler_cabecalho_csv(caminho, codificacao)
+            presentes = list(dict.fromkeys(c for c in cabecalho if c in desejadas))
+            if not presentes:
+                return pd.DataFrame()
+            df = ler(caminho, codificacao, separador, presentes)
+            break
+        except (UnicodeDecodeError, ValueError) as e: # ValueError: erro de decodificação do pyarrow
+            primeiro_erro = primeiro_erro or e
+    else:
+        raise primeiro_erro
+    df = df[presentes].astype(object).fillna("")
+    # Mesmos textos vazios das planilhas Excel ('NA', 'null'...)
+    return df.mask(df.isin(_TEXTOS_VAZIOS_PANDAS), "").reset_index(drop=True)
 
-        # Entrada para o arquivo Excel (comum)
-        ctk.CTkLabel(controls_frame, text="Planilha Excel de Pedidos:").grid(row=0, column=0, columnspan=3, padx=self.PADX, pady=(self.PADY,2), sticky="w")
-        entry_arquivo = ctk.CTkEntry(controls_frame, textvariable=self.file_path_var, corner_radius=self.BUTTON_CORNER_RADIUS)
-        entry_arquivo.grid(row=1, column=0, columnspan=2, padx=(self.PADX, self.PADY), pady=2, sticky="ew")
-        ctk.CTkButton(controls_frame, text="Procurar...", command=self.select_excel_file, width=90, corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=1, column=2, padx=(0, self.PADX), pady=2, sticky="e")
+def _ler_planilha_parquet(caminho, colunas):
+    """
+    Parquet (Arrow): lê do arquivo só as colunas pedidas e as converte para texto como
+    as células do Excel (inteiros sem '.0', nulos como '').
+    """
+    if not leitor_disponivel("pyarrow"):
+        raise ValueError("A leitura de arquivos Parquet requer o pacote pyarrow (pip install pyarrow).")
+    import pyarrow.parquet as pq
+    arquivo = pq.ParquetFile(caminho)
+    desejadas = set(colunas)
+    presentes = list(dict.fromkeys(c for c in arquivo.schema_arrow.names if c in desejadas))
+    tabela = arquivo.read(columns=presentes)
+    dados = {}
+    for nome in presentes:
+        coluna = tabela.column(nome).to_pandas()
+        dados[nome] = coluna.map(_celula_para_texto, na_action="ignore").astype(object).fillna("")
+    return pd.DataFrame(dados, columns=presentes, dtype=object)
 
-        # Opções específicas de XML
-        xml_options_card = ctk.CTkFrame(controls_frame, corner_radius=self.CARD_CORNER_RADIUS, fg_color=self.CARD_FG_COLOR)
-        xml_options_card.grid(row=2, column=0, columnspan=3, padx=self.PADX, pady=self.PADY*2, sticky="ew")
-        xml_options_card.grid_columnconfigure(1, weight=1)
+# Motores disponíveis, do mais rápido para o mais lento. 'auto' usa o primeiro disponível.
+LEITORES_PLANILHA = {
+    "calamine": _ler_planilha_calamine,
+    "openpyxl": _ler_planilha_openpyxl_stream,
+    "pandas": _ler_planilha_pandas,
+}
+# Formatos lidos sem passar pelos motores do Excel (o motor escolhido vale só para .xlsx)
+LEITORES_POR_EXTENSAO = {
+    ".csv": ("csv", _ler_planilha_csv),
+    ".parquet": ("parquet", _ler_planilha_parquet),
+}
+EXTENSOES_PLANILHA = (".xlsx",) + tuple(LEITORES_POR_EXTENSAO)
 
-        ctk.CTkLabel(xml_options_card, text="Substituir Valores (Opcional - XML):", font=self.FONT_H2).grid(row=0, column=0, columnspan=2, padx=20, pady=(20, 10), sticky="w")
-        ctk.CTkLabel(xml_options_card, text="Login:").grid(row=1, column=0, padx=(20, 5), pady=self.PADY, sticky="w")
-        ctk.CTkEntry(xml_options_card, textvariable=self.manual_login_var, placeholder_text="Padrão: pdvlinkmerck", width=180, corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=1, column=1, padx=5, pady=self.PADY, sticky="ew")
-        ctk.CTkLabel(xml_options_card, text="Oferta:").grid(row=2, column=0, padx=(20, 5), pady=self.PADY, sticky="w")
-        ctk.CTkEntry(xml_options_card, textvariable=self.manual_oferta_var, placeholder_text="Padrão: da planilha", width=180, corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=2, column=1, padx=5, pady=self.PADY, sticky="ew")
-        ctk.CTkLabel(xml_options_card, text="Nome Base Arquivo:").grid(row=3, column=0, padx=(20, 5), pady=self.PADY, sticky="w")
-        ctk.CTkEntry(xml_options_card, textvariable=self.manual_nome_base_var, placeholder_text="Padrão: da planilha", width=180, corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=3, column=1, padx=5, pady=(self.PADY, 20), sticky="ew")
-        self.check_enviar_xml_ftp = ctk.CTkCheckBox(xml_options_card, text="Enviar XML(s) via FTP após gerar", variable=self.enviar_xml_ftp_var)
-        self.check_enviar_xml_ftp.grid(row=4, column=0, columnspan=2, padx=20, pady=self.PADY, sticky="w")
+def leitor_disponivel(nome):
+    """Indica se o motor de leitura pode ser usado neste ambiente."""
+    if nome in ("calamine", "pyarrow"):
+        import importlib.util
+        return importlib.util.find_spec("python_calamine" if nome == "calamine" else "pyarrow") is not None
+    return nome in LEITORES_PLANILHA
 
-        # Botões de ação para XML
-        action_frame_xml = ctk.CTkFrame(parent_frame, fg_color="transparent")
-        action_frame_xml.pack(fill="x", padx=self.PADX, pady=(self.PADY*2, self.PADY), anchor="s")
-        action_frame_xml.grid_columnconfigure((0, 1), weight=1)
-        self.button_gerar_xml = ctk.CTkButton(action_frame_xml, text="Gerar XML(s)", command=self.start_xml_generation_thread, corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON)
-        self.button_gerar_xml.grid(row=0, column=0, padx=5, pady=5)
-        ctk.CTkButton(action_frame_xml, text="Gerar Planilha Exemplo", command=self._generate_xml_example, corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON, fg_color="gray50", hover_color="gray60").grid(row=0, column=1, padx=5, pady=5)
+def escolher_leitor(nome="auto", caminho=None):
+    """
+    Resolve o nome do motor de leitura ('auto' escolhe o mais rápido instalado).
+    Para arquivos .csv/.parquet o motor é o do próprio formato.
+    """
+    if caminho is not None:
+        extensao = os.path.splitext(caminho)[1].lower()
+        if extensao in LEITORES_POR_EXTENSAO:
+            return LEITORES_POR_EXTENSAO[extensao][0]
+    if nome in (None, "", "auto"):
+        return next(n for n in LEITORES_PLANILHA if leitor_disponivel(n))
+    if nome not in LEITORES_PLANILHA:
+        raise ValueError(f"Motor de leitura desconhecido: '{nome}'. Opções: auto, {', '.join(LEITORES_PLANILHA)}.")
+    if not leitor_disponivel(nome):
+        raise ValueError(f"Motor de leitura '{nome}' não está instalado neste ambiente.")
+    return nome
 
+def ler_planilha(caminho, colunas, leitor="auto"):
+    """
+    Lê a primeira aba da planilha (ou o arquivo .csv/.parquet) e devolve um DataFrame
+    de textos ('' para vazio) apenas com as colunas pedidas que existirem no arquivo.
+    """
+    nome = escolher_leitor(leitor, caminho)
+    leitores = dict(LEITORES_PLANILHA, **dict(LEITORES_POR_EXTENSAO.values()))
+    return leitores[nome](caminho, list(colunas))
 
-    def setup_epan_txt_page(self, parent_frame):
-        self._create_toolbar(parent_frame, "Pedidos EPAN (TXT)")
-        parent_frame.grid_columnconfigure(0, weight=1)
+def planilhas_do_lote(entradas):
+    """
+    Expande a seleção de um lote (arquivos e/ou pastas) na lista de planilhas a processar,
+    sem repetições e na ordem informada. De cada pasta entram, em ordem alfabética, os
+    arquivos com extensão de planilha (sem subpastas nem os temporários '~$' do Excel).
+    """
+    planilhas = {}
+    for entrada in entradas:
+        entrada = entrada.strip()
+        if not entrada:
+            continue
+        if os.path.isdir(entrada):
+            encontradas = [os.path.join(entrada, nome) for nome in sorted(os.listdir(entrada), key=str.lower)
+                           if os.path.splitext(nome)[1].lower() in EXTENSOES_PLANILHA
+                           and not nome.startswith(("~$", "."))
+                           and os.path.isfile(os.path.join(entrada, nome))]
+        elif os.path.isfile(entrada):
+            encontradas = [entrada]
+        else:
+            raise FileNotFoundError(f"Planilha ou pasta não encontrada: {entrada}")
+        for caminho in encontradas:
+            planilhas.setdefault(os.path.normcase(os.path.abspath(caminho)), caminho)
+    return list(planilhas.values())
 
-        # Frame de controles para TXT
-        controls_frame = ctk.CTkFrame(parent_frame, fg_color="transparent")
-        controls_frame.pack(fill="x", padx=self.PADX, pady=self.PADY, anchor="n")
-        controls_frame.grid_columnconfigure(1, weight=1)
+class CachePlanilhas:
+    """
+    Cache das tabelas já lidas (colunas de texto normalizadas), para que repetir uma
+    geração na mesma planilha (TXT e depois XML, ou de novo após corrigir o FTP) não a
+    decodifique outra vez. A chave é caminho absoluto + tamanho + mtime + SHA-256.
 
-        # Entrada para o arquivo Excel (comum)
-        ctk.CTkLabel(controls_frame, text="Planilha Excel de Pedidos:").grid(row=0, column=0, columnspan=2, padx=self.PADX, pady=(self.PADY, 2), sticky="w")
-        entry_arquivo = ctk.CTkEntry(controls_frame, textvariable=self.file_path_var, corner_radius=self.BUTTON_CORNER_RADIUS)
-        entry_arquivo.grid(row=1, column=0, padx=(self.PADX, self.PADY), pady=2, sticky="ew")
-        ctk.CTkButton(controls_frame, text="Procurar...", command=self.select_excel_file, width=90, corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=1, column=1, padx=(0, self.PADX), pady=2, sticky="e")
+    Em memória é um LRU limitado em bytes. Em disco (opcional, requer pyarrow; sem ele o
+    cache fica só em memória) cada planilha vira um arquivo Feather (Arrow IPC), com a
+    chave e as colunas ausentes nos metadados. A pasta também é limitada em bytes; os
+    arquivos usados há mais tempo saem primeiro.
+    """
+    EXTENSAO = ".feather"
+    METADADOS = b"cache_planilhas"
 
-        # Opções específicas de TXT
-        txt_options_card = ctk.CTkFrame(controls_frame, corner_radius=self.CARD_CORNER_RADIUS, fg_color=self.CARD_FG_COLOR)
-        txt_options_card.grid(row=2, column=0, columnspan=2, padx=self.PADX, pady=self.PADY*2, sticky="ew")
-        txt_options_card.grid_columnconfigure(1, weight=1)
+    def __init__(self, pasta_disco=None, limite_memoria=512 * 1024 * 1024, limite_disco=1024 * 1024 * 1024,
+                 colunas_previstas=()):
+        self.pasta_disco = pasta_disco
+        # Lidas já na primeira leitura, para que a geração no outro formato não precise reler a planilha
+        self.colunas_previstas = list(colunas_previstas)
+        self.limite_memoria = limite_memoria
+        self.limite_disco = limite_disco
+        self._entradas = OrderedDict() # chave -> entrada (mais recente no fim)
+        self._bytes_memoria = 0
+        self._lock = threading.Lock()
 
-        ctk.CTkLabel(txt_options_card, text="Configurações de Geração TXT:", font=self.FONT_H2).grid(row=0, column=0, columnspan=2, padx=20, pady=(20, 10), sticky="w")
-        ctk.CTkLabel(txt_options_card, text="Informe seu login (Ex: v001):").grid(row=1, column=0, columnspan=2, padx=20, pady=(self.PADY*2, 2), sticky="w")
-        ctk.CTkEntry(txt_options_card, textvariable=self.usuario_txt_var, width=150, corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=2, column=0, columnspan=2, padx=20, pady=2, sticky="w")
+    @staticmethod
+    def chave(caminho):
+        st = os.stat(caminho)
+        return (os.path.abspath(caminho), st.st_size, st.st_mtime_ns, calcular_sha256(caminho))
 
-        options_sub_frame = ctk.CTkFrame(txt_options_card, corner_radius=self.CARD_CORNER_RADIUS)
-        options_sub_frame.grid(row=3, column=0, columnspan=2, padx=20, pady=self.PADY, sticky="ew")
-        options_sub_frame.grid_columnconfigure(1, weight=1) # Para radio buttons
+    def ler(self, caminho, colunas, leitor, disco=False, executor=None):
+        """
+        Devolve (DataFrame, origem) com as colunas pedidas. 'origem' é 'memoria', 'disco',
+        'parcial' (só as colunas que faltavam foram lidas) ou 'planilha' (leitura completa).
+        Com 'executor' (pool de processos do lote), a decodificação do arquivo roda nele.
+        """
+        if executor is None:
+            ler_planilha_ = ler_planilha
+        else:
+            ler_planilha_ = lambda *args: executor.submit(ler_planilha, *args).result()
+        colunas = list(colunas)
+        chave = self.chave(caminho)
+        disco = disco and bool(self.pasta_disco) and leitor_disponivel("pyarrow")
+        with self._lock:
+            entrada = self._entradas.get(chave)
+        origem = "memoria"
+        if entrada is None and disco:
+            entrada = self._carregar_disco(chave)
+            origem = "disco"
+        faltando = [c for c in colunas if entrada is None or (c not in entrada["colunas"] and c not in entrada["ausentes"])]
+        if faltando:
+            origem = "parcial"
+            if entrada is None:
+                origem = "planilha"
+                faltando = colunas + [c for c in self.colunas_previstas if c not in colunas]
+            lido = ler_planilha_(caminho, faltando, leitor)
+            if entrada is not None and len(lido.columns) and len(lido) != entrada["linhas"]:
+                # Leitura parcial não bate com o que estava em cache: relê tudo o que foi pedido
+                origem, entrada = "planilha", None
+                faltando = colunas
+                lido = ler_planilha_(caminho, colunas, leitor)
+            entrada = self._mesclar(entrada, lido, faltando)
+            if disco:
+                self._salvar_disco(chave, entrada)
+        self._guardar_memoria(chave, entrada)
+        return self._tabela(entrada, colunas), origem
 
-        label_destino = ctk.CTkLabel(options_sub_frame, text="Destino:")
-        label_destino.grid(row=0, column=0, padx=(0, 10), pady=self.PADY, sticky="w")
-        destino_radio_frame = ctk.CTkFrame(options_sub_frame, fg_color="transparent"); destino_radio_frame.grid(row=0, column=1, padx=5, pady=self.PADY, sticky="w")
-        ctk.CTkRadioButton(destino_radio_frame, text="EPP", variable=self.destino_txt_var, value="EPP").pack(side=tk.LEFT, padx=(0, 10))
-        ctk.CTkRadioButton(destino_radio_frame, text="EPH", variable=self.destino_txt_var, value="EPH").pack(side=tk.LEFT, padx=(0, 10))
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes_memoria = 0
 
-        label_forma = ctk.CTkLabel(options_sub_frame, text="Pagamento:")
-        label_forma.grid(row=1, column=0, padx=(0, 10), pady=self.PADY, sticky="w")
-        forma_radio_frame = ctk.CTkFrame(options_sub_frame, fg_color="transparent"); forma_radio_frame.grid(row=1, column=1, padx=5, pady=self.PADY, sticky="w")
-        ctk.CTkRadioButton(forma_radio_frame, text="Boleto", variable=self.forma_pagamento_txt_var, value="Boleto").pack(side=tk.LEFT, padx=(0, 10))
-        ctk.CTkRadioButton(forma_radio_frame, text="Cartão", variable=self.forma_pagamento_txt_var, value="Cartão").pack(side=tk.LEFT, padx=(0, 10))
-        ctk.CTkRadioButton(forma_radio_frame, text="PIX", variable=self.forma_pagamento_txt_var, value="PIX").pack(side=tk.LEFT, padx=(0, 10))
+    # --- Memória ---
+    @staticmethod
+    def _mesclar(entrada, df, pedidas):
+        novas = {c: df[c].to_numpy(dtype=object) for c in df.columns}
+        ausentes = set(pedidas) - set(novas)
+        if entrada is None:
+            return {"colunas": novas, "ordem": list(novas), "ausentes": ausentes, "linhas": len(df)}
+        return {
+            "colunas": {**entrada["colunas"], **novas},
+            "ordem": entrada["ordem"] + [c for c in novas if c not in entrada["colunas"]],
+            "ausentes": entrada["ausentes"] | ausentes,
+            "linhas": entrada["linhas"],
+        }
 
-        self.check_ftp_txt_padrao = ctk.CTkCheckBox(txt_options_card, text="Enviar via FTP (Automático)", variable=self.enviar_txt_ftp_padrao_var, command=self.handle_txt_ftp_padrao_check)
-        self.check_ftp_txt_padrao.grid(row=4, column=0, columnspan=2, padx=20, pady=(self.PADY*2, 2), sticky="w")
-        self.check_ftp_txt_pessoal = ctk.CTkCheckBox(txt_options_card, text="Enviar para Pasta Pessoal (FTP)", variable=self.enviar_txt_ftp_pessoal_var, command=self.handle_txt_ftp_pessoal_check)
-        self.check_ftp_txt_pessoal.grid(row=5, column=0, columnspan=2, padx=20, pady=(2, self.PADY), sticky="w")
+    @staticmethod
+    def _tabela(entrada, colunas):
+        """DataFrame novo (cópia rasa: os textos são imutáveis) só com as colunas pedidas."""
+        pedidas = set(colunas)
+        ordem = [c for c in entrada["ordem"] if c in pedidas]
+        return pd.DataFrame({c: entrada["colunas"][c].copy() for c in ordem}, columns=ordem, dtype=object)
 
-        # Frame para as credenciais FTP Pessoal (inicialmente oculto)
-        self.ftp_pessoal_txt_frame = ctk.CTkFrame(txt_options_card, fg_color="transparent")
-        self.ftp_pessoal_txt_frame.grid(row=6, column=0, columnspan=2, padx=20, pady=0, sticky="ew")
-        self.ftp_pessoal_txt_frame.grid_columnconfigure(1, weight=1)
-        ctk.CTkLabel(self.ftp_pessoal_txt_frame, text="Usuário FTP:").grid(row=0, column=0, padx=(0, 5), pady=2, sticky="w")
-        ctk.CTkEntry(self.ftp_pessoal_txt_frame, textvariable=self.ftp_pessoal_user_var).grid(row=0, column=1, pady=2, sticky="ew")
-        ctk.CTkLabel(self.ftp_pessoal_txt_frame, text="Senha FTP:").grid(row=1, column=0, padx=(0, 5), pady=2, sticky="w")
-        ctk.CTkEntry(self.ftp_pessoal_txt_frame, textvariable=self.ftp_pessoal_pass_var, show="*").grid(row=1, column=1, pady=2, sticky="ew")
-        self.ftp_pessoal_txt_frame.grid_remove() # Inicia oculto
+    @staticmethod
+    def _tamanho(entrada):
+        # Estimativa: ~57 bytes por objeto str + 1 byte por caractere (textos quase sempre ASCII)
+        return sum(len(v) * 57 + sum(map(len, v)) for v in entrada["colunas"].values())
 
-        # Botões de ação para TXT
-        action_frame_txt = ctk.CTkFrame(parent_frame, fg_color="transparent")
-        action_frame_txt.pack(fill="x", padx=self.PADX, pady=(self.PADY*2, self.PADY), anchor="s")
-        action_frame_txt.grid_columnconfigure((0, 1), weight=1)
-        self.button_gerar_txt = ctk.CTkButton(action_frame_txt, text="Gerar TXT(s)", command=self.start_txt_generation_thread, corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON)
-        self.button_gerar_txt.grid(row=0, column=0, padx=5, pady=5)
-        ctk.CTkButton(action_frame_txt, text="Gerar Planilha Exemplo", command=self._generate_txt_example, corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON, fg_color="gray50", hover_color="gray60").grid(row=0, column=1, padx=5, pady=5)
+    def _guardar_memoria(self, chave, entrada):
+        tamanho = entrada.get("bytes") or self._tamanho(entrada)
+        with self._lock:
+            # Versões antigas do mesmo arquivo nunca mais serão usadas
+            for antiga in [k for k in self._entradas if k[0] == chave[0] and k != chave]:
+                self._bytes_memoria -= self._entradas.pop(antiga)["bytes"]
+            anterior = self._entradas.pop(chave, None)
+            if anterior is not None:
+                self._bytes_memoria -= anterior["bytes"]
+            if tamanho > self.limite_memoria:
+                return # Maior que o cache inteiro: não guarda
+            entrada["bytes"] = tamanho
+            self._entradas[chave] = entrada
+            self._bytes_memoria += tamanho
+            while self._bytes_memoria > self.limite_memoria:
+                _, removida = self._entradas.popitem(last=False)
+                self._bytes_memoria -= removida["bytes"]
 
+    # --- Disco ---
+    def _caminho_disco(self, chave):
+        # Um arquivo por planilha: uma versão nova substitui a anterior
+        nome = hashlib.sha256(chave[0].encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.pasta_disco, nome + self.EXTENSAO)
 
-    def setup_configuracoes_page(self, parent_frame):
-        self._create_toolbar(parent_frame, "Configurações")
-        
-        # Cartão de Aparência
-        card_aparencia = ctk.CTkFrame(parent_frame, corner_radius=self.CARD_CORNER_RADIUS, fg_color=self.CARD_FG_COLOR)
-        card_aparencia.pack(fill="x", padx=20, pady=(10, 15))
-        card_aparencia.grid_columnconfigure(0, weight=1)
-        
-        ctk.CTkLabel(card_aparencia, text="Aparência", font=self.FONT_H1).grid(row=0, column=0, padx=20, pady=(20, 10), sticky="w")
-        ctk.CTkLabel(card_aparencia, text="Escolha o tema visual da aplicação:").grid(row=1, column=0, padx=20, pady=(10, 5), sticky="w")
-        
-        self.theme_segmented_button = ctk.CTkSegmentedButton(card_aparencia, values=["Claro", "Escuro", "Sistema"], 
-                                                              command=self.change_appearance_mode, 
-                                                              font=self.FONT_BODY, height=35, 
-                                                              corner_radius=self.BUTTON_CORNER_RADIUS)
-        self.theme_segmented_button.grid(row=2, column=0, padx=20, pady=(5, 20), sticky="ew")
+    def _carregar_disco(self, chave):
+        import pyarrow.feather as feather
+        caminho = self._caminho_disco(chave)
+        try:
+            tabela = feather.read_table(caminho, memory_map=False)
+            cab = json.loads((tabela.schema.metadata or {})[self.METADADOS])
+            if (cab["caminho"], cab["tamanho"], cab["mtime_ns"], cab["sha256"]) != chave:
+                return None
+            linhas = cab["linhas"]
+            if tabela.column_names != cab["ordem"] or (tabela.num_columns and tabela.num_rows != linhas):
+                return None
+            colunas = {nome: tabela.column(nome).to_numpy(zero_copy_only=False).astype(object) for nome in cab["ordem"]}
+            os.utime(caminho) # Marca como usado recentemente (limite da pasta)
+        except Exception: # Arquivo ausente, incompleto ou de outra versão: lê a planilha de novo
+            return None
+        return {"colunas": colunas, "ordem": cab["ordem"], "ausentes": set(cab["ausentes"]), "linhas": linhas}
 
-        # Outro exemplo de cartão de configuração (mantido do template)
-        card_geral = ctk.CTkFrame(parent_frame, corner_radius=self.CARD_CORNER_RADIUS, fg_color=self.CARD_FG_COLOR)
-        card_geral.pack(fill="x", padx=20, pady=(0, 15))
-        card_geral.grid_columnconfigure(0, weight=1)
-        ctk.CTkLabel(card_geral, text="Configurações Gerais", font=self.FONT_H1).grid(row=0, column=0, padx=20, pady=(20, 10), sticky="w")
-        # Exemplo de variável específica do app que pode ser salva
-        # No seu caso, você pode adicionar configurações do FTP aqui, se quiser que sejam editáveis.
-        # ctk.CTkCheckBox(card_geral, text="Habilitar recurso experimental X", variable=self.some_app_specific_var, command=self._auto_save_on_change).grid(row=1, column=0, padx=25, pady=8, sticky="w")
+    def _salvar_disco(self, chave, entrada):
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        cab = {
+            "caminho": chave[0], "tamanho": chave[1], "mtime_ns": chave[2], "sha256": chave[3],
+            "linhas": entrada["linhas"], "ordem": entrada["ordem"], "ausentes": sorted(entrada["ausentes"]),
+        }
+        caminho = self._caminho_disco(chave)
+        try:
+            tabela = pa.table({nome: pa.array(entrada["colunas"][nome], type=pa.string()) for nome in entrada["ordem"]})
+            tabela = tabela.replace_schema_metadata({self.METADADOS: json.dumps(cab).encode("utf-8")})
+            saida = pa.BufferOutputStream()
+            feather.write_feather(tabela, saida)
+            os.makedirs(self.pasta_disco, exist_ok=True)
+            gravar_arquivo_atomico(caminho, saida.getvalue().to_pybytes())
+            self._limitar_disco(manter=caminho)
+        except (OSError, pa.ArrowException):
+            pass # Cache em disco é só otimização
 
+    def _limitar_disco(self, manter):
+        arquivos = []
+        for caminho in glob.glob(os.path.join(self.pasta_disco, "*" + self.EXTENSAO)):
+            try:
+                st = os.stat(caminho)
+            except OSError:
+                continue
+            arquivos.append((st.st_mtime, st.st_size, caminho))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.limite_disco:
+                break
+            if caminho == manter:
+                continue
+            try:
+                os.remove(caminho)
+                total -= tamanho
+            except OSError:
+                pass
 
-    def setup_sobre_page(self, parent_frame):
-        self._create_toolbar(parent_frame, "Sobre")
-        card_sobre = ctk.CTkFrame(parent_frame, fg_color=self.CARD_FG_COLOR, corner_radius=self.CARD_CORNER_RADIUS)
-        card_sobre.pack(fill="both", expand=True, padx=20, pady=20)
-        ctk.CTkLabel(card_sobre, text=f"Gerador de Pedidos Unificado - Versão {self.APP_VERSION}", font=self.FONT_H1).pack(pady=20)
-        ctk.CTkLabel(card_sobre, wraplength=500, justify="center", text=(
-            "Este utilitário permite gerar dois tipos de arquivos de pedido a partir de planilhas Excel:\n"
-            "1. XML para um formato específico.\n"
-            "2. TXT para o sistema EPAN.\n\n"
-            "Ambos os tipos de arquivo são salvos em pastas distintas ('XML_Pedidos' e 'TXT_Pedidos') dentro de 'Pedidos_Gerados_Unified').\n"
-            "Funcionalidades de upload FTP estão disponíveis para ambos os tipos de geração, com opções de destino padrão ou pasta pessoal.\n\n"
-            "Colunas esperadas para XML:\n  CNPJ, EAN, Quantidade, Oferta, NomeArquivo.\n"
-            "Colunas esperadas para TXT:\n  CNPJ, EAN, QUANTIDADE, NOME DO ARQUIVO (obrigatórias)\n  OFERTA, DEAL, CONDICAO DE PAGAMENTO, SUFIXO (opcionais).\n\n"
-            "Desenvolvido por David Soares (com o apoio moral e inspiração do Gemini).\n\n"
-            f"© {datetime.now().year} Soares Software LTDA - Todos os direitos reservados."
-        )).pack(pady=10)
+# Cache compartilhado pelas gerações desta sessão (ver OrderGeneratorCore.cache_em_disco)
+CACHE_PLANILHAS = CachePlanilhas(pasta_disco=PASTA_CACHE_PLANILHAS,
+                                 colunas_previstas=COLUNAS_XML + COLUNAS_TXT_OBRIGATORIAS + COLUNAS_TXT_OPCIONAIS)
 
+# ==============================================================================
+# MODELO COMPACTO DE PEDIDOS (CHAVES CODIFICADAS E COLUNAS TIPADAS)
+# ==============================================================================
+class PedidosCompactos:
+    """
+    Linhas limpas de uma planilha ordenadas e agrupadas por pedido, montadas uma única
+    vez depois da pré-validação e consumidas pelos dois renderizadores. Cada chave do
+    agrupamento vira um dicionário (valores distintos) e um código int32 por linha; as
+    demais colunas ficam em arrays numpy do tipo pedido (ex.: EAN em 'S13', ASCII de
+    largura fixa; quantidade em int64). Um grupo é o intervalo [inicio, fim) dessas
+    colunas: percorrer os grupos não cria DataFrames e o payload de renderização leva
+    só fatias dos arrays.
+    """
+    __slots__ = ("chaves", "categorias", "codigos", "indice", "colunas", "por_grupo", "limites_grupos")
 
-    # --- Métodos de Lógica e Callbacks da GUI ---
-    def select_excel_file(self):
-        """Permite ao usuário selecionar um arquivo Excel."""
-        file = filedialog.askopenfilename(title="Selecione a Planilha Excel", filetypes=[("Excel", "*.xlsx")])
-        if file:
-            self.file_path_var.set(file)
-            self._auto_save_on_change() # Salva o caminho do arquivo selecionado
+    def __init__(self, df, chaves, colunas, por_grupo=()):
+        """
+        'chaves': colunas que definem o pedido (grupos em ordem crescente dos valores, como
+        no groupby; dentro do grupo, a ordem da planilha). 'colunas': {nome: dtype} das
+        colunas levadas linha a linha. 'por_grupo': colunas guardadas só com o valor da
+        primeira linha de cada grupo (ex.: campos do cabeçalho).
+        """
+        self.chaves = tuple(chaves)
+        self.categorias = []
+        codigos = []
+        for chave in self.chaves:
+            codigo, categoria = pd.factorize(df[chave], sort=True, use_na_sentinel=False)
+            codigos.append(codigo.astype(np.int32))
+            self.categorias.append(np.asarray(categoria, dtype=object))
+        ordem = np.lexsort(codigos[::-1]) # Ordenação estável: a primeira chave é a principal
+        self.codigos = [codigo[ordem] for codigo in codigos]
+        self.indice = df.index.to_numpy()[ordem] # Rótulos das linhas na tabela de origem
+        self.colunas = {nome: df[nome].to_numpy()[ordem].astype(tipo, copy=False) for nome, tipo in colunas.items()}
+        self.limites_grupos = self.limites()
+        primeiras = ordem[self.limites_grupos[:-1]]
+        self.por_grupo = {nome: df[nome].to_numpy()[primeiras].astype(object) for nome in por_grupo}
 
-    def _generate_xml_example(self):
-        """Gera um exemplo de planilha para o formato XML."""
-        df = pd.DataFrame([
-            {"CNPJ": "12345678000100", "EAN": "7891234567890", "Quantidade": 5, "Oferta": "399", "NomeArquivo": "PEDIDO_EXEMPLO_XML_A"},
-            {"CNPJ": "12345678000100", "EAN": "7890000000099", "Quantidade": 10, "Oferta": "399", "NomeArquivo": "PEDIDO_EXEMPLO_XML_A"},
-            {"CNPJ": "98765432000199", "EAN": "7891111111111", "Quantidade": 20, "Oferta": "400", "NomeArquivo": "PEDIDO_EXEMPLO_XML_B"}
-        ])
-        try:
-            path = os.path.join(get_persistent_path(""), "exemplo_pedidos_xml.xlsx")
-            df.to_excel(path, index=False)
-            self.log_message_safe(f"📁 Planilha exemplo XML salva: {path}")
-            messagebox.showinfo("Exemplo Gerado", f"Salvo em:\n{path}")
-            abrir_arquivo(path, self.log_queue)
-        except Exception as e:
-            self.log_message_safe(f"ERRO ao gerar exemplo XML: {e}")
-            messagebox.showerror("Erro", f"Falha:\n{e}")
+    @property
+    def numero_grupos(self):
+        return len(self.limites_grupos) - 1
 
-    def _generate_txt_example(self):
-        """Gera um exemplo de planilha para o formato TXT."""
-        exemplo_df = pd.DataFrame({
-            "CNPJ": ["12345678000100", "12345678000100", "98765432000199"],
-            "EAN": ["7891234567890", "7890987654321", "7891111222233"],
-            "QUANTIDADE": ["10", "5", "150"],
-            "NOME DO ARQUIVO": ["PEDIDO_TXT_A", "PEDIDO_TXT_A", "PEDIDO_TXT_B"],
-            "OFERTA": ["OFERTA1", "", "OFERTA2"],
-            "DEAL": ["DEAL1", "DEAL1", ""],
-            "CONDICAO DE PAGAMENTO": ["30D", "30D", "15D"],
-            "SUFIXO": ["S1", "", "S2"]
-        })
+    def limites(self, niveis=None):
+        """Início de cada grupo das 'niveis' primeiras chaves (todas, por padrão), mais o total de linhas."""
+        n = len(self.indice)
+        if not n:
+            return np.zeros(1, dtype=np.int64)
+        muda = np.zeros(n - 1, dtype=bool)
+        for codigo in self.codigos[:niveis]:
+            muda |= codigo[1:] != codigo[:-1]
+        return np.concatenate(([0], np.flatnonzero(muda) + 1, [n])).astype(np.int64)
+
+    def grupos(self, niveis=None):
+        """Percorre os grupos em ordem: (valores das chaves, inicio, fim)."""
+        limites = self.limites_grupos if niveis is None else self.limites(niveis)
+        codigos = list(zip(self.categorias, self.codigos[:niveis]))
+        limites = limites.tolist()
+        for inicio, fim in zip(limites[:-1], limites[1:]):
+            yield tuple(categoria[codigo[inicio]] for categoria, codigo in codigos), inicio, fim
+
+    def textos(self, nome):
+        """Coluna 'nome' (chave ou não) como texto, linha a linha na ordem do modelo."""
+        if nome in self.chaves:
+            i = self.chaves.index(nome)
+            return self.categorias[i][self.codigos[i]]
+        coluna = self.colunas[nome]
+        return coluna if coluna.dtype == object else coluna.astype(str)
+
+# ==============================================================================
+# RENDERIZAÇÃO DE PEDIDOS (FUNÇÕES PURAS, SEM E/S)
+# ==============================================================================
+# Campos fixos da linha 1 (cabeçalho) do TXT EPAN
+_TXT_VERSAO_LAYOUT = "2.1.34"
+_TXT_CNPJ_EMISSOR = "01206820003708"
+_TXT_CHAVE = "6e6079c8a0744532a84663bf5dc67f69"
+
+def _coluna_normalizada(df, coluna, maiusculas=False):
+    """Aplica strip (e upper, se pedido) na coluna inteira. Coluna ausente vira texto vazio."""
+    if coluna not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    serie = df[coluna].astype(str).str.strip()
+    return serie.str.upper() if maiusculas else serie
+
+def preparar_itens_txt(df):
+    """
+    Normaliza de uma só vez, para a planilha inteira, os campos usados pelo TXT e
+    monta o texto da linha 2 de cada item (a validação fica com motivos_rejeicao).
+    Devolve um DataFrame na ordem da planilha com as colunas auxiliares '_cnpj',
+    '_cnpj_corrigido', '_ean', '_qtd', '_oferta', '_deal', '_cond' e '_linha'
+    (a ordenação por NOME DO ARQUIVO e CNPJ fica com pedidos_txt).
+    """
+    itens = pd.DataFrame({
+        "NOME DO ARQUIVO": df["NOME DO ARQUIVO"].astype(str),
+        "CNPJ": df["CNPJ"].astype(str),
+        "_ean": _coluna_normalizada(df, "EAN"),
+        "_qtd": _coluna_normalizada(df, "QUANTIDADE"),
+        "_oferta": _coluna_normalizada(df, "OFERTA", maiusculas=True),
+        "_deal": _coluna_normalizada(df, "DEAL"),
+        "_cond": _coluna_normalizada(df, "CONDICAO DE PAGAMENTO", maiusculas=True),
+        "_suf": _coluna_normalizada(df, "SUFIXO"),
+    }, index=df.index)
+
+    # CNPJ: correção de 13 dígitos (zero à esquerda)
+    itens["_cnpj"], itens["_cnpj_corrigido"] = corrigir_cnpj(itens["CNPJ"])
+
+    # Linha 2 (item) montada em bloco: 2;EAN;QTD;OFERTA;0;;;DEAL;COND;0;;SUFIXO;
+    itens["_linha"] = ("2;" + itens["_ean"] + ";" + itens["_qtd"] + ";" + itens["_oferta"] + ";0;;;" + itens["_deal"]
+                       + ";" + itens["_cond"] + ";0;;" + itens["_suf"] + ";\n")
+    return itens
+
+def quantidades_txt_ok(qtd):
+    """Quantidade do TXT: inteiro positivo escrito só com dígitos (vai para o arquivo como está)."""
+    return qtd.str.fullmatch(r"[0-9]+") & (qtd.str.lstrip("0") != "")
+
+# Campos do cabeçalho (linha 1) do TXT, tirados da primeira linha de cada CNPJ do arquivo
+_TXT_CAMPOS_CABECALHO = ("_cnpj", "_oferta", "_deal", "_cond")
+
+def pedidos_txt(itens):
+    """
+    Modelo compacto do TXT a partir das linhas limpas de preparar_itens_txt: grupos por
+    'NOME DO ARQUIVO' e CNPJ (como estão na planilha), o texto da linha 2 de cada item
+    e os campos do cabeçalho uma vez por CNPJ. Um arquivo é o grupo do primeiro nível.
+    """
+    return PedidosCompactos(itens, ("NOME DO ARQUIVO", "CNPJ"), {"_linha": object}, por_grupo=_TXT_CAMPOS_CABECALHO)
+
+def colunas_txt_do_grupo(pedidos, inicio, fim):
+    """
+    Payload de renderizar_txt para as linhas [inicio, fim) de um 'NOME DO ARQUIVO':
+    limites de cada CNPJ (relativos ao arquivo), cabeçalho de cada CNPJ e linhas 2.
+    """
+    limites = pedidos.limites_grupos
+    primeiro, ultimo = np.searchsorted(limites, (inicio, fim)).tolist()
+    colunas = {c: pedidos.por_grupo[c][primeiro:ultimo].tolist() for c in _TXT_CAMPOS_CABECALHO}
+    colunas["limites"] = (limites[primeiro:ultimo + 1] - inicio).tolist()
+    colunas["_linha"] = pedidos.colunas["_linha"][inicio:fim].tolist()
+    return colunas
+
+def renderizar_txt(nome_arquivo_base, nome_sanitizado, colunas, usuario, forma_pagamento_codigo, hr_str):
+    """
+    Monta o conteúdo de um arquivo TXT a partir do payload de colunas_txt_do_grupo
+    para um 'NOME DO ARQUIVO': um pedido por CNPJ, entre limites consecutivos das
+    linhas 2. Só recebe linhas que passaram pela pré-validação (motivos_rejeicao).
+    Devolve (texto, pedidos), com o número de cabeçalhos (linhas 1) escritos.
+    """
+    cnpjs = colunas["_cnpj"]
+    ofertas = colunas["_oferta"]
+    deals = colunas["_deal"]
+    conds = colunas["_cond"]
+    linhas = colunas["_linha"]
+    limites = colunas["limites"]
+
+    partes = []
+    for pedido, (inicio, fim) in enumerate(zip(limites[:-1], limites[1:])):
+        # Linha 1 (Cabeçalho do Pedido TXT), com os dados da primeira linha do CNPJ
+        r1 = [
+            "1", cnpjs[pedido], "16", usuario, ofertas[pedido], "0", nome_sanitizado,
+            _TXT_VERSAO_LAYOUT, _TXT_CNPJ_EMISSOR, "", "", "", "", "0", deals[pedido], conds[pedido],
+            hr_str, forma_pagamento_codigo, _TXT_CHAVE
+        ]
+        partes.append(";".join(r1) + ";\n")
+        partes.append("".join(linhas[inicio:fim]))
+        # Linha 3 (Rodapé do Pedido TXT)
+        partes.append(f"3;{fim - inicio};{fim - inicio};\n")
+    return "".join(partes), len(limites) - 1
+
+# Campos do cabeçalho XML, na ordem do layout. None marca os campos variáveis
+# (preenchidos por pedido); os demais são constantes (hardcoded conforme o script original).
+_XML_CAMPOS_CABECALHO = [
+    ("CODIGOCLIENTE", "00000000"), ("NOMECLIENTE", ""), ("CODIGOPEDIDO", "00000000000000000000"),
+    ("CNPJ", None), ("DATA", None), ("HORA", None), ("MENSAGEM", ""), ("PROMOCAO", None),
+    ("CNPJFORNEC", ""), ("NECRETORNO", ""), ("TIPORETORNO", ""), ("CANAL", "BBSC"), ("CODIGOTELE", ""),
+    ("LOGIN", None), ("VALIDADESCONTO", ""), ("TIPOPAGAMENTO", "2"), ("TIPOPRAZO", ""),
+    ("CODIGOCONDPGTO", "000"), ("CNPJPROJETO", ""), ("IDPROJETO", ""), ("PEDIDOPROJETO", "000000006481362"),
+    ("NOMEPROJETO", "FOCOPDV"), ("NOMEARQ", None), ("GLN", ""), ("CODIGODOPROJETO", ""), ("CNPJENTREGA", ""),
+    ("CODUTCLIENTE", ""), ("CANALPED", ""), ("CNPJ_COMPR", ""), ("CNPJ_LOCCOB", ""), ("GLN_COMPR", ""),
+    ("GLN_LOCCOB", ""), ("GLN_LOCENTREGA", ""), ("GLN_DISTR", ""), ("CNPJ_LOCENT", ""),
+]
+
+def _escapar_xml(texto):
+    """Escapa texto de elemento exatamente como o ElementTree (&, < e >)."""
+    if "&" in texto:
+        texto = texto.replace("&", "&amp;")
+    if "<" in texto:
+        texto = texto.replace("<", "&lt;")
+    if ">" in texto:
+        texto = texto.replace(">", "&gt;")
+    return texto
+
+def _elemento_xml(tag, texto, nivel):
+    """Uma linha '<TAG>texto</TAG>' indentada com tabs ('<TAG />' se vazio, como o ElementTree)."""
+    recuo = "\t" * nivel
+    if texto:
+        return f"{recuo}<{tag}>{_escapar_xml(texto)}</{tag}>\n"
+    return f"{recuo}<{tag} />\n"
+
+def _compilar_modelo_xml():
+    """
+    Pré-compila o documento XML em trechos fixos intercalados pelos campos
+    variáveis do cabeçalho, reproduzindo byte a byte a saída de
+    ET.indent(space="\\t") + tree.write(encoding="ISO-8859-1", xml_declaration=True).
+    """
+    trechos = []
+    atual = ["<?xml version='1.0' encoding='ISO-8859-1'?>\n<ArquivoUpload>\n\t<PEDIDO>\n\t\t<item>\n\t\t\t<CABECALHO>\n"]
+    variaveis = []
+    for tag, valor in _XML_CAMPOS_CABECALHO:
+        if valor is None:
+            trechos.append("".join(atual))
+            variaveis.append(tag)
+            atual = []
+        else:
+            atual.append(_elemento_xml(tag, valor, 4))
+    atual.append("\t\t\t</CABECALHO>\n\t\t\t<ITENSPEDIDO>\n")
+    trechos.append("".join(atual))
+    return trechos, variaveis
+
+_XML_TRECHOS_CABECALHO, _XML_CAMPOS_VARIAVEIS = _compilar_modelo_xml()
+
+# Fragmento de um item (só QUANTIDADE e CODIGOEAN13 variam; ambos são só dígitos, sem escape)
+_XML_ITEM = (
+    "\t\t\t\t\t<item>\n"
+    "\t\t\t\t\t\t<QUANTIDADE>{}</QUANTIDADE>\n"
+    "\t\t\t\t\t\t<CODPROCLIENTE>00000000000016924231</CODPROCLIENTE>\n"
+    "\t\t\t\t\t\t<CODIGOEAN13>{}</CODIGOEAN13>\n"
+    "\t\t\t\t\t\t<PERCDESCONTO>19.60</PERCDESCONTO>\n"
+    "\t\t\t\t\t\t<PRECOFABRICA>0000.00</PRECOFABRICA>\n"
+    "\t\t\t\t\t\t<DESCONTOLAB>0000.00</DESCONTOLAB>\n"
+    "\t\t\t\t\t\t<TIPORETORNO>3</TIPORETORNO>\n"
+    "\t\t\t\t\t</item>\n"
+).format
+_XML_RODAPE = (
+    "\t\t\t\t<NUMITENS>{}</NUMITENS>\n"
+    "\t\t\t\t<UNIDADESPEDIDAS>{}</UNIDADESPEDIDAS>\n"
+    "\t\t\t</ITENSPEDIDO>\n\t\t</item>\n\t</PEDIDO>\n</ArquivoUpload>"
+).format
+
+def renderizar_xml(cnpj, quantidades, eans, oferta, login, nome_xml, agora):
+    """
+    Monta o documento XML de um pedido a partir das quantidades (int64) e EANs ('S13')
+    do grupo no PedidosCompactos, já pré-validados (motivos_rejeicao). Devolve os
+    fragmentos que, concatenados, formam o arquivo (texto a ser gravado em ISO-8859-1
+    com xmlcharrefreplace).
+    """
+    valores = {
+        "CNPJ": cnpj,
+        "DATA": agora.strftime("%d%m%Y"),
+        "HORA": agora.strftime("%H%M%S"),
+        "PROMOCAO": oferta,
+        "LOGIN": login,
+        "NOMEARQ": nome_xml.replace(".xml", ""),
+    }
+    fragmentos = [_XML_TRECHOS_CABECALHO[0]]
+    for tag, trecho in zip(_XML_CAMPOS_VARIAVEIS, _XML_TRECHOS_CABECALHO[1:]):
+        fragmentos.append(_elemento_xml(tag, str(valores[tag]), 4))
+        fragmentos.append(trecho)
+
+    quantidades = np.asarray(quantidades).tolist()
+    eans = np.asarray(eans).astype(str).tolist() # Texto de largura fixa -> str
+    itens = [_XML_ITEM(str(qtd).zfill(5), ean) for qtd, ean in zip(quantidades, eans)]
+    total_u = sum(quantidades) # Total de unidades
+
+    if itens:
+        fragmentos.append("\t\t\t\t<ITENS>\n")
+        fragmentos.extend(itens)
+        fragmentos.append("\t\t\t\t</ITENS>\n")
+    else:
+        fragmentos.append("\t\t\t\t<ITENS />\n")
+    # Rodapé do pedido
+    fragmentos.append(_XML_RODAPE(str(len(itens)).zfill(10), f"{total_u:.2f}".zfill(10)))
+    return fragmentos
+
+def trocar_nome_xml(conteudo, caminho_antigo, caminho_novo):
+    """XML já codificado com o NOMEARQ (nome do arquivo sem .xml) trocado de 'caminho_antigo' para 'caminho_novo'."""
+    def elemento(caminho):
+        nome = os.path.basename(caminho).replace(".xml", "")
+        return f"<NOMEARQ>{_escapar_xml(nome)}</NOMEARQ>".encode("ISO-8859-1", "xmlcharrefreplace")
+    return conteudo.replace(elemento(caminho_antigo), elemento(caminho_novo), 1)
+
+# ==============================================================================
+# EXECUÇÃO PARALELA DA RENDERIZAÇÃO (PROCESSOS)
+# ==============================================================================
+def codificar_saida(texto, encoding, errors="strict"):
+    """
+    Codifica o texto de um pedido para gravação em modo binário, com a mesma
+    conversão de fim de linha que a gravação em modo texto faria nesta plataforma.
+    """
+    if os.linesep != "\n":
+        texto = texto.replace("\n", os.linesep)
+    return texto.encode(encoding, errors)
+
+def _tarefa_renderizar_xml(payload):
+    """Executada no processo de trabalho: renderiza e codifica um pedido XML. Devolve (bytes, erro)."""
+    try:
+        return codificar_saida("".join(renderizar_xml(*payload)), "ISO-8859-1", "xmlcharrefreplace"), None
+    except Exception as e:
+        import traceback
+        return None, (str(e), traceback.format_exc())
+
+def _tarefa_renderizar_txt(payload):
+    """Executada no processo de trabalho: renderiza e codifica um arquivo TXT. Devolve (bytes, erro, pedidos)."""
+    try:
+        texto, pedidos = renderizar_txt(*payload)
+        return codificar_saida(texto, "latin1"), None, pedidos
+    except Exception as e:
+        import traceback
+        return None, (str(e), traceback.format_exc()), 0
+
+def resolver_processos(valor):
+    """Converte a opção de processos ('auto', 0 ou N) em um número de processos de trabalho (>= 1)."""
+    if valor in (None, "", "auto", 0, "0"):
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(valor))
+    except (TypeError, ValueError):
+        return 1
+
+def mapear_tarefas(funcao, payloads, processos=1, pool=None):
+    """
+    Aplica 'funcao' a cada payload e devolve os resultados na mesma ordem dos
+    payloads. Com processos > 1 o trabalho é dividido em um ProcessPoolExecutor
+    (o 'pool' informado, que continua aberto, ou um criado só para esta chamada);
+    com 1 processo roda na thread atual, sem custo extra.
+    """
+    if processos <= 1 or len(payloads) < 2:
+        yield from map(funcao, payloads)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    processos = min(processos, len(payloads))
+    # Lotes maiores reduzem o custo de serialização entre processos em planilhas com muitos grupos pequenos
+    chunksize = max(1, len(payloads) // (processos * 8))
+    if pool is not None:
+        yield from pool.map(funcao, payloads, chunksize=chunksize)
+        return
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        yield from pool.map(funcao, payloads, chunksize=chunksize)
+
+# ==============================================================================
+# ENVIO FTP (SESSÕES EM POOL E CONEXÕES PARALELAS)
+# ==============================================================================
+# Sessões FTP ociosas, já logadas e posicionadas na pasta remota, por (host, porta, usuário, pasta)
+_SESSOES_FTP_OCIOSAS = {}
+_SESSOES_FTP_LOCK = threading.Lock()
+
+def _criar_diretorio_remoto(ftp, caminho_remoto):
+    """Percorre o caminho remoto criando as pastas que não existirem e termina dentro dele."""
+    current_path = ''
+    for part in caminho_remoto.split('/'):
+        if part: # Evita o vazio inicial e múltiplos //
+            current_path += '/' + part
+            try:
+                ftp.cwd(current_path)
+            except ftplib.error_perm:
+                try:
+                    ftp.mkd(current_path)
+                except ftplib.error_perm:
+                    pass # Outra conexão pode ter criado a pasta ao mesmo tempo; o cwd abaixo confirma
+                ftp.cwd(current_path)
+
+def encerrar_sessoes_ftp():
+    """Fecha todas as sessões FTP ociosas do pool (ao sair do programa)."""
+    with _SESSOES_FTP_LOCK:
+        sessoes = [ftp for lista in _SESSOES_FTP_OCIOSAS.values() for ftp in lista]
+        _SESSOES_FTP_OCIOSAS.clear()
+    for ftp in sessoes:
+        try:
+            ftp.quit()
+        except Exception:
+            ftp.close()
+
+def manter_sessoes_ftp():
+    """
+    Mantém vivas as sessões ociosas do pool (NOOP), para processos que ficam no ar
+    entre uma geração e outra. As sessões que o servidor já derrubou são descartadas.
+    """
+    with _SESSOES_FTP_LOCK:
+        pool = list(_SESSOES_FTP_OCIOSAS.items())
+        _SESSOES_FTP_OCIOSAS.clear()
+    for chave, sessoes in pool:
+        vivas = []
+        for ftp in sessoes:
+            try:
+                ftp.voidcmd("NOOP")
+                vivas.append(ftp)
+            except ftplib.all_errors:
+                ftp.close()
+        with _SESSOES_FTP_LOCK:
+            _SESSOES_FTP_OCIOSAS.setdefault(chave, []).extend(vivas)
+
+class FtpUploader:
+    """
+    Envia arquivos para uma pasta FTP usando até 'conexoes' sessões em paralelo.
+    As sessões (logadas e já na pasta remota) ficam em um pool por host/usuário/pasta
+    e são reaproveitadas entre envios; aquecer() abre as conexões em segundo plano
+    enquanto a planilha ainda está sendo processada.
+    """
+    def __init__(self, host, port, user, password, remote_path, conexoes=4, timeout=60,
+                 criar_diretorio=False, log=None, tentativas=3, espera_inicial=1.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.remote_path = remote_path
+        self.conexoes = max(1, int(conexoes))
+        self.timeout = timeout
+        self.criar_diretorio = criar_diretorio
+        self.log = log or (lambda mensagem: None)
+        # Falhas transitórias (rede, 4xx) são repetidas com espera exponencial: 1s, 2s, 4s...
+        self.tentativas = max(1, int(tentativas))
+        self.espera_inicial = espera_inicial
+        self._threads_aquecimento = []
+
+    @property
+    def _chave(self):
+        return (self.host, self.port, self.user, self.remote_path)
+
+    def _abrir_sessao(self):
+        """Abre uma nova sessão: conecta, faz login e entra na pasta remota (criando-a se permitido)."""
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect(self.host, self.port, timeout=self.timeout)
+            ftp.set_pasv(True)
+            ftp.login(self.user, self.password)
+            try:
+                ftp.cwd(self.remote_path)
+            except ftplib.error_perm:
+                if not self.criar_diretorio:
+                    raise
+                self.log(f"  Diretório remoto '{self.remote_path}' não existe. Tentando criar...")
+                _criar_diretorio_remoto(ftp, self.remote_path)
+        except BaseException:
+            ftp.close()
+            raise
+        self.log(f"  Conexão FTP aberta: {self.user}@{self.host}:{self.port}{self.remote_path}")
+        return ftp
+
+    def _pegar_sessao(self):
+        """Devolve uma sessão ociosa ainda viva do pool ou abre uma nova."""
+        while True:
+            with _SESSOES_FTP_LOCK:
+                ociosas = _SESSOES_FTP_OCIOSAS.get(self._chave)
+                ftp = ociosas.pop() if ociosas else None
+            if ftp is None:
+                return self._abrir_sessao()
+            try:
+                ftp.voidcmd("NOOP") # Descarta sessões derrubadas pelo servidor enquanto ociosas
+                return ftp
+            except ftplib.all_errors:
+                ftp.close()
+
+    def _devolver_sessao(self, ftp):
+        with _SESSOES_FTP_LOCK:
+            _SESSOES_FTP_OCIOSAS.setdefault(self._chave, []).append(ftp)
+
+    def _espera(self, tentativa):
+        return self.espera_inicial * 2 ** (tentativa - 1)
+
+    def _sessao_com_retentativas(self):
+        """Como _pegar_sessao, mas reconecta após falhas transitórias. Erros permanentes (error_perm) sobem direto."""
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                return self._pegar_sessao()
+            except ftplib.error_perm:
+                raise
+            except ftplib.all_errors as e:
+                if tentativa == self.tentativas:
+                    raise
+                espera = self._espera(tentativa)
+                self.log(f"  AVISO: Falha ao conectar no FTP ({str(e) or type(e).__name__}). Nova tentativa em {espera:g}s...")
+                time.sleep(espera)
+
+    def aquecer(self, quantidade=None):
+        """
+        Abre até 'quantidade' sessões em segundo plano e as deixa no pool (não bloqueia).
+        A primeira sessão valida host e credenciais; as demais só são abertas se ela der certo.
+        """
+        with _SESSOES_FTP_LOCK:
+            ja_ociosas = len(_SESSOES_FTP_OCIOSAS.get(self._chave, []))
+        faltam = (quantidade or self.conexoes) - ja_ociosas
+        if faltam <= 0:
+            return
+
+        def abrir_extra():
+            try:
+                self._devolver_sessao(self._abrir_sessao())
+            except Exception:
+                pass # O envio abre a conexão que faltar
+
+        def aquecer_pool():
+            try:
+                self._devolver_sessao(self._abrir_sessao())
+            except Exception as e:
+                self.log(f"  AVISO: Pré-conexão FTP falhou ({str(e) or type(e).__name__}). Nova tentativa será feita no envio.")
+                return
+            extras = [threading.Thread(target=abrir_extra, daemon=True) for _ in range(faltam - 1)]
+            for t in extras:
+                t.start()
+            for t in extras:
+                t.join()
+
+        t = threading.Thread(target=aquecer_pool, daemon=True)
+        t.start()
+        self._threads_aquecimento.append(t)
+
+    def aguardar_aquecimento(self):
+        """Espera as pré-conexões em andamento (evita abrir conexões a mais no início do envio)."""
+        for t in list(self._threads_aquecimento):
+            t.join()
+
+    def enviar(self, arquivos, diario=None):
+        """
+        Envia de uma vez a lista de arquivos locais e devolve [(arquivo, erro)] na mesma
+        ordem, com erro None para os enviados com sucesso (ver FluxoEnvio).
+        """
+        if not arquivos:
+            return []
+        fluxo = FluxoEnvio(self, diario=diario, limite=len(arquivos), conexoes=min(self.conexoes, len(arquivos)))
+        for arquivo in arquivos:
+            fluxo.enfileirar(arquivo)
+        return fluxo.concluir()
+
+class FluxoEnvio:
+    """
+    Fila de envio FTP alimentada durante a geração: cada arquivo entra na fila e sobe na hora
+    por uma das conexões do FtpUploader. A fila é limitada (enfileirar() bloqueia se o link for
+    mais lento que a geração) e o resultado de cada arquivo vai para o diário, se houver.
+    """
+    def __init__(self, uploader, diario=None, limite=None, conexoes=None, copia_local="depois", ao_concluir=None,
+                 progresso=None):
+        self.uploader = uploader
+        self.diario = diario
+        self.ao_concluir = ao_concluir
+        self.progresso = progresso
+        self.copia_local = copia_local
+        self._gravador = None # Thread única das cópias locais em segundo plano (criada sob demanda)
+        self._fila = queue.Queue()
+        self._vagas = threading.Semaphore(limite or 2 * uploader.conexoes)
+        self._lock = threading.Lock()
+        self._arquivos = []
+        self._erros = {} # índice -> erro (None = enviado)
+        self._erro_conexao = None # Definido quando nenhuma conexão pôde ser aberta
+        self._ultimo_erro_conexao = None
+        self._vivos = conexoes or uploader.conexoes
+        self._bytes_enviados = 0
+        self._inicio_envio = None # perf_counter do primeiro arquivo enfileirado
+        self._fim_envio = None
+        self._threads = [threading.Thread(target=self._trabalhador, daemon=True) for _ in range(self._vivos)]
+        self.concluido = False
+        for t in self._threads:
+            t.start()
+
+    def enfileirar(self, arquivo, conteudo=None):
+        """
+        Coloca um arquivo pronto na fila de envio. Bloqueia enquanto a fila estiver cheia.
+        Com 'conteudo' (bytes), 'arquivo' é só o caminho da cópia local e o envio sai da
+        memória, sem ler o disco; a cópia é gravada conforme 'copia_local' (ver _concluir_arquivo).
+        """
+        self._vagas.acquire()
+        if self._inicio_envio is None:
+            self._inicio_envio = time.perf_counter()
+        if self.diario:
+            try:
+                self.diario.adicionar(arquivo, conteudo)
+            except OSError as e:
+                self.uploader.log(f"  AVISO: Falha ao registrar {os.path.basename(arquivo)} no diário de envio: {e}")
+        i = len(self._arquivos)
+        self._arquivos.append(arquivo)
+        if self.progresso is not None:
+            self.progresso.envio_enfileirado()
+        self._fila.put((i, arquivo, conteudo))
+
+    def concluir(self):
+        """
+        Espera os envios da fila terminarem e devolve [(arquivo, erro)] na ordem de entrada.
+        Se nenhum arquivo foi enviado porque não houve conexão (ou login), levanta esse erro.
+        """
+        if not self.concluido:
+            self.concluido = True
+            self._fila.put(None) # Sinal de fim: cada trabalhador repassa para o próximo
+            for t in self._threads:
+                t.join()
+            self._fim_envio = time.perf_counter()
+            if self._gravador is not None:
+                self._gravador.shutdown(wait=True)
+            if self.diario and not self._arquivos:
+                self.diario.descartar() # Nada foi gerado: não deixa diário vazio
+        sem_conexao = self._ultimo_erro_conexao or ftplib.Error("Sem conexão FTP disponível")
+        resultados = [(arquivo, self._erros.get(i, sem_conexao)) for i, arquivo in enumerate(self._arquivos)]
+        if self._erro_conexao is not None and resultados and all(erro is not None for _, erro in resultados):
+            raise self._erro_conexao
+        return resultados
+
+    def estatisticas(self):
+        """(arquivos enviados, arquivos com falha, bytes enviados, duração do envio em segundos)."""
+        enviados = sum(1 for i in range(len(self._arquivos)) if i in self._erros and self._erros[i] is None)
+        fim = self._fim_envio or time.perf_counter()
+        duracao = fim - self._inicio_envio if self._inicio_envio is not None else 0.0
+        return enviados, len(self._arquivos) - enviados, self._bytes_enviados, duracao
+
+    def _gravar_copia_local(self, arquivo, conteudo):
+        try:
+            gravar_arquivo(arquivo, conteudo)
+        except OSError as e:
+            self.uploader.log(f"  AVISO: Falha ao gravar a cópia local {arquivo}: {e}")
+
+    def _cancelado(self):
+        return self.progresso is not None and self.progresso.cancelado
+
+    def _concluir_arquivo(self, i, arquivo, erro, conteudo=None, tamanho=0):
+        """
+        Registra o resultado final de um arquivo (erro None = enviado) no progresso, no diário
+        e em 'ao_concluir(arquivo, erro)'. Enviado da memória, ganha cópia local conforme
+        'copia_local': 'depois' (em segundo plano, após o envio) ou 'falhas' (só se não foi
+        enviado, para poder retomar). Depois de um cancelamento no 'progresso', os que ainda
+        estão na fila terminam aqui com GeracaoCancelada, sem subir, e continuam pendentes no diário.
+        """
+        self._erros[i] = erro
+        if tamanho:
+            with self._lock:
+                self._bytes_enviados += tamanho
+        if self.progresso is not None and not isinstance(erro, GeracaoCancelada):
+            self.progresso.envio_concluido(tamanho, erro is None)
+        if conteudo is not None:
+            if erro is not None and self.copia_local == "falhas":
+                self._gravar_copia_local(arquivo, conteudo) # Antes do diário, para a retomada encontrar o arquivo
+            elif self.copia_local == "depois":
+                with self._lock:
+                    if self._gravador is None:
+                        from concurrent.futures import ThreadPoolExecutor
+                        self._gravador = ThreadPoolExecutor(max_workers=1)
+                self._gravador.submit(self._gravar_copia_local, arquivo, conteudo)
+        if self.diario:
+            try:
+                self.diario.registrar(arquivo, erro)
+            except OSError as e:
+                self.uploader.log(f"  AVISO: Falha ao registrar o resultado de {os.path.basename(arquivo)}: {e}")
+        if self.ao_concluir is not None:
+            self.ao_concluir(arquivo, erro)
+        self._vagas.release()
+
+    def _trabalhador(self):
+        up = self.uploader
+        up.aguardar_aquecimento()
+        ftp = None
+        try:
+            while True:
+                item = self._fila.get()
+                if item is None:
+                    with self._lock:
+                        sair = self._fila.empty()
+                        if sair:
+                            self._vivos -= 1
+                    self._fila.put(None)
+                    if sair:
+                        return
+                    continue # Ainda há arquivos devolvidos por outra conexão
+                i, arquivo, conteudo = item
+                if self._cancelado():
+                    self._concluir_arquivo(i, arquivo, GeracaoCancelada("Envio cancelado"), conteudo)
+                    continue
+                if ftp is None and self._erro_conexao is None:
+                    try:
+                        ftp = up._sessao_com_retentativas()
+                    except ftplib.all_errors as e:
+                        self._ultimo_erro_conexao = e
+                        with self._lock:
+                            ultimo = self._vivos == 1
+                            if ultimo:
+                                self._erro_conexao = e
+                            else:
+                                self._vivos -= 1
+                                self._fila.put(item) # Fica para as outras conexões
+                        if not ultimo:
+                            return
+                if ftp is None:
+                    # Nenhuma conexão disponível: falha direto (o diário guarda o arquivo para retomar)
+                    self._concluir_arquivo(i, arquivo, self._erro_conexao, conteudo)
+                    continue
+                ftp = self._enviar_arquivo(ftp, i, arquivo, conteudo)
+        finally:
+            if ftp is not None:
+                up._devolver_sessao(ftp)
+
+    def _enviar_arquivo(self, ftp, i, arquivo, conteudo=None):
+        """Envia um arquivo, reconectando e repetindo após falhas transitórias. Devolve a sessão (ou None)."""
+        up = self.uploader
+        nome = os.path.basename(arquivo)
+        tentativa = 1
+        while True:
+            if conteudo is not None:
+                f_upload = io.BytesIO(conteudo)
+            else:
+                try:
+                    f_upload = open(arquivo, 'rb')
+                except OSError as e:
+                    self._concluir_arquivo(i, arquivo, e) # Problema local: não adianta repetir
+                    return ftp
+            try:
+                with f_upload:
+                    up.log(f"    -> {nome}")
+                    ftp.storbinary(f'STOR {nome}', f_upload)
+                    tamanho = f_upload.tell()
+            except ftplib.error_perm as e:
+                self._concluir_arquivo(i, arquivo, e, conteudo) # Recusado pelo servidor; a sessão continua válida
+                return ftp
+            except ftplib.all_errors as e:
+                ftp.close() # Conexão em estado incerto: descarta e reconecta
+                if tentativa >= up.tentativas or self._cancelado():
+                    self._concluir_arquivo(i, arquivo, e, conteudo)
+                    return None
+                espera = up._espera(tentativa)
+                tentativa += 1
+                up.log(f"      ↳ Falha transitória em {nome} ({str(e) or type(e).__name__}). Nova tentativa em {espera:g}s ({tentativa}/{up.tentativas})...")
+                time.sleep(espera)
+                try:
+                    ftp = up._sessao_com_retentativas()
+                except ftplib.all_errors as e_conexao:
+                    self._ultimo_erro_conexao = e_conexao
+                    self._concluir_arquivo(i, arquivo, e_conexao, conteudo)
+                    return None
+            except Exception as e:
+                ftp.close()
+                self._concluir_arquivo(i, arquivo, e, conteudo)
+                return None
+            else:
+                self._concluir_arquivo(i, arquivo, None, conteudo, tamanho)
+                return ftp
+
+def calcular_sha256(caminho):
+    """SHA-256 (hex) do conteúdo de um arquivo (para bytes em memória, use hashlib direto)."""
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+class DiarioEnvio:
+    """
+    Diário em disco de um envio FTP, no formato JSON Lines. A primeira linha descreve
+    o destino; cada arquivo ganha uma linha 'pendente' (com SHA-256) ao entrar na fila
+    e outra com o resultado final. Se a conexão cair no meio do envio, o diário mostra
+    exatamente o que já foi e o que ainda falta enviar. A senha nunca é gravada.
+    """
+    PENDENTE = "pendente"
+    ENVIADO = "enviado"
+    FALHOU = "falhou"
+
+    def __init__(self, caminho, cabecalho, arquivos=None):
+        self.caminho = caminho
+        self.cabecalho = cabecalho
+        self.arquivos = arquivos if arquivos is not None else {} # arquivo -> {"sha256", "estado", "erro"} (ordem de entrada)
+        self._lock = threading.Lock()
+        self._linha_incompleta = False # Última linha gravada pela metade: o próximo evento começa em linha nova
+
+    @classmethod
+    def criar(cls, pasta, tipo, credencial, uploader, arquivos=()):
+        """Grava o cabeçalho de um novo diário (e os arquivos já conhecidos, como pendentes)."""
+        os.makedirs(pasta, exist_ok=True)
+        agora = datetime.now()
+        caminho = os.path.join(pasta, f"envio_{tipo.lower()}_{agora.strftime('%Y%m%d_%H%M%S_%f')}.jsonl")
+        cabecalho = {
+            "tipo": tipo,
+            "credencial": credencial,
+            "host": uploader.host,
+            "port": uploader.port,
+            "user": uploader.user,
+            "remote_path": uploader.remote_path,
+            "criar_diretorio": uploader.criar_diretorio,
+            "timeout": uploader.timeout,
+            "criado_em": agora.isoformat(timespec="seconds"),
+        }
+        with open(caminho, "w", encoding="utf-8") as f:
+            f.write(json.dumps(cabecalho, ensure_ascii=False) + "\n")
+        diario = cls(caminho, cabecalho)
+        for arquivo in arquivos:
+            diario.adicionar(arquivo)
+        return diario
+
+    @classmethod
+    def carregar(cls, caminho):
+        """Lê um diário e reaplica os resultados já registrados."""
+        with open(caminho, encoding="utf-8") as f:
+            texto = f.read()
+        linhas = texto.splitlines()
+        diario = cls(caminho, json.loads(linhas[0]))
+        diario._linha_incompleta = not texto.endswith("\n")
+        for linha in linhas[1:]:
+            try:
+                evento = json.loads(linha)
+            except ValueError:
+                continue # Linha incompleta (programa fechado durante a gravação)
+            arquivo = evento.get("arquivo")
+            if "sha256" in evento:
+                diario.arquivos[arquivo] = {"sha256": evento["sha256"], "estado": cls.PENDENTE, "erro": None}
+            elif arquivo in diario.arquivos:
+                diario.arquivos[arquivo].update(estado=evento.get("estado"), erro=evento.get("erro"))
+        return diario
+
+    def _gravar_evento(self, evento):
+        with open(self.caminho, "a", encoding="utf-8") as f:
+            if self._linha_incompleta:
+                f.write("\n")
+                self._linha_incompleta = False
+            f.write(json.dumps(evento, ensure_ascii=False) + "\n")
+
+    def adicionar(self, arquivo, conteudo=None):
+        """Registra um arquivo a enviar (pendente), com o SHA-256 do conteúdo gerado (do disco ou de 'conteudo')."""
+        arquivo = os.path.abspath(arquivo)
+        sha = hashlib.sha256(conteudo).hexdigest() if conteudo is not None else calcular_sha256(arquivo)
+        evento = {"arquivo": arquivo, "estado": self.PENDENTE, "sha256": sha}
+        with self._lock:
+            self.arquivos[arquivo] = {"sha256": evento["sha256"], "estado": self.PENDENTE, "erro": None}
+            self._gravar_evento(evento)
+
+    def registrar(self, arquivo, erro):
+        """Registra o resultado final de um arquivo (erro None = enviado). Pode ser chamado por várias threads."""
+        arquivo = os.path.abspath(arquivo)
+        estado = self.ENVIADO if erro is None else self.FALHOU
+        evento = {"arquivo": arquivo, "estado": estado, "erro": None if erro is None else str(erro),
+                  "em": datetime.now().isoformat(timespec="seconds")}
+        with self._lock:
+            if arquivo in self.arquivos:
+                self.arquivos[arquivo].update(estado=estado, erro=evento["erro"])
+            self._gravar_evento(evento)
+
+    def descartar(self):
+        """Remove o arquivo do diário (envio sem nenhum arquivo)."""
+        try:
+            os.remove(self.caminho)
+        except OSError:
+            pass
+
+    def sha256(self, arquivo):
+        info = self.arquivos.get(os.path.abspath(arquivo))
+        return info["sha256"] if info else None
+
+    def pendentes(self):
+        """Arquivos ainda não enviados (pendentes ou com falha), na ordem original."""
+        return [arquivo for arquivo, info in self.arquivos.items() if info["estado"] != self.ENVIADO]
+
+def localizar_diario_pendente(pasta, tipo=None):
+    """Devolve o diário mais recente (do tipo 'XML'/'TXT', se informado) que ainda tem arquivos a enviar, ou None."""
+    padrao = f"envio_{tipo.lower()}_*.jsonl" if tipo else "envio_*.jsonl"
+    for caminho in sorted(glob.glob(os.path.join(pasta, padrao)), reverse=True):
+        try:
+            diario = DiarioEnvio.carregar(caminho)
+        except (OSError, ValueError, KeyError, IndexError):
+            continue # Diário ilegível: ignora
+        if diario.pendentes():
+            return diario
+    return None
+
+# ==============================================================================
+# REGISTRO DE PEDIDOS (SQLITE) E MODO INCREMENTAL
+# ==============================================================================
+def itens_por_grupo(pedidos, colunas, niveis=None):
+    """
+    Itens de cada grupo de 'pedidos' (PedidosCompactos, agrupados pelas 'niveis' primeiras
+    chaves) normalizados para o hash_pedido (colunas em texto, sem espaços nas pontas),
+    na ordem em que os grupos são percorridos. Montados numa única passada vetorizada:
+    ler as colunas grupo a grupo custaria mais que o próprio hash.
+    """
+    texto = pd.Series(pedidos.textos(colunas[0]), dtype=object).str.strip()
+    for coluna in colunas[1:]:
+        texto = texto + "\x1f" + pd.Series(pedidos.textos(coluna), dtype=object).str.strip()
+    limites = pedidos.limites_grupos if niveis is None else pedidos.limites(niveis)
+    return np.split(texto.to_numpy(), limites[1:-1])
+
+def hash_pedido(identificacao, itens):
+    """
+    SHA-256 de um pedido: campos de identificação (CNPJ, nome, oferta, login...) mais
+    os itens de itens_por_grupo() em ordem, para que apenas reordenar as linhas da
+    planilha não conte como alteração.
+    """
+    h = hashlib.sha256("\x1f".join(str(c) for c in identificacao).encode("utf-8"))
+    h.update("".join("\x1e" + item for item in sorted(itens)).encode("utf-8"))
+    return h.hexdigest()
+
+def destino_registro(uploader):
+    """Identificação do destino FTP gravada no registro (None = sem envio)."""
+    return f"{uploader.host}:{uploader.port}{uploader.remote_path}" if uploader is not None else None
+
+class RegistroPedidos:
+    """
+    Registro local (SQLite) de cada pedido gerado: tipo e chave do grupo, hash do
+    conteúdo, arquivo gerado, destino FTP e situação do envio. No modo incremental,
+    um grupo com o mesmo hash que já foi gerado (e enviado ao mesmo destino, quando há
+    envio; sem envio, com o arquivo ainda na pasta de saída) é pulado. As atualizações são gravadas em lotes de LOTE_GRAVACAO (uma
+    transação por lote) e no fechar(). Falhas ao gravar só geram aviso: a geração continua.
+    """
+    GERADO = "gerado" # Gerado sem envio FTP
+    PENDENTE = "pendente"
+    ENVIADO = "enviado"
+    FALHOU = "falhou"
+    LOTE_GRAVACAO = 500
+
+    def __init__(self, caminho, log=None):
+        import sqlite3
+        self._erros_sqlite = sqlite3.Error
+        self.caminho = caminho
+        self.log = log or (lambda mensagem: None)
+        self._lock = threading.Lock()
+        self._anteriores = {} # tipo -> {chave: (hash, situacao, destino, arquivo)}
+        self._geracoes = [] # Linhas ainda não gravadas (ver LOTE_GRAVACAO)
+        self._envios = []
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, timeout=30, check_same_thread=False)
+        try:
+            self._conexao.execute("PRAGMA journal_mode=WAL") # Cada atualização grava sem esperar o disco inteiro
+            self._conexao.execute("PRAGMA synchronous=NORMAL")
+            with self._conexao:
+                self._conexao.execute(
+                    "CREATE TABLE IF NOT EXISTS pedidos ("
+                    " tipo TEXT NOT NULL, chave TEXT NOT NULL, hash TEXT NOT NULL, arquivo TEXT NOT NULL,"
+                    " destino TEXT, situacao TEXT NOT NULL, gerado_em TEXT NOT NULL, enviado_em TEXT, erro TEXT,"
+                    " PRIMARY KEY (tipo, chave))")
+                self._conexao.execute("CREATE INDEX IF NOT EXISTS pedidos_arquivo ON pedidos (arquivo)")
+        except sqlite3.Error:
+            self._conexao.close()
+            raise
+
+    def fechar(self):
+        with self._lock:
+            self._gravar_pendentes()
+            self._conexao.close()
+
+    def _gravar_pendentes(self):
+        """Grava gerações e depois envios acumulados numa única transação (chamar com o lock)."""
+        geracoes, envios = self._geracoes[:], self._envios[:]
+        self._geracoes.clear()
+        self._envios.clear()
+        try:
+            with self._conexao:
+                self._conexao.executemany(
+                    "INSERT OR REPLACE INTO pedidos (tipo, chave, hash, arquivo, destino, situacao, gerado_em, enviado_em, erro)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, NULL, NULL)", geracoes)
+                self._conexao.executemany(
+                    "UPDATE pedidos SET situacao = ?, enviado_em = COALESCE(?, enviado_em), erro = ? WHERE arquivo = ?", envios)
+        except self._erros_sqlite as e:
+            self.log(f"  AVISO: Falha ao atualizar o registro de pedidos: {e}")
+
+    def _acumular(self, fila, linha):
+        with self._lock:
+            fila.append(linha)
+            if len(self._geracoes) + len(self._envios) >= self.LOTE_GRAVACAO:
+                self._gravar_pendentes()
+
+    def inalterado(self, tipo, chave, hash_atual, destino, pasta_saida):
+        """
+        Indica se o pedido já foi gerado com este mesmo conteúdo e, quando há envio
+        ('destino' não é None), se já foi enviado com sucesso a esse destino. Sem envio,
+        o arquivo gerado antes ainda tem de existir dentro de 'pasta_saida' (a pasta de
+        saída desta execução); apagado ou gerado em outra pasta, o pedido é refeito.
+        """
+        if tipo not in self._anteriores:
+            with self._lock:
+                linhas = self._conexao.execute(
+                    "SELECT chave, hash, situacao, destino, arquivo FROM pedidos WHERE tipo = ?", (tipo,)).fetchall()
+            self._anteriores[tipo] = {c: (h, s, d, a) for c, h, s, d, a in linhas}
+        anterior = self._anteriores[tipo].get(chave)
+        if anterior is None or anterior[0] != hash_atual:
+            return False
+        if destino is not None:
+            return anterior[1] == self.ENVIADO and anterior[2] == destino
+        arquivo = os.path.normcase(anterior[3])
+        pasta = os.path.join(os.path.normcase(os.path.abspath(pasta_saida)), "")
+        return arquivo.startswith(pasta) and os.path.exists(arquivo)
+
+    def registrar_geracao(self, tipo, chave, hash_atual, arquivo, destino):
+        """Grava (ou substitui) o pedido recém-gerado, pendente de envio se houver destino."""
+        situacao = self.PENDENTE if destino is not None else self.GERADO
+        self._acumular(self._geracoes, (tipo, chave, hash_atual, os.path.abspath(arquivo), destino, situacao,
+                                        datetime.now().isoformat(timespec="seconds")))
+
+    def registrar_envio(self, arquivo, erro):
+        """Resultado do envio de um arquivo (erro None = enviado). Usado como retorno do FluxoEnvio."""
+        if erro is None:
+            linha = (self.ENVIADO, datetime.now().isoformat(timespec="seconds"), None, os.path.abspath(arquivo))
+        else:
+            linha = (self.FALHOU, None, str(erro), os.path.abspath(arquivo))
+        self._acumular(self._envios, linha)
+
+# ==============================================================================
+# PRÉ-VALIDAÇÃO DAS LINHAS (PLANILHA INTEIRA, COLUNA A COLUNA)
+# ==============================================================================
+# Motivos de rejeição de uma linha, do mais ao menos prioritário (vale o primeiro que se aplica)
+MOTIVOS_REJEICAO = {
+    "linha_vazia": "Linha vazia",
+    "nome_arquivo_vazio": "Nome do arquivo vazio",
+    "cnpj_vazio": "CNPJ vazio",
+    "cnpj_tamanho_invalido": "CNPJ sem 14 dígitos",
+    "cnpj_digito_invalido": "CNPJ com dígitos verificadores inválidos",
+    "ean_vazio": "EAN vazio",
+    "ean_tamanho_invalido": "EAN sem 13 dígitos",
+    "ean_digito_invalido": "EAN com dígito verificador (GTIN-13) inválido",
+    "quantidade_invalida": "Quantidade vazia, não numérica ou menor que 1",
+}
+_PESOS_CNPJ_DV1 = (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+_PESOS_CNPJ_DV2 = (6,) + _PESOS_CNPJ_DV1
+_PESOS_GTIN13 = (1, 3) * 6
+
+def _digito_modulo11(digitos, pesos):
+    resto = (digitos @ np.array(pesos, dtype=np.int64)) % 11
+    return np.where(resto < 2, 0, 11 - resto)
+
+def _matriz_digitos(textos, quantidade):
+    """Matriz (n, quantidade) com os dígitos de textos de exatamente 'quantidade' dígitos ASCII."""
+    brutos = np.array(textos, dtype=f"S{quantidade}")
+    return brutos.view(np.uint8).reshape(-1, quantidade).astype(np.int64) - ord("0")
+
+def corrigir_cnpj(serie):
+    """
+    CNPJ em texto sem espaços, com o zero à esquerda recolocado nos que têm 13 dígitos
+    (perdido quando a coluna foi tratada como número). Devolve (cnpj, corrigidos).
+    """
+    cnpj = serie.astype(str).str.strip()
+    corrigir = cnpj.str.fullmatch(r"[0-9]{13}")
+    return cnpj.where(~corrigir, "0" + cnpj), corrigir
+
+def _motivos_codigo(textos, tamanho, digito_ok, prefixo):
+    """Motivo de rejeição de cada código numérico (CNPJ ou EAN): vazio, tamanho ou dígito verificador."""
+    motivos = np.full(len(textos), "", dtype=object)
+    formato_ok = textos.str.fullmatch(f"[0-9]{{{tamanho}}}").to_numpy(dtype=bool)
+    motivos[~formato_ok] = f"{prefixo}_tamanho_invalido"
+    motivos[(textos == "").to_numpy()] = f"{prefixo}_vazio"
+    if formato_ok.any():
+        validos = digito_ok(_matriz_digitos(textos.to_numpy()[formato_ok].tolist(), tamanho))
+        motivos[np.flatnonzero(formato_ok)[~validos]] = f"{prefixo}_digito_invalido"
+    return motivos
+
+def _cnpj_digitos_ok(digitos):
+    dv1 = _digito_modulo11(digitos[:, :12], _PESOS_CNPJ_DV1)
+    dv2 = _digito_modulo11(digitos[:, :13], _PESOS_CNPJ_DV2)
+    repetidos = (digitos == digitos[:, :1]).all(axis=1) # 00000000000000, 11111111111111...
+    return (dv1 == digitos[:, 12]) & (dv2 == digitos[:, 13]) & ~repetidos
+
+def _ean_digito_ok(digitos):
+    soma = digitos[:, :12] @ np.array(_PESOS_GTIN13, dtype=np.int64)
+    return (10 - soma % 10) % 10 == digitos[:, 12]
+
+def motivos_rejeicao(nome_arquivo, cnpj, ean, quantidade_ok, vazia):
+    """
+    Pré-validação de todas as linhas de uma vez, antes do agrupamento: motivo de
+    rejeição de cada linha ('' = linha limpa), o primeiro de MOTIVOS_REJEICAO que
+    se aplica. 'cnpj' já passou por corrigir_cnpj, 'ean' e 'nome_arquivo' estão sem
+    espaços; 'quantidade_ok' e 'vazia' são máscaras calculadas por quem chama, pois
+    as regras de quantidade diferem entre os layouts.
+    """
+    motivos = np.where(np.asarray(quantidade_ok, dtype=bool), "", "quantidade_invalida").astype(object)
+    for motivos_coluna in (_motivos_codigo(ean, 13, _ean_digito_ok, "ean"),
+                           _motivos_codigo(cnpj, 14, _cnpj_digitos_ok, "cnpj")):
+        motivos = np.where(motivos_coluna != "", motivos_coluna, motivos)
+    motivos[(nome_arquivo == "").to_numpy()] = "nome_arquivo_vazio"
+    motivos[np.asarray(vazia, dtype=bool)] = "linha_vazia"
+    return pd.Series(motivos, index=cnpj.index, dtype=object)
+
+def linhas_vazias(df):
+    """Máscara (série) das linhas sem nenhum valor nas colunas lidas: linhas em branco no meio da planilha."""
+    return (df.astype(str).apply(lambda coluna: coluna.str.strip()) == "").all(axis=1)
+
+def tabela_rejeitadas(df, motivos):
+    """
+    Linhas rejeitadas de 'df' (como foram lidas) para a planilha de erros, com a linha
+    da planilha de origem (cabeçalho na linha 1) e a descrição do motivo. Linhas
+    vazias ficam de fora (só contam nas métricas).
+    """
+    rejeitadas = motivos[(motivos != "") & (motivos != "linha_vazia")]
+    tabela = df.loc[rejeitadas.index].astype(str)
+    tabela.insert(0, "LINHA", rejeitadas.index + 2)
+    tabela["MOTIVO"] = rejeitadas.map(MOTIVOS_REJEICAO)
+    return tabela.sort_values("LINHA", kind="stable")
+
+# Caracteres de controle não são aceitos em XML 1.0 (podem vir da planilha de origem)
+_XML_CARACTERES_INVALIDOS = r"[\x00-\x08\x0b\x0c\x0e-\x1f]"
+
+def gravar_planilha_erros(caminho, tabelas):
+    """
+    Grava a planilha de erros com uma aba por tipo ('tabelas': tipo -> tabela_rejeitadas),
+    pelo openpyxl em modo write_only, e a publica com gravar_arquivo_atomico. Sem linhas
+    rejeitadas, remove a planilha de uma execução anterior, para que ela não seja
+    tomada como desta. Devolve o caminho gravado ou None.
+    """
+    tabelas = {tipo: tabela for tipo, tabela in tabelas.items() if tabela is not None and len(tabela)}
+    if not tabelas:
+        if os.path.exists(caminho):
+            os.remove(caminho)
+        return None
+    wb = openpyxl.Workbook(write_only=True)
+    for tipo, tabela in tabelas.items():
+        ws = wb.create_sheet(title=tipo)
+        ws.append([str(nome) for nome in tabela.columns])
+        colunas = []
+        for nome in tabela.columns:
+            coluna = tabela[nome]
+            if pd.api.types.is_integer_dtype(coluna):
+                colunas.append(coluna.tolist())
+            else:
+                colunas.append(coluna.astype(str).str.replace(_XML_CARACTERES_INVALIDOS, "", regex=True).tolist())
+        for linha in zip(*colunas):
+            ws.append(linha)
+    conteudo = io.BytesIO()
+    wb.save(conteudo)
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    gravar_arquivo_atomico(caminho, conteudo.getvalue(), sincronizar=False)
+    return caminho
+
+def resumo_rejeicoes(motivos):
+    """Texto curto com a contagem de linhas rejeitadas por motivo."""
+    contagem = motivos[motivos != ""].value_counts()
+    return ", ".join(f"{MOTIVOS_REJEICAO.get(motivo, motivo)}: {n}" for motivo, n in contagem.items())
+
+# ==============================================================================
+# MÉTRICAS DE EXECUÇÃO (RELATÓRIO POR GERAÇÃO)
+# ==============================================================================
+# Fases cronometradas de uma geração, na ordem em que acontecem
+FASES_EXECUCAO = ("leitura", "validacao", "agrupamento", "renderizacao", "gravacao", "envio")
+
+class MetricasExecucao:
+    """
+    Métricas estruturadas de uma geração: duração de cada fase, linhas lidas, pedidos
+    gerados, itens ignorados por motivo e vazão do envio FTP. Ao final, são salvas em
+    JSON (uma por execução) e acrescentadas ao CSV histórico da pasta de relatórios.
+    """
+    ARQUIVO_CSV = "relatorio_execucoes.csv"
+
+    def __init__(self, tipo, planilha):
+        self.tipo = tipo
+        self.planilha = planilha
+        self.inicio = datetime.now()
+        self._t0 = time.perf_counter()
+        self.fases = dict.fromkeys(FASES_EXECUCAO, 0.0)
+        self.linhas_lidas = 0
+        self.pedidos_gerados = 0
+        self.itens_ignorados = {}
+        self.arquivos_enviados = 0
+        self.falhas_envio = 0
+        self.bytes_enviados = 0
+        self.duracao_envio = 0.0
+        self.duracao_total = 0.0
+        self.sucesso = None
+
+    @contextmanager
+    def fase(self, nome):
+        """Acumula em 'nome' o tempo gasto dentro do bloco."""
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.fases[nome] += time.perf_counter() - t
+
+    def cronometrar(self, nome, iteravel):
+        """Repassa os itens de um iterável preguiçoso, acumulando em 'nome' o tempo de produzir cada um."""
+        iterador = iter(iteravel)
+        while True:
+            with self.fase(nome):
+                try:
+                    item = next(iterador)
+                except StopIteration:
+                    return
+            yield item
+
+    def ignorar(self, motivo, quantidade=1):
+        """Soma 'quantidade' itens ignorados pelo 'motivo'."""
+        self.itens_ignorados[motivo] = self.itens_ignorados.get(motivo, 0) + int(quantidade)
+
+    def ignorar_linhas(self, motivos):
+        """Soma os itens ignorados de uma série de motivos por linha ('' = item aproveitado)."""
+        for motivo, quantidade in motivos[motivos != ""].value_counts().items():
+            self.ignorar(motivo, quantidade)
+
+    def acumular(self, outra):
+        """Soma as fases, contagens e o envio de outra geração (métricas de um lote de planilhas)."""
+        for nome, duracao in outra.fases.items():
+            self.fases[nome] += duracao
+        self.linhas_lidas += outra.linhas_lidas
+        self.pedidos_gerados += outra.pedidos_gerados
+        for motivo, quantidade in outra.itens_ignorados.items():
+            self.ignorar(motivo, quantidade)
+        self.arquivos_enviados += outra.arquivos_enviados
+        self.falhas_envio += outra.falhas_envio
+        self.bytes_enviados += outra.bytes_enviados
+        self.duracao_envio += outra.duracao_envio
+
+    def registrar_envio(self, fluxo):
+        """Copia as estatísticas de um FluxoEnvio (se houve envio)."""
+        if fluxo is not None:
+            self.arquivos_enviados, self.falhas_envio, self.bytes_enviados, self.duracao_envio = fluxo.estatisticas()
+
+    def finalizar(self, sucesso):
+        self.sucesso = bool(sucesso)
+        self.duracao_total = time.perf_counter() - self._t0
+
+    def _por_segundo(self, valor):
+        return valor / self.duracao_envio if self.duracao_envio > 0 else 0.0
+
+    def como_dict(self):
+        return {
+            "tipo": self.tipo,
+            "planilha": self.planilha,
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "sucesso": self.sucesso,
+            "duracao_total_s": round(self.duracao_total, 3),
+            "fases_s": {nome: round(duracao, 3) for nome, duracao in self.fases.items()},
+            "linhas_lidas": self.linhas_lidas,
+            "pedidos_gerados": self.pedidos_gerados,
+            "itens_ignorados": dict(sorted(self.itens_ignorados.items())),
+            "envio": {
+                "arquivos_enviados": self.arquivos_enviados,
+                "falhas": self.falhas_envio,
+                "bytes_enviados": self.bytes_enviados,
+                "duracao_s": round(self.duracao_envio, 3),
+                "bytes_por_s": round(self._por_segundo(self.bytes_enviados), 1),
+                "arquivos_por_s": round(self._por_segundo(self.arquivos_enviados), 2),
+            },
+        }
+
+    def _linha_csv(self):
+        dados = self.como_dict()
+        linha = {c: dados[c] for c in ("inicio", "tipo", "planilha", "sucesso", "duracao_total_s")}
+        linha.update({f"{nome}_s": duracao for nome, duracao in dados["fases_s"].items()})
+        linha.update({c: dados[c] for c in ("linhas_lidas", "pedidos_gerados")})
+        linha["itens_ignorados"] = sum(self.itens_ignorados.values())
+        linha["motivos_ignorados"] = ";".join(f"{m}={n}" for m, n in dados["itens_ignorados"].items())
+        linha.update(dados["envio"])
+        return linha
+
+    def salvar(self, pasta):
+        """Grava o JSON desta execução e acrescenta uma linha ao CSV histórico. Devolve o caminho do JSON."""
+        import csv
+        os.makedirs(pasta, exist_ok=True)
+        caminho_json = os.path.join(pasta, f"execucao_{self.tipo.lower()}_{self.inicio.strftime('%Y%m%d_%H%M%S_%f')}.json")
+        with open(caminho_json, "w", encoding="utf-8") as f:
+            json.dump(self.como_dict(), f, ensure_ascii=False, indent=2)
+        linha = self._linha_csv()
+        caminho_csv = os.path.join(pasta, self.ARQUIVO_CSV)
+        novo = not os.path.exists(caminho_csv)
+        with open(caminho_csv, "a", encoding="utf-8-sig", newline="") as f:
+            escritor = csv.DictWriter(f, fieldnames=list(linha), delimiter=";")
+            if novo:
+                escritor.writeheader()
+            escritor.writerow(linha)
+        return caminho_json
+
+    def resumo(self):
+        """Resumo em poucas linhas, para o log e o painel da janela."""
+        fases = "  ".join(f"{nome} {self.fases[nome]:.2f}s" for nome in FASES_EXECUCAO)
+        linhas = [
+            f"{self.tipo} em {self.duracao_total:.2f}s ({'sucesso' if self.sucesso else 'com erros'}): "
+            f"{self.linhas_lidas} linha(s) lida(s), {self.pedidos_gerados} pedido(s) gerado(s)",
+            f"Fases: {fases}",
+        ]
+        if self.itens_ignorados:
+            motivos = ", ".join(f"{m.replace('_', ' ')}: {n}" for m, n in sorted(self.itens_ignorados.items()))
+            linhas.append(f"Itens ignorados: {motivos}")
+        if self.arquivos_enviados or self.falhas_envio:
+            linhas.append(f"FTP: {self.arquivos_enviados} enviado(s), {self.falhas_envio} falha(s), "
+                          f"{self.bytes_enviados / 1024:.1f} KiB em {self.duracao_envio:.2f}s "
+                          f"({self._por_segundo(self.bytes_enviados) / 1024:.1f} KiB/s, {self._por_segundo(self.arquivos_enviados):.1f} arq/s)")
+        return "\n".join(linhas)
+
+# ==============================================================================
+# PROGRESSO AO VIVO E CANCELAMENTO
+# ==============================================================================
+# Nome exibido de cada etapa acompanhada pelo progresso
+ETAPAS_PROGRESSO = {"agrupamento": "Agrupando pedidos", "geracao": "Gerando arquivos"}
+
+class GeracaoCancelada(BaseException):
+    """
+    Levantada entre grupos e entre arquivos quando o usuário cancela a execução. Deriva de
+    BaseException (como KeyboardInterrupt) para atravessar os 'except Exception' do caminho
+    e só ser tratada onde a geração ou o envio é encerrado.
+    """
+
+class ProgressoGeracao:
+    """
+    Progresso ao vivo de uma execução: etapa atual, arquivos feitos/total, itens/s, envio
+    FTP (arquivos e bytes/s) e tempo restante estimado. Atualizado pelos laços de geração
+    e pelas conexões de envio (várias threads, por isso o lock) e lido pela janela.
+    Também leva o pedido de cancelamento: cancelar() só marca o pedido, e a geração
+    para no próximo avancar() (entre grupos e entre arquivos), mantendo o que já foi feito.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelado = threading.Event()
+        self.ativo = False
+        self.reiniciar()
+
+    def iniciar(self, rotulo=""):
+        """Começa uma nova execução: zera o progresso e um cancelamento anterior."""
+        self._cancelado.clear()
+        self.reiniciar(rotulo)
+        self.ativo = True
+
+    def reiniciar(self, rotulo=""):
+        """Zera as contagens (ex.: a cada planilha de um lote), sem desfazer um cancelamento."""
+        with self._lock:
+            self.rotulo = rotulo
+            self.etapa = None
+            self._etapas = {} # nome -> [feitos, total, início (perf_counter)]
+            self._itens = 0
+            self._envio = [0, 0, 0, 0] # enfileirados, concluídos, falhas, bytes
+            self._inicio_envio = None
+
+    def iniciar_etapa(self, nome, total):
+        """Soma 'total' à etapa 'nome' (na geração combinada, XML e TXT somam na mesma etapa)."""
+        with self._lock:
+            etapa = self._etapas.setdefault(nome, [0, 0, time.perf_counter()])
+            etapa[1] += total
+            self.etapa = nome
+
+    def avancar(self, nome, quantidade=1, itens=0):
+        """Conta 'quantidade' feitos na etapa e 'itens' gerados; se houve cancelamento, levanta GeracaoCancelada."""
+        with self._lock:
+            self._etapas[nome][0] += quantidade
+            self._itens += itens
+        self.verificar_cancelamento()
+
+    def envio_enfileirado(self):
+        with self._lock:
+            if self._inicio_envio is None:
+                self._inicio_envio = time.perf_counter()
+            self._envio[0] += 1
+
+    def envio_concluido(self, tamanho, ok):
+        with self._lock:
+            self._envio[1] += 1
+            self._envio[2] += not ok
+            self._envio[3] += tamanho
+
+    def cancelar(self):
+        """Pede o cancelamento (pode ser chamado de qualquer thread)."""
+        self._cancelado.set()
+
+    @property
+    def cancelado(self):
+        return self._cancelado.is_set()
+
+    def verificar_cancelamento(self):
+        if self._cancelado.is_set():
+            raise GeracaoCancelada("Execução cancelada pelo usuário")
+
+    def finalizar(self):
+        self.ativo = False
+
+    def instantaneo(self):
+        """Cópia consistente do progresso (dict), com fração concluída, vazões e tempo restante (s ou None)."""
+        agora = time.perf_counter()
+        with self._lock:
+            feitos, total, inicio = self._etapas.get(self.etapa, (0, 0, agora))
+            enfileirados, concluidos, falhas, tamanho = self._envio
+            geracao = self._etapas.get("geracao")
+            decorrido_geracao = agora - geracao[2] if geracao else 0.0
+            decorrido_envio = agora - self._inicio_envio if self._inicio_envio is not None else 0.0
+            itens = self._itens
+        fracoes = []
+        restantes = []
+        if total:
+            fracoes.append(feitos / total)
+            if feitos:
+                restantes.append((agora - inicio) / feitos * (total - feitos))
+        if enfileirados:
+            fracoes.append(concluidos / enfileirados)
+            if concluidos:
+                restantes.append(decorrido_envio / concluidos * (enfileirados - concluidos))
+        return {
+            "rotulo": self.rotulo,
+            "etapa": self.etapa,
+            "feitos": feitos,
+            "total": total,
+            "fracao": min(fracoes) if fracoes else 0.0,
+            "itens_por_s": itens / decorrido_geracao if decorrido_geracao > 0 else 0.0,
+            "enviados": concluidos - falhas,
+            "falhas_envio": falhas,
+            "enfileirados": enfileirados,
+            "bytes_por_s": tamanho / decorrido_envio if decorrido_envio > 0 else 0.0,
+            "restante_s": max(restantes) if restantes else None,
+            "cancelado": self.cancelado,
+            "ativo": self.ativo,
+        }
+
+    def texto(self, estado=None):
+        """Uma linha com o progresso, para a janela e o console."""
+        estado = estado or self.instantaneo()
+        partes = [estado["rotulo"]] if estado["rotulo"] else []
+        if estado["etapa"]:
+            partes.append(f"{ETAPAS_PROGRESSO.get(estado['etapa'], estado['etapa'])}: {estado['feitos']}/{estado['total']}")
+        if estado["itens_por_s"]:
+            partes.append(f"{estado['itens_por_s']:.0f} itens/s")
+        if estado["enfileirados"]:
+            falhas = f", {estado['falhas_envio']} falha(s)" if estado["falhas_envio"] else ""
+            partes.append(f"FTP {estado['enviados']}/{estado['enfileirados']}{falhas} ({estado['bytes_por_s'] / 1024:.1f} KiB/s)")
+        if estado["ativo"] and estado["restante_s"] is not None:
+            minutos, segundos = divmod(int(estado["restante_s"] + 0.5), 60)
+            partes.append(f"restante ~{minutos}:{segundos:02d}")
+        if estado["cancelado"]:
+            partes.append("cancelando..." if estado["ativo"] else "cancelado")
+        return " · ".join(partes) or "Aguardando..."
+
+# ==============================================================================
+# NÚCLEO DE GERAÇÃO (SEM DEPENDÊNCIA DE JANELA)
+# ==============================================================================
+class OrderGeneratorCore:
+    """
+    Lógica de geração XML/TXT e envio FTP, independente da interface gráfica.
+    Quem herda define como o usuário é notificado (messagebox, console...) e o
+    que acontece ao final de cada geração. Requer o atributo 'log_queue'.
+    """
+    # Diretórios de saída (podem ser sobrescritos por instância, ex.: via CLI)
+    output_xml_dir = OUTPUT_XML_DIR
+    output_txt_dir = OUTPUT_TXT_DIR
+    # Motor de leitura de planilhas (ver LEITORES_PLANILHA)
+    leitor_planilha = "auto"
+    # Processos para renderizar os pedidos (1 = sequencial na thread atual, 'auto' = todos os núcleos)
+    processos_renderizacao = 1
+    # Conexões FTP simultâneas por envio
+    conexoes_ftp = 4
+    # Pasta dos diários de envio FTP (retomada de envios interrompidos)
+    pasta_diarios_envio = PASTA_DIARIOS_ENVIO
+    # Envia cada arquivo assim que é gravado (False = envia todos ao final da geração)
+    envio_continuo = True
+    # Cópia local dos arquivos enviados por FTP: 'sempre' (grava e envia do disco),
+    # 'depois' (envia da memória e grava em segundo plano) ou 'falhas' (só grava o que não subiu)
+    copia_local = "sempre"
+    # Pasta dos relatórios de métricas de cada execução
+    pasta_relatorios = PASTA_RELATORIOS
+    # Guarda também em disco as planilhas lidas (além do cache em memória da sessão)
+    cache_em_disco = False
+    # Registro dos pedidos gerados/enviados; no modo incremental, pedidos inalterados são pulados
+    arquivo_registro_pedidos = ARQUIVO_REGISTRO_PEDIDOS
+    modo_incremental = False
+    # Planilha com as linhas rejeitadas na pré-validação da última geração
+    arquivo_erros = arquivo_erro_xlsx
+    # Compartilhados pelas planilhas de um lote (ver _generate_lote_logic): pool de processos
+    # de leitura/renderização e numeração dos arquivos de saída. None = próprios de cada geração
+    pool_processos = None
+    sequencia_nomes = None
+    # Progresso ao vivo e pedido de cancelamento da execução (ProgressoGeracao; None = sem acompanhamento)
+    progresso = None
+    # Atributos acima, repassados às partes da geração combinada e do lote (ParteGeracaoCombinada)
+    ATRIBUTOS_CONFIGURACAO = ("output_xml_dir", "output_txt_dir", "leitor_planilha", "processos_renderizacao",
+                              "conexoes_ftp", "pasta_diarios_envio", "envio_continuo", "copia_local",
+                              "pasta_relatorios", "cache_em_disco", "arquivo_registro_pedidos", "modo_incremental",
+                              "arquivo_erros", "pool_processos", "sequencia_nomes", "progresso")
+
+    # --- Ganchos de interação (sobrescritos pela GUI / modo headless) ---
+    def _notificar(self, nivel, titulo, mensagem):
+        """Notifica o usuário. 'nivel' é 'info', 'warning' ou 'error'."""
+        self.log_message_safe(f"[{titulo}] {mensagem}")
+
+    def _abrir_pasta_saida(self, caminho):
+        """Abre a pasta de saída ao final da geração (a GUI abre o explorador)."""
+        pass
+
+    def _ao_finalizar_xml(self):
+        """Chamado ao final de uma geração XML, com ou sem sucesso."""
+        pass
+
+    def _ao_finalizar_txt(self):
+        """Chamado ao final de uma geração TXT, com ou sem sucesso."""
+        pass
+
+    def _ao_finalizar_combinado(self):
+        """Chamado ao final de uma geração combinada (XML + TXT), com ou sem sucesso."""
+        self._ao_finalizar_xml()
+        self._ao_finalizar_txt()
+
+    def _exibir_metricas(self, metricas):
+        """Chamado com as métricas de cada geração (a GUI mostra o resumo em um painel)."""
+        pass
+
+    # --- Lógica de Geração XML (Adaptada do Script 1) ---
+    def _generate_xml_logic(self, arquivo_excel, manual_login, manual_oferta, manual_nome_base, enviar_ftp, df=None):
+        """Lógica principal para ler Excel e gerar arquivos XML ('df': tabela já lida, na geração combinada)."""
+        xml_files_to_upload = []
+        conteudos_memoria = {} # Envio em lote direto da memória: caminho -> bytes
+        process_ok = True
+        fluxo_envio = None
+        registro = None
+        metricas = MetricasExecucao("XML", arquivo_excel)
+        try:
+            uploader_ftp = None
+            if enviar_ftp:
+                # Conecta e faz login em segundo plano enquanto a planilha é lida
+                uploader_ftp = self._criar_uploader_xml()
+                uploader_ftp.aquecer()
+
+            if df is None:
+                motor = escolher_leitor(self.leitor_planilha, arquivo_excel)
+                self.log_message_safe(f"Lendo planilha: {arquivo_excel} (motor: {motor})...")
+                with metricas.fase("leitura"):
+                    df = self._ler_planilha(arquivo_excel, COLUNAS_XML, motor)
+                self.log_message_safe(f"Lido: {len(df)} linhas.")
+            metricas.linhas_lidas = len(df)
+
+            with metricas.fase("validacao"):
+                obrigatorias = {"CNPJ", "EAN", "Quantidade", "Oferta", "NomeArquivo"}
+                col_faltantes = [c for c in obrigatorias if c not in df.columns]
+                if col_faltantes:
+                    raise ValueError(f"Coluna(s) faltando para XML: {', '.join(col_faltantes)}")
+
+                # Pré-validação da planilha inteira: só as linhas limpas chegam ao agrupamento
+                cnpj, cnpjs_corrigidos = corrigir_cnpj(df["CNPJ"])
+                ean = df["EAN"].astype(str).str.strip()
+                quantidade = pd.to_numeric(df["Quantidade"], errors="coerce")
+                quantidade_ok = quantidade.between(1, 1e15) # Limite só para caber em inteiro
+                motivos_ignorados = motivos_rejeicao(df["NomeArquivo"].astype(str).str.strip(), cnpj, ean,
+                                                     quantidade_ok, linhas_vazias(df))
+                limpas = (motivos_ignorados == "").to_numpy()
+                aviso_rejeitadas = self._registrar_rejeitadas("XML", df, motivos_ignorados, int(cnpjs_corrigidos[limpas].sum()))
+                df = df[limpas].assign(CNPJ=cnpj[limpas], EAN=ean[limpas], Quantidade=quantidade[limpas].astype(np.int64))
+
+            self.log_message_safe("Agrupando e gerando XMLs...")
+            arquivos_gerados_count = 0
+
+            # Garante que o diretório base para XML exista
+            criar_diretorios(self.log_queue, self.output_xml_dir)
+            em_memoria = enviar_ftp and self.copia_local != "sempre"
+            registro = self._abrir_registro()
+            destino = destino_registro(uploader_ftp)
+            if enviar_ftp and self.envio_continuo:
+                fluxo_envio = self._iniciar_envio("XML", "xml", uploader_ftp, registro=registro)
+
+            # Cada tarefa leva as linhas de log que a antecedem, para que o log final
+            # saia na mesma ordem com ou sem processos paralelos
+            tarefas = []
+            logs_pendentes = []
+            inalterados = 0
+            sequencia = self.sequencia_nomes or SequenciaNomes()
+            progresso = self.progresso or ProgressoGeracao()
+            with metricas.fase("agrupamento"):
+                pedidos = PedidosCompactos(df, ("CNPJ", "NomeArquivo", "Oferta"), {"EAN": "S13", "Quantidade": np.int64})
+                df = None # Daqui em diante só o modelo compacto é usado
+                itens_grupos = itens_por_grupo(pedidos, ("EAN", "Quantidade")) if registro else [None] * pedidos.numero_grupos
+                progresso.iniciar_etapa("agrupamento", pedidos.numero_grupos)
+                for ((cnpj, nome_base_excel, oferta_excel), inicio, fim), itens_grupo in zip(pedidos.grupos(), itens_grupos):
+                    progresso.avancar("agrupamento") # Ponto de cancelamento entre grupos
+                    cnpj_str = str(cnpj).strip()
+                    nome_base_str = str(nome_base_excel).strip()
+                    oferta_str = str(oferta_excel).strip()
+
+                    login_final = manual_login if manual_login else "pdvlinkmerck"
+                    nome_arquivo_usado = manual_nome_base if manual_nome_base else nome_base_str
+                    codigo_oferta_usado = manual_oferta if manual_oferta else oferta_str
+
+                    chave = f"{cnpj_str}|{nome_arquivo_usado}|{codigo_oferta_usado}"
+                    hash_atual = hash_pedido((cnpj_str, nome_arquivo_usado, codigo_oferta_usado, login_final), itens_grupo) if registro else None
+                    if self.modo_incremental and registro and registro.inalterado("XML", chave, hash_atual, destino, self.output_xml_dir):
+                        logs_pendentes.append(f"⏭ XML de CNPJ={cnpj_str}, Nome={nome_arquivo_usado}, Oferta={codigo_oferta_usado} inalterado desde a última execução (modo incremental).")
+                        motivos_ignorados.loc[pedidos.indice[inicio:fim]] = "pedido_inalterado"
+                        inalterados += 1
+                        continue
+
+                    logs_pendentes.append(f"\n🔧 Gerando XML: CNPJ={cnpj_str}, Nome={nome_arquivo_usado}, Oferta={codigo_oferta_usado}, Login={login_final} ({fim - inicio} itens)")
+                    preparado = self._preparar_xml(cnpj_str, pedidos.colunas["Quantidade"][inicio:fim], pedidos.colunas["EAN"][inicio:fim],
+                                                   nome_arquivo_usado, codigo_oferta_usado, login_final, logs_pendentes, sequencia)
+                    if preparado:
+                        tarefas.append((logs_pendentes, preparado, cnpj_str, nome_arquivo_usado, chave, hash_atual, fim - inicio))
+                        logs_pendentes = []
+            metricas.ignorar_linhas(motivos_ignorados)
+
+            processos = resolver_processos(self.processos_renderizacao)
+            if processos > 1 and len(tarefas) > 1:
+                self.log_message_safe(f"Renderizando {len(tarefas)} pedido(s) XML em {min(processos, len(tarefas))} processo(s)...")
+            resultados = metricas.cronometrar("renderizacao", mapear_tarefas(
+                _tarefa_renderizar_xml, [tarefa[1][1] for tarefa in tarefas], processos, self.pool_processos))
+            progresso.iniciar_etapa("geracao", len(tarefas))
+            for (logs_antes, (path_xml, _), cnpj_str, nome_usado, chave, hash_atual, itens), resultado in zip(tarefas, resultados):
+                for linha in logs_antes:
+                    self.log_message_safe(linha)
+                with metricas.fase("gravacao"):
+                    xml_path = self._gravar_xml(path_xml, resultado, cnpj_str, nome_usado, sequencia, gravar=not em_memoria)
+                if xml_path:
+                    arquivos_gerados_count += 1
+                    metricas.pedidos_gerados += 1
+                    xml_files_to_upload.append(xml_path)
+                    if registro:
+                        registro.registrar_geracao("XML", chave, hash_atual, xml_path, destino)
+                    conteudo_memoria = resultado[0] if em_memoria else None
+                    if fluxo_envio:
+                        with metricas.fase("envio"): # Só bloqueia se a fila de envio estiver cheia
+                            fluxo_envio.enfileirar(xml_path, conteudo_memoria)
+                    elif conteudo_memoria is not None:
+                        conteudos_memoria[xml_path] = conteudo_memoria
+                progresso.avancar("geracao", itens=itens) # Ponto de cancelamento entre arquivos
+            for linha in logs_pendentes:
+                self.log_message_safe(linha)
+            if inalterados:
+                self.log_message_safe(f"\n⏭ {inalterados} pedido(s) XML inalterado(s) pulado(s) (modo incremental).")
+
+            if enviar_ftp and xml_files_to_upload:
+                self.log_message_safe(f"\n--- Iniciando Envio FTP de XML ({len(xml_files_to_upload)} arquivos) ---")
+                self.log_message_safe(f"Destino: {FTP_XML_UPLOAD_HOST}{FTP_XML_UPLOAD_PATH}")
+                try:
+                    with metricas.fase("envio"):
+                        if fluxo_envio is None:
+                            fluxo_envio = self._iniciar_envio("XML", "xml", uploader_ftp, xml_files_to_upload, conteudos_memoria,
+                                                              registro=registro)
+                        resultados = fluxo_envio.concluir()
+                    if any(isinstance(erro, GeracaoCancelada) for _, erro in resultados):
+                        raise GeracaoCancelada("Envio cancelado") # Os não enviados ficam no diário
+                    uploads_ok = 0
+                    for file_path, erro in resultados:
+                        if erro is None:
+                            uploads_ok += 1
+                        else:
+                            self.log_message_safe(f"      ↳ ERRO ao enviar {os.path.basename(file_path)}: {erro}")
+                    self.log_message_safe(f"  Envio FTP concluído. {uploads_ok}/{len(xml_files_to_upload)} OK.")
+                    if uploads_ok < len(xml_files_to_upload):
+                        if fluxo_envio.diario:
+                            self.log_message_safe("  Use 'Retomar Envio' para enviar apenas os arquivos pendentes.")
+                        process_ok = False
+                except ftplib.all_errors as ftp_conn_err:
+                    self.log_message_safe(f"ERRO CRÍTICO FTP (XML): {ftp_conn_err}")
+                    if fluxo_envio and fluxo_envio.diario:
+                        self.log_message_safe("  Use 'Retomar Envio' para enviar apenas os arquivos pendentes.")
+                    self._notificar("error", "Erro FTP (XML)", f"Falha na conexão ou autenticação:\n{ftp_conn_err}")
+                    process_ok = False
+                except Exception as ftp_geral_err:
+                    self.log_message_safe(f"ERRO CRÍTICO FTP (XML): Erro inesperado: {ftp_geral_err}")
+                    import traceback
+                    self.log_message_safe(traceback.format_exc())
+                    self._notificar("error", "Erro FTP Inesperado (XML)", f"Ocorreu um erro inesperado durante o envio FTP:\n\n{ftp_geral_err}")
+                    process_ok = False
+
+            if arquivos_gerados_count > 0:
+                msg_final = f"{arquivos_gerados_count} XML(s) gerado(s)."
+                if enviar_ftp:
+                    msg_final += f"\nEnviado(s) via FTP." if process_ok else "\nErro no envio FTP."
+                else:
+                    msg_final += "\nEnvio FTP não selecionado."
+                if inalterados:
+                    msg_final += f"\n{inalterados} pedido(s) inalterado(s) pulado(s)."
+                msg_final += aviso_rejeitadas
+                self.log_message_safe(f"\n✅ Processo concluído! {msg_final}")
+                self._notificar("info", "Sucesso", msg_final)
+                self._abrir_pasta_saida(self.output_xml_dir)
+            elif inalterados:
+                msg_final = f"Nenhum pedido novo ou alterado.\n{inalterados} pedido(s) XML inalterado(s) pulado(s)."
+                self.log_message_safe(f"\n✅ {msg_final}")
+                self._notificar("info", "Modo incremental", msg_final)
+            else:
+                self.log_message_safe("\n⚠ Nenhum XML gerado.")
+                self._notificar("warning", "Atenção", "Nenhum XML gerado." + aviso_rejeitadas)
+                process_ok = False
+
+        except GeracaoCancelada:
+            self._avisar_cancelamento("XML", metricas.pedidos_gerados, fluxo_envio)
+            process_ok = False
+        except (ValueError, FileNotFoundError, RuntimeError) as e:
+            self.log_message_safe(f"ERRO: {e}")
+            self._notificar("error", "Erro", str(e))
+            process_ok = False
+        except Exception as e:
+            self.log_message_safe(f"❌ Erro inesperado: {e}")
+            import traceback
+            self.log_message_safe(traceback.format_exc())
+            self._notificar("error", "Erro Inesperado", f"Ocorreu um erro:\n{e}")
+            process_ok = False
+        finally:
+            with metricas.fase("envio"):
+                self._encerrar_envio(fluxo_envio)
+            if registro:
+                registro.fechar()
+            self._finalizar_metricas(metricas, fluxo_envio, process_ok)
+            self._ao_finalizar_xml()
+        return process_ok
+
+    def _preparar_xml(self, cnpj, quantidades, eans, nome_base, oferta, login, logs, sequencia):
+        """
+        Define nome e pasta do XML de um grupo e monta o payload compacto de renderização
+        (as fatias de quantidades e EANs do grupo no PedidosCompactos).
+        O sufixo final (_1, _2...) vem da 'sequencia' da execução, para que grupos com o
+        mesmo nome no mesmo segundo não se sobrescrevam. Devolve (caminho, payload) ou
+        None; mensagens de erro vão para a lista 'logs'.
+        """
+        try:
+            agora = datetime.now()
+            dt_str = agora.strftime("%d%m%y")
+            hr_str = agora.strftime("%H%M%S")
+            prefixo = f"pd{login}_{nome_base}_{dt_str}_{hr_str}"
+
+            # Subpasta dentro do diretório XML de saída (criada só na gravação)
+            pasta_destino = os.path.join(self.output_xml_dir, nome_base)
+            path_xml = sequencia.proximo(os.path.join(pasta_destino, prefixo),
+                                         lambda numero: os.path.join(pasta_destino, f"{prefixo}_{numero}.xml"))
+            nome_xml = os.path.basename(path_xml)
+            payload = (cnpj, quantidades, eans, oferta, login, nome_xml, agora)
+            return path_xml, payload
+        except Exception as e:
+            import traceback
+            logs.append(f"  ❌ ERRO FATAL ao gerar XML para CNPJ {cnpj}, Nome {nome_base}: {e}")
+            logs.append(traceback.format_exc())
+            return None
+
+    def _gravar_xml(self, path_xml, resultado, cnpj, nome_base, sequencia, gravar=True):
+        """
+        Grava o XML renderizado (com gravar=False ele fica só em memória, para envio
+        direto). Se outra execução já gravou o mesmo nome, usa o próximo número livre
+        da 'sequencia' (e o NOMEARQ acompanha). Devolve o caminho ou None em caso de erro.
+        """
+        conteudo, erro = resultado
+
+        def renomear(caminho, atual):
+            novo = sequencia.renomear(caminho)
+            self.log_message_safe(f"  AVISO: {os.path.basename(caminho)} já foi gravado por outra execução; "
+                                  f"gravando como {os.path.basename(novo)}.")
+            return novo, trocar_nome_xml(atual, caminho, novo)
+
+        if erro is None and gravar:
+            try:
+                criar_diretorios(self.log_queue, os.path.dirname(path_xml)) # Garante subpasta
+                path_xml = gravar_arquivo(path_xml, conteudo, renomear)
+            except Exception as e:
+                import traceback
+                erro = (str(e), traceback.format_exc())
+        if erro:
+            self.log_message_safe(f"  ❌ ERRO FATAL ao gerar XML para CNPJ {cnpj}, Nome {nome_base}: {erro[0]}")
+            self.log_message_safe(erro[1])
+            return None
+        if gravar:
+            self.log_message_safe(f"  ✅ XML criado: {path_xml}")
+        else:
+            self.log_message_safe(f"  ✅ XML gerado em memória: {os.path.basename(path_xml)}")
+        return path_xml
+
+    # --- Lógica de Geração TXT (Adaptada do Script 2) ---
+    def _generate_txt_logic(self, path, usuario_login, destino, forma_pagamento, enviar_padrao, enviar_pessoal, ftp_user_pessoal, ftp_pass_pessoal, df=None):
+        """Lógica principal para ler Excel e gerar arquivos TXT ('df': tabela já lida, na geração combinada)."""
+        gerados = []
+        process_ok = True
+        fluxo_envio = None
+        registro = None
+        metricas = MetricasExecucao("TXT", path)
+        try:
+            forma_map = {"Boleto": "", "Cartão": "2", "PIX": "1"}
+            forma_cod = forma_map.get(forma_pagamento, "") # Mapeia forma de pagamento para código
+
+            # Conecta e faz login em segundo plano enquanto a planilha é lida
+            uploader_ftp = self._criar_uploader_txt(usuario_login, destino, enviar_padrao, enviar_pessoal,
+                                                    ftp_user_pessoal, ftp_pass_pessoal)
+            if uploader_ftp:
+                uploader_ftp.aquecer()
+
+            if df is None:
+                motor = escolher_leitor(self.leitor_planilha, path)
+                self.log_message_safe(f"Lendo Excel para TXT (motor: {motor})...")
+                with metricas.fase("leitura"):
+                    df = self._ler_planilha(path, COLUNAS_TXT_OBRIGATORIAS + COLUNAS_TXT_OPCIONAIS, motor)
+                self.log_message_safe(f"Lido: {len(df)} linhas.")
+            metricas.linhas_lidas = len(df)
+
+            cols_nec = ["CNPJ", "EAN", "QUANTIDADE", "NOME DO ARQUIVO"]
+            cols_falta = [c for c in cols_nec if c not in df.columns]
+            if cols_falta:
+                raise ValueError(f"Coluna(s) faltando para TXT: {', '.join(cols_falta)}")
+
+            # Garante que o diretório base para TXT exista
+            criar_diretorios(self.log_queue, self.output_txt_dir)
+            credencial_txt = "txt_padrao" if enviar_padrao else "txt_pessoal"
+            em_memoria = uploader_ftp is not None and self.copia_local != "sempre"
+            conteudos_memoria = {} # Envio em lote direto da memória: caminho -> bytes
+            registro = self._abrir_registro()
+            destino_envio = destino_registro(uploader_ftp)
+            if uploader_ftp and self.envio_continuo:
+                fluxo_envio = self._iniciar_envio("TXT", credencial_txt, uploader_ftp, registro=registro)
+
+            arquivos_proc = df["NOME DO ARQUIVO"].dropna().unique()
+            self.log_message_safe(f"Processando {len(arquivos_proc)} pedido(s) TXT...")
+
+            # Normalização e pré-validação dos itens feitas uma única vez para a planilha toda;
+            # só as linhas limpas chegam ao agrupamento
+            with metricas.fase("validacao"):
+                itens = preparar_itens_txt(df)
+                motivos_ignorados = motivos_rejeicao(itens["NOME DO ARQUIVO"].str.strip(), itens["_cnpj"], itens["_ean"],
+                                                     quantidades_txt_ok(itens["_qtd"]), linhas_vazias(df).loc[itens.index])
+                limpas = (motivos_ignorados == "").to_numpy()
+                aviso_rejeitadas = self._registrar_rejeitadas("TXT", df, motivos_ignorados, int(itens["_cnpj_corrigido"][limpas].sum()))
+                itens = itens[limpas]
+            tarefas = []
+            logs_pendentes = []
+            inalterados = 0
+            sequencia = self.sequencia_nomes or SequenciaNomes()
+            progresso = self.progresso or ProgressoGeracao()
+            with metricas.fase("agrupamento"):
+                pedidos = pedidos_txt(itens)
+                itens = None # Daqui em diante só o modelo compacto é usado
+                arquivos = list(pedidos.grupos(niveis=1)) # Um arquivo por 'NOME DO ARQUIVO'
+                # CNPJ e texto da linha 2 cobrem tudo o que o TXT de cada item leva
+                itens_grupos = itens_por_grupo(pedidos, ("CNPJ", "_linha"), niveis=1) if registro else [None] * len(arquivos)
+                progresso.iniciar_etapa("agrupamento", len(arquivos))
+                for ((nome_arq,), inicio, fim), itens_grupo in zip(arquivos, itens_grupos):
+                    progresso.avancar("agrupamento") # Ponto de cancelamento entre grupos
+                    nome_limpo = str(nome_arq).strip().lower()
+                    # Chave pelo nome como está na planilha: nomes que só diferem em maiúsculas são pedidos distintos
+                    chave = str(nome_arq)
+                    hash_atual = hash_pedido((chave, usuario_login, forma_cod), itens_grupo) if registro else None
+                    if self.modo_incremental and registro and registro.inalterado("TXT", chave, hash_atual, destino_envio, self.output_txt_dir):
+                        logs_pendentes.append(f"  ⏭ TXT {nome_limpo} inalterado desde a última execução (modo incremental).")
+                        motivos_ignorados.loc[pedidos.indice[inicio:fim]] = "pedido_inalterado"
+                        inalterados += 1
+                        continue
+                    logs_pendentes.append(f"  Gerando TXT: {nome_limpo}")
+                    preparado = self._preparar_txt(nome_limpo, colunas_txt_do_grupo(pedidos, inicio, fim), usuario_login, forma_cod,
+                                                   logs_pendentes, sequencia)
+                    if preparado:
+                        tarefas.append((logs_pendentes, preparado, nome_limpo, chave, hash_atual, fim - inicio))
+                        logs_pendentes = []
+            metricas.ignorar_linhas(motivos_ignorados)
+
+            processos = resolver_processos(self.processos_renderizacao)
+            if processos > 1 and len(tarefas) > 1:
+                self.log_message_safe(f"Renderizando {len(tarefas)} arquivo(s) TXT em {min(processos, len(tarefas))} processo(s)...")
+            resultados = metricas.cronometrar("renderizacao", mapear_tarefas(
+                _tarefa_renderizar_txt, [tarefa[1][3] for tarefa in tarefas], processos, self.pool_processos))
+            progresso.iniciar_etapa("geracao", len(tarefas))
+            for (logs_antes, (path_txt, pasta_pedido, nome_txt, _), nome_limpo, chave, hash_atual, itens_txt), resultado in zip(tarefas, resultados):
+                for linha in logs_antes:
+                    self.log_message_safe(linha)
+                with metricas.fase("gravacao"):
+                    caminho = self._gravar_txt(path_txt, pasta_pedido, nome_txt, nome_limpo, resultado, sequencia, gravar=not em_memoria)
+                if caminho:
+                    gerados.append(caminho)
+                    if registro:
+                        registro.registrar_geracao("TXT", chave, hash_atual, caminho, destino_envio)
+                    metricas.pedidos_gerados += resultado[2] # Cabeçalhos (linhas 1) escritos no arquivo
+                    conteudo_memoria = resultado[0] if em_memoria else None
+                    if fluxo_envio:
+                        with metricas.fase("envio"): # Só bloqueia se a fila de envio estiver cheia
+                            fluxo_envio.enfileirar(caminho, conteudo_memoria)
+                    elif conteudo_memoria is not None:
+                        conteudos_memoria[caminho] = conteudo_memoria
+                progresso.avancar("geracao", itens=itens_txt) # Ponto de cancelamento entre arquivos
+            for linha in logs_pendentes:
+                self.log_message_safe(linha)
+            if inalterados:
+                self.log_message_safe(f"\n⏭ {inalterados} pedido(s) TXT inalterado(s) pulado(s) (modo incremental).")
+
+            if gerados:
+                if enviar_padrao:
+                    ftp_path = FTP_TXT_PATHS_PADRAO.get(destino)
+                    if not ftp_path:
+                        raise ValueError(f"Path FTP Padrão TXT não configurado para '{destino}'.")
+                    self.log_message_safe(f"\nEnviando {len(gerados)} arq(s) para FTP Padrão TXT ({destino})...")
+                    with metricas.fase("envio"):
+                        fluxo_envio = fluxo_envio or self._iniciar_envio("TXT", credencial_txt, uploader_ftp, gerados, conteudos_memoria,
+                                                                         registro=registro)
+                        self._send_files_ftp(fluxo_envio)
+                elif enviar_pessoal:
+                    ftp_path_pessoal = f"/saptxt/ftp/{usuario_login}/envio"
+                    self.log_message_safe(f"\nEnviando {len(gerados)} arq(s) para FTP Pessoal TXT ({ftp_path_pessoal})...")
+                    with metricas.fase("envio"):
+                        fluxo_envio = fluxo_envio or self._iniciar_envio("TXT", credencial_txt, uploader_ftp, gerados, conteudos_memoria,
+                                                                         registro=registro)
+                        self._send_files_ftp(fluxo_envio)
+            
+            msg_final = f"{len(gerados)} arquivo(s) TXT gerado(s)."
+            if gerados and (enviar_padrao or enviar_pessoal):
+                tipo_envio = "FTP Padrão" if enviar_padrao else "FTP Pessoal"
+                msg_final += f"\nEnviado(s) com sucesso via {tipo_envio}."
+            elif not gerados and (enviar_padrao or enviar_pessoal):
+                msg_final += "\nNenhum arquivo válido foi gerado para enviar via FTP."
+            elif not (enviar_padrao or enviar_pessoal):
+                msg_final += "\nNenhuma opção de envio FTP foi selecionada."
+            if inalterados:
+                msg_final += f"\n{inalterados} pedido(s) inalterado(s) pulado(s) (modo incremental)."
+            msg_final += aviso_rejeitadas
+
+            self._notificar("info", "Concluído", msg_final)
+            if gerados:
+                self._abrir_pasta_saida(self.output_txt_dir)
+            elif not inalterados: # Tudo pulado no modo incremental não é falha
+                process_ok = False
+
+        except GeracaoCancelada:
+            self._avisar_cancelamento("TXT", len(gerados), fluxo_envio)
+            process_ok = False
+        except (ValueError, FileNotFoundError, RuntimeError) as e:
+            self._notificar("error", "Erro", str(e))
+            self.log_message_safe(f"ERRO: {e}")
+            process_ok = False
+        except Exception as e:
+            self._notificar("error", "Erro Inesperado", f"Ocorreu um erro:\n{e}")
+            import traceback
+            self.log_message_safe(f"ERRO INESPERADO: {e}\n{traceback.format_exc()}")
+            process_ok = False
+        finally:
+            with metricas.fase("envio"):
+                self._encerrar_envio(fluxo_envio)
+            if registro:
+                registro.fechar()
+            self._finalizar_metricas(metricas, fluxo_envio, process_ok)
+            self._ao_finalizar_txt()
+        return process_ok
+
+    def _registrar_rejeitadas(self, tipo, df, motivos, cnpjs_corrigidos):
+        """
+        Resume a pré-validação no log e grava as linhas rejeitadas na planilha de erros.
+        Devolve o complemento da mensagem final ('' se nenhuma linha foi rejeitada).
+        """
+        if cnpjs_corrigidos:
+            self.log_message_safe(f"AVISO: {cnpjs_corrigidos} linha(s) com CNPJ de 13 dígitos corrigido(s) com zero à esquerda.")
+        tabela = tabela_rejeitadas(df, motivos)
+        rejeitadas = int((motivos != "").sum())
+        if rejeitadas:
+            self.log_message_safe(f"⚠ {rejeitadas} linha(s) rejeitada(s) na pré-validação ({resumo_rejeicoes(motivos)}).")
+        self._gravar_planilha_erros({tipo: tabela})
+        if not len(tabela):
+            return ""
+        return f"\n{len(tabela)} linha(s) rejeitada(s): veja {os.path.basename(self.arquivo_erros)}."
+
+    def _gravar_planilha_erros(self, tabelas):
+        """Grava a planilha de erros ('tabelas': tipo -> linhas rejeitadas). Falha ao gravar só gera aviso."""
+        try:
+            caminho = gravar_planilha_erros(self.arquivo_erros, tabelas)
+        except Exception as e:
+            self.log_message_safe(f"AVISO: Não foi possível gravar a planilha de erros {self.arquivo_erros}: {e}")
+            return
+        if caminho:
+            self.log_message_safe(f"  Linhas rejeitadas (com o motivo) salvas em: {caminho}")
+
+    def _ler_planilha(self, caminho, colunas, motor):
+        """Lê a planilha pelo cache de tabelas (memória da sessão e, se ativado, disco)."""
+        df, origem = CACHE_PLANILHAS.ler(caminho, colunas, motor, disco=self.cache_em_disco, executor=self.pool_processos)
+        if origem in ("memoria", "disco"):
+            self.log_message_safe(f"  Planilha inalterada: tabela reaproveitada do cache ({'memória' if origem == 'memoria' else 'disco'}).")
+        elif origem == "parcial":
+            self.log_message_safe("  Planilha inalterada: só as colunas que faltavam no cache foram lidas.")
+        return df
+
+    def _finalizar_metricas(self, metricas, fluxo, sucesso):
+        """Fecha as métricas da geração, registra o resumo no log e salva o relatório."""
+        metricas.registrar_envio(fluxo)
+        metricas.finalizar(sucesso)
+        self.log_message_safe(f"\n📊 Métricas: {metricas.resumo()}")
+        try:
+            self.log_message_safe(f"Relatório da execução: {metricas.salvar(self.pasta_relatorios)}")
+        except OSError as e:
+            self.log_message_safe(f"AVISO: Não foi possível salvar o relatório da execução: {e}")
+        self._exibir_metricas(metricas)
+
+    def _avisar_cancelamento(self, tipo, gerados, fluxo):
+        """Registra e notifica uma geração cancelada. O que já foi gerado fica; o que não subiu fica no diário."""
+        mensagem = f"Geração {tipo} cancelada. {gerados} arquivo(s) gerado(s) antes do cancelamento foram mantidos."
+        if fluxo is not None and fluxo.diario:
+            mensagem += "\nOs arquivos não enviados ficam pendentes: use 'Retomar Envio' para enviá-los."
+        self.log_message_safe(f"\n⏹ {mensagem}")
+        self._notificar("warning", "Cancelado", mensagem)
+
+    # --- Geração combinada (XML + TXT com uma única leitura) ---
+    def _generate_ambos_logic(self, path, manual_login, manual_oferta, manual_nome_base, enviar_xml_ftp,
+                              usuario_login, destino, forma_pagamento, enviar_padrao, enviar_pessoal,
+                              ftp_user_pessoal, ftp_pass_pessoal, df=None):
+        """
+        Lê a planilha uma única vez, monta as entradas dos dois formatos sobre os mesmos
+        dados (tabelas_por_formato) e gera XML e TXT em paralelo, uma thread para cada.
+        ('df': tabela já lida, no lote de planilhas.)
+        """
+        process_ok = False
+        try:
+            if df is None:
+                motor = escolher_leitor(self.leitor_planilha, path)
+                self.log_message_safe(f"Lendo planilha para XML e TXT: {path} (motor: {motor})...")
+                inicio = time.perf_counter()
+                df = self._ler_planilha(path, COLUNAS_POR_MODO["AMBOS"], motor)
+                self.log_message_safe(f"Lido: {len(df)} linhas em {time.perf_counter() - inicio:.2f}s.")
+
+            df_xml, df_txt = tabelas_por_formato(df)
+            faltando = ([c for c in COLUNAS_XML if c not in df_xml.columns]
+                        + [c for c in COLUNAS_TXT_OBRIGATORIAS if c not in df_txt.columns])
+            if faltando:
+                raise ValueError(f"Coluna(s) faltando para XML + TXT: {', '.join(faltando)}")
+
+            partes = {"XML": ParteGeracaoCombinada(self, "XML"), "TXT": ParteGeracaoCombinada(self, "TXT")}
+            resultados = {}
+            def gerar_txt():
+                resultados["TXT"] = partes["TXT"]._generate_txt_logic(
+                    path, usuario_login, destino, forma_pagamento, enviar_padrao, enviar_pessoal,
+                    ftp_user_pessoal, ftp_pass_pessoal, df=df_txt)
+            thread_txt = threading.Thread(target=gerar_txt, daemon=True)
+            thread_txt.start()
+            resultados["XML"] = partes["XML"]._generate_xml_logic(
+                path, manual_login, manual_oferta, manual_nome_base, enviar_xml_ftp, df=df_xml)
+            thread_txt.join()
+            process_ok = all(resultados.get(tipo, False) for tipo in partes)
+            # Uma única planilha de erros, com uma aba por formato
+            self._gravar_planilha_erros({tipo: tabela for parte in partes.values() for tipo, tabela in parte.rejeitadas.items()})
+            self._notificar_combinado(partes)
+        except (ValueError, FileNotFoundError) as e:
+            self.log_message_safe(f"ERRO: {e}")
+            self._notificar("error", "Erro", str(e))
+        except Exception as e:
+            self.log_message_safe(f"❌ Erro inesperado: {e}")
+            import traceback
+            self.log_message_safe(traceback.format_exc())
+            self._notificar("error", "Erro Inesperado", f"Ocorreu um erro:\n{e}")
+        finally:
+            self._ao_finalizar_combinado()
+        return process_ok
+
+    def _notificar_combinado(self, partes):
+        """Junta as notificações das partes XML e TXT em um único aviso e abre a pasta de saída comum."""
+        niveis = ["info", "warning", "error"]
+        notas = [(tipo, nivel, mensagem) for tipo, parte in partes.items() for nivel, _, mensagem in parte.notificacoes]
+        if notas:
+            nivel = max((n for _, n, _ in notas), key=niveis.index)
+            titulo = {"info": "Concluído", "warning": "Atenção", "error": "Erro"}[nivel]
+            self._notificar(nivel, f"XML + TXT: {titulo}", "\n\n".join(f"{tipo}: {mensagem}" for tipo, _, mensagem in notas))
+        pastas = [pasta for parte in partes.values() for pasta in parte.pastas_saida]
+        if pastas:
+            try:
+                self._abrir_pasta_saida(os.path.commonpath(pastas))
+            except ValueError: # Pastas em unidades diferentes
+                self._abrir_pasta_saida(pastas[0])
+
+    # --- Lote de planilhas (várias planilhas em uma única execução) ---
+    def _generate_lote_logic(self, modo, planilhas, *parametros):
+        """
+        Gera os pedidos de várias planilhas em uma execução. 'modo' é 'XML', 'TXT' ou 'AMBOS'
+        e 'parametros' são os da geração avulsa desse modo, sem a planilha. As planilhas são
+        geradas uma após a outra, mas compartilham o pool de processos (leitura e
+        renderização), a numeração dos arquivos e as sessões FTP do pool; a próxima planilha
+        é lida enquanto a atual é gerada e enviada. Ao final há um único aviso, uma única
+        planilha de erros e um relatório de métricas do lote inteiro.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        gerar = {"XML": "_generate_xml_logic", "TXT": "_generate_txt_logic", "AMBOS": "_generate_ambos_logic"}[modo]
+        metricas = MetricasExecucao(f"LOTE_{modo}", f"{len(planilhas)} planilha(s)")
+        partes = []
+        linhas_lidas = 0
+        process_ok = False
+        pool = None
+        leitura = ThreadPoolExecutor(max_workers=1) # Leitura antecipada da próxima planilha
+        try:
+            self.log_message_safe(f"Lote de {len(planilhas)} planilha(s) ({'XML + TXT' if modo == 'AMBOS' else modo}).")
+            processos = resolver_processos(self.processos_renderizacao)
+            if processos > 1:
+                from concurrent.futures import ProcessPoolExecutor
+                pool = ProcessPoolExecutor(max_workers=processos)
+                self.log_message_safe(f"Leitura e renderização em {processos} processo(s), compartilhados por todas as planilhas.")
+            sequencia = SequenciaNomes()
+
+            def ler(caminho):
+                motor = escolher_leitor(self.leitor_planilha, caminho)
+                return CACHE_PLANILHAS.ler(caminho, COLUNAS_POR_MODO[modo], motor, disco=self.cache_em_disco, executor=pool)
+
+            proxima = leitura.submit(ler, planilhas[0])
+            for i, planilha in enumerate(planilhas):
+                if self.progresso is not None:
+                    if self.progresso.cancelado:
+                        self.log_message_safe(f"\n⏹ Lote cancelado: {len(planilhas) - i} planilha(s) não processada(s).")
+                        break
+                    self.progresso.reiniciar(f"Planilha {i + 1}/{len(planilhas)}")
+                self.log_message_safe(f"\n=== Planilha {i + 1}/{len(planilhas)}: {planilha} ===")
+                parte = ParteLote(self, planilha, pool, sequencia)
+                partes.append(parte)
+                df = None
+                try:
+                    with metricas.fase("leitura"): # Só o tempo em que a geração ficou esperando a leitura
+                        df, origem = proxima.result()
+                except Exception as e:
+                    parte.log_message_safe(f"ERRO ao ler a planilha: {e}")
+                    parte._notificar("error", "Erro", f"Falha ao ler a planilha: {e}")
+                if i + 1 < len(planilhas):
+                    proxima = leitura.submit(ler, planilhas[i + 1])
+                if df is None:
+                    continue
+                em_cache = " (tabela reaproveitada do cache)" if origem in ("memoria", "disco") else ""
+                parte.log_message_safe(f"Lido: {len(df)} linhas{em_cache}.")
+                linhas_lidas += len(df)
+                parte.sucesso = getattr(parte, gerar)(planilha, *parametros, df=df)
+                del df # Só a planilha atual e a próxima ficam em memória
+
+            nao_processadas = len(planilhas) - len(partes) # Lote cancelado
+            process_ok = not nao_processadas and all(parte.sucesso for parte in partes)
+            aviso_rejeitadas = self._gravar_rejeitadas_lote(partes)
+            self._notificar_lote(partes, aviso_rejeitadas, nao_processadas)
+        except Exception as e:
+            self.log_message_safe(f"❌ Erro inesperado no lote: {e}")
+            import traceback
+            self.log_message_safe(traceback.format_exc())
+            self._notificar("error", "Erro Inesperado", f"Ocorreu um erro no lote:\n{e}")
+            process_ok = False
+        finally:
+            leitura.shutdown(wait=True)
+            if pool is not None:
+                pool.shutdown()
+            for parte in partes:
+                for metricas_parte in parte.metricas:
+                    metricas.acumular(metricas_parte)
+            metricas.linhas_lidas = linhas_lidas # No modo AMBOS cada planilha tem duas gerações
+            self._finalizar_metricas(metricas, None, process_ok)
+            {"XML": self._ao_finalizar_xml, "TXT": self._ao_finalizar_txt, "AMBOS": self._ao_finalizar_combinado}[modo]()
+        return process_ok
+
+    def _gravar_rejeitadas_lote(self, partes):
+        """
+        Grava uma única planilha de erros para o lote (uma aba por formato, com a planilha
+        de origem de cada linha). Devolve o complemento da mensagem final.
+        """
+        abas = {}
+        for parte in partes:
+            for tipo, tabela in parte.rejeitadas.items():
+                if len(tabela):
+                    tabela.insert(0, "PLANILHA", os.path.basename(parte.planilha))
+                    abas.setdefault(tipo, []).append(tabela)
+        tabelas = {tipo: pd.concat(lista, ignore_index=True).fillna("") for tipo, lista in abas.items()}
+        self._gravar_planilha_erros(tabelas)
+        rejeitadas = sum(len(tabela) for tabela in tabelas.values())
+        if not rejeitadas:
+            return ""
+        return f"\n{rejeitadas} linha(s) rejeitada(s): veja {os.path.basename(self.arquivo_erros)}."
+
+    def _notificar_lote(self, partes, aviso_rejeitadas, nao_processadas=0):
+        """
+        Resume o lote no log (uma linha por planilha) e em um único aviso; abre a pasta de
+        saída comum. 'nao_processadas': planilhas que ficaram de fora por cancelamento.
+        """
+        niveis = ["info", "warning", "error"]
+        self.log_message_safe(f"\n=== Resumo do lote: {len(partes)} planilha(s) ===")
+        problemas = []
+        for parte in partes:
+            nome = os.path.basename(parte.planilha)
+            pedidos = sum(m.pedidos_gerados for m in parte.metricas)
+            if parte.sucesso:
+                self.log_message_safe(f"  ✅ {nome}: {pedidos} pedido(s) gerado(s).")
+                continue
+            nivel, _, mensagem = max(parte.notificacoes, key=lambda nota: niveis.index(nota[0]),
+                                     default=("error", "", "Geração não concluída."))
+            resumo = " ".join(mensagem.split())
+            self.log_message_safe(f"  {'❌' if nivel == 'error' else '⚠'} {nome}: {resumo}")
+            problemas.append(f"{nome}: {resumo[:150]}")
+
+        ok = len(partes) - len(problemas)
+        pedidos = sum(m.pedidos_gerados for parte in partes for m in parte.metricas)
+        enviados = sum(m.arquivos_enviados for parte in partes for m in parte.metricas)
+        falhas = sum(m.falhas_envio for parte in partes for m in parte.metricas)
+        mensagem = f"{ok} de {len(partes)} planilha(s) processada(s) sem erros.\n{pedidos} pedido(s) gerado(s)."
+        if enviados or falhas:
+            mensagem += f"\n{enviados} arquivo(s) enviado(s) via FTP" + (f", {falhas} com falha." if falhas else ".")
+        if problemas:
+            # Lotes grandes: o aviso lista só as primeiras; o log acima tem todas
+            mensagem += "\n\nCom problemas:\n" + "\n".join(problemas[:10])
+            if len(problemas) > 10:
+                mensagem += f"\n... e mais {len(problemas) - 10} (veja o log)."
+        if nao_processadas:
+            mensagem += f"\n\nLote cancelado: {nao_processadas} planilha(s) não processada(s)."
+        mensagem += aviso_rejeitadas
+        fim = "Lote cancelado!" if nao_processadas else "Lote concluído!"
+        self.log_message_safe(f"\n{'✅' if not problemas and not nao_processadas else '⚠'} {fim} {mensagem}")
+        if not problemas and not nao_processadas:
+            self._notificar("info", "Lote: Concluído", mensagem)
+        else:
+            self._notificar("error" if not ok else "warning", "Lote: Atenção", mensagem)
+        pastas = list(dict.fromkeys(pasta for parte in partes for pasta in parte.pastas_saida))
+        if pastas:
+            try:
+                self._abrir_pasta_saida(os.path.commonpath(pastas))
+            except ValueError: # Pastas em unidades diferentes
+                self._abrir_pasta_saida(pastas[0])
+
+    def _criar_uploader(self, host, port, user, password, remote_path, timeout=60, criar_diretorio=False):
+        """Cria o enviador FTP com o número de conexões configurado, registrando no log desta geração."""
+        try:
+            conexoes = max(1, int(self.conexoes_ftp))
+        except (TypeError, ValueError):
+            conexoes = 1
+        return FtpUploader(host, port, user, password, remote_path, conexoes=conexoes, timeout=timeout,
+                           criar_diretorio=criar_diretorio, log=self.log_message_safe)
+
+    def _criar_uploader_xml(self):
+        """Enviador FTP dos XMLs (pasta do portal)."""
+        return self._criar_uploader(FTP_XML_UPLOAD_HOST, FTP_XML_UPLOAD_PORT, FTP_XML_UPLOAD_USER,
+                                    FTP_XML_UPLOAD_PASS, FTP_XML_UPLOAD_PATH, timeout=60)
+
+    def _criar_uploader_txt(self, usuario_login, destino, enviar_padrao, enviar_pessoal, ftp_user_pessoal, ftp_pass_pessoal):
+        """Enviador FTP dos TXTs: pasta padrão do destino ou pasta pessoal do usuário (None = sem envio)."""
+        if enviar_padrao and FTP_TXT_PATHS_PADRAO.get(destino):
+            return self._criar_uploader(FTP_TXT_UPLOAD_HOST, FTP_TXT_UPLOAD_PORT, FTP_TXT_USER_PADRAO, FTP_TXT_PASS_PADRAO,
+                                        FTP_TXT_PATHS_PADRAO[destino], timeout=30, criar_diretorio=True)
+        if enviar_pessoal:
+            return self._criar_uploader(FTP_TXT_UPLOAD_HOST, FTP_TXT_UPLOAD_PORT, ftp_user_pessoal, ftp_pass_pessoal,
+                                        f"/saptxt/ftp/{usuario_login}/envio", timeout=30, criar_diretorio=True)
+        return None
+
+    def _criar_diario_envio(self, tipo, credencial, uploader):
+        """Cria o diário deste envio. Se não for possível gravá-lo, o envio segue sem retomada."""
+        try:
+            diario = DiarioEnvio.criar(self.pasta_diarios_envio, tipo, credencial, uploader)
+        except OSError as e:
+            self.log_message_safe(f"  AVISO: Não foi possível criar o diário de envio ({e}). O envio continua sem opção de retomada.")
+            return None
+        self.log_message_safe(f"  Diário de envio: {diario.caminho}")
+        return diario
+
+    def _iniciar_envio(self, tipo, credencial, uploader, arquivos=None, conteudos=None, registro=None):
+        """
+        Abre o diário e a fila de envio. Sem 'arquivos', o envio é contínuo: quem gera
+        chama fluxo.enfileirar() a cada arquivo gravado e o upload acontece em paralelo.
+        'conteudos' (caminho -> bytes) envia da memória os arquivos que não foram gravados.
+        O resultado de cada arquivo também vai para o 'registro' de pedidos, se houver.
+        """
+        diario = self._criar_diario_envio(tipo, credencial, uploader)
+        ao_concluir = registro.registrar_envio if registro is not None else None
+        if self.copia_local != "sempre":
+            modo = "gravada em segundo plano" if self.copia_local == "depois" else "só dos que falharem"
+            self.log_message_safe(f"Envio direto da memória (cópia local {modo}).")
+        if arquivos is None:
+            self.log_message_safe(f"Envio FTP contínuo: cada arquivo sobe assim que é gravado ({uploader.conexoes} conexão(ões)).")
+            return FluxoEnvio(uploader, diario=diario, copia_local=self.copia_local, ao_concluir=ao_concluir,
+                              progresso=self.progresso)
+        self.log_message_safe(f"  Enviando arquivos ({min(uploader.conexoes, len(arquivos))} conexão(ões))...")
+        fluxo = FluxoEnvio(uploader, diario=diario, limite=len(arquivos), conexoes=min(uploader.conexoes, len(arquivos)),
+                           copia_local=self.copia_local, ao_concluir=ao_concluir, progresso=self.progresso)
+        for arquivo in arquivos:
+            fluxo.enfileirar(arquivo, conteudos.get(arquivo) if conteudos else None)
+        return fluxo
+
+    def _abrir_registro(self):
+        """Abre o registro de pedidos. Se não for possível, a geração segue sem ele (e sem modo incremental)."""
+        import sqlite3
+        try:
+            return RegistroPedidos(self.arquivo_registro_pedidos, log=self.log_message_safe)
+        except (sqlite3.Error, OSError) as e:
+            aviso = " Todos os pedidos serão gerados." if self.modo_incremental else ""
+            self.log_message_safe(f"AVISO: Registro de pedidos indisponível ({e}).{aviso}")
+            return None
+
+    def _encerrar_envio(self, fluxo):
+        """Ao sair da geração (inclusive por erro), espera os envios já enfileirados terminarem."""
+        if fluxo is None or fluxo.concluido:
+            return
+        try:
+            fluxo.concluir()
+        except ftplib.all_errors:
+            pass # Os arquivos ficam no diário para 'Retomar Envio'
+
+    def _send_files_ftp(self, fluxo):
+        """Espera o fim dos envios do fluxo; qualquer arquivo não enviado vira RuntimeError."""
+        dica_retomar = "\nUse 'Retomar Envio' para enviar apenas os pendentes." if fluxo.diario else ""
+        try:
+            resultados = fluxo.concluir()
+            if any(isinstance(erro, GeracaoCancelada) for _, erro in resultados):
+                raise GeracaoCancelada("Envio cancelado") # Os não enviados ficam no diário
+            falhas = [(arq, erro) for arq, erro in resultados if erro is not None]
+            for arq, erro in falhas:
+                self.log_message_safe(f"      ↳ ERRO ao enviar {os.path.basename(arq)}: {erro}")
+            if falhas:
+                raise RuntimeError(f"Erro de FTP: {len(falhas)} de {len(resultados)} arquivo(s) não enviado(s). Último erro: {falhas[-1][1]}{dica_retomar}")
+            self.log_message_safe("Envio FTP concluído.")
+        except RuntimeError:
+            raise
+        except ftplib.all_errors as e:
+            self.log_message_safe(f"ERRO CRÍTICO no envio FTP: {e}")
+            raise RuntimeError(f"Erro de FTP: {e}{dica_retomar}")
+        except Exception as e:
+            self.log_message_safe(f"ERRO INESPERADO no envio FTP: {e}")
+            raise RuntimeError(f"Erro inesperado durante o envio FTP: {e}")
+
+    # --- Retomada de envios FTP interrompidos ---
+    def _retomar_envio_logic(self, caminho_diario=None, tipo=None, ftp_pass_pessoal=""):
+        """
+        Reenvia apenas os arquivos pendentes ou com falha de um diário de envio
+        (o mais recente do 'tipo' informado, se nenhum caminho for dado).
+        """
+        process_ok = True
+        tipo_envio = tipo
+        registro = None
+        try:
+            if caminho_diario:
+                diario = DiarioEnvio.carregar(caminho_diario)
+            else:
+                diario = localizar_diario_pendente(self.pasta_diarios_envio, tipo)
+                if diario is None:
+                    self.log_message_safe("Nenhum envio FTP pendente encontrado.")
+                    self._notificar("info", "Retomar Envio", "Nenhum envio FTP pendente encontrado.")
+                    return True
+            cab = diario.cabecalho
+            tipo_envio = cab["tipo"]
+            pendentes = diario.pendentes()
+            self.log_message_safe(f"Diário de envio: {diario.caminho} ({cab['criado_em']})")
+            if not pendentes:
+                self.log_message_safe("Todos os arquivos deste diário já foram enviados.")
+                self._notificar("info", "Retomar Envio", "Todos os arquivos deste envio já foram enviados.")
+                return True
+
+            senhas = {"xml": FTP_XML_UPLOAD_PASS, "txt_padrao": FTP_TXT_PASS_PADRAO, "txt_pessoal": ftp_pass_pessoal}
+            senha = senhas.get(cab["credencial"])
+            if not senha:
+                raise ValueError("Informe a senha do FTP pessoal para retomar este envio.")
+
+            # Só reenvia o que continua igual ao que foi gerado
+            arquivos_ok = []
+            for arquivo in pendentes:
+                if not os.path.exists(arquivo):
+                    motivo = "arquivo local não encontrado"
+                elif calcular_sha256(arquivo) != diario.sha256(arquivo):
+                    motivo = "arquivo alterado desde a geração"
+                else:
+                    arquivos_ok.append(arquivo)
+                    continue
+                self.log_message_safe(f"  AVISO: {os.path.basename(arquivo)} não será reenviado: {motivo}.")
+                diario.registrar(arquivo, motivo)
+
+            self.log_message_safe(f"\n--- Retomando Envio FTP de {tipo_envio} ({len(arquivos_ok)} de {len(diario.arquivos)} arquivos) ---")
+            self.log_message_safe(f"Destino: {cab['host']}{cab['remote_path']}")
+            if arquivos_ok:
+                uploader = self._criar_uploader(cab["host"], cab["port"], cab["user"], senha, cab["remote_path"],
+                                                timeout=cab["timeout"], criar_diretorio=cab["criar_diretorio"])
+                self.log_message_safe(f"  Enviando arquivos ({min(uploader.conexoes, len(arquivos_ok))} conexão(ões))...")
+                registro = self._abrir_registro() # Atualiza a situação dos pedidos reenviados
+                fluxo = FluxoEnvio(uploader, diario=diario, limite=len(arquivos_ok), conexoes=min(uploader.conexoes, len(arquivos_ok)),
+                                   ao_concluir=registro.registrar_envio if registro else None, progresso=self.progresso)
+                for arquivo in arquivos_ok:
+                    fluxo.enfileirar(arquivo)
+                self._send_files_ftp(fluxo)
+            if len(arquivos_ok) < len(pendentes):
+                raise RuntimeError(f"{len(pendentes) - len(arquivos_ok)} arquivo(s) pendente(s) não puderam ser reenviados (ausentes ou alterados).")
+
+            msg_final = f"{len(arquivos_ok)} arquivo(s) pendente(s) enviado(s) via FTP."
+            self.log_message_safe(f"\n✅ {msg_final}")
+            self._notificar("info", "Retomar Envio", msg_final)
+        except GeracaoCancelada:
+            msg_final = f"Envio cancelado. {len(diario.pendentes())} arquivo(s) continuam pendentes no diário."
+            self.log_message_safe(f"\n⏹ {msg_final}")
+            self._notificar("warning", "Cancelado", msg_final)
+            process_ok = False
+        except (ValueError, FileNotFoundError, RuntimeError) as e:
+            self.log_message_safe(f"ERRO: {e}")
+            self._notificar("error", "Erro", str(e))
+            process_ok = False
+        except Exception as e:
+            self.log_message_safe(f"❌ Erro inesperado: {e}")
+            import traceback
+            self.log_message_safe(traceback.format_exc())
+            self._notificar("error", "Erro Inesperado", f"Ocorreu um erro:\n{e}")
+            process_ok = False
+        finally:
+            if registro:
+                registro.fechar()
+            if tipo_envio == "TXT":
+                self._ao_finalizar_txt()
+            else:
+                self._ao_finalizar_xml()
+        return process_ok
+
+    def _preparar_txt(self, nome_arquivo_base, colunas, usuario, forma_pagamento_codigo, logs, sequencia):
+        """
+        Define nome e pasta do TXT de um 'NOME DO ARQUIVO' e monta o payload compacto
+        de renderização ('colunas': ver colunas_txt_do_grupo). Se o nome já foi usado
+        nesta execução (nomes que só diferem em maiúsculas ou em caracteres inválidos),
+        acrescenta _2, _3... conforme a 'sequencia'. Devolve (caminho, pasta, nome,
+        payload) ou None; mensagens de erro vão para a lista 'logs'.
+        """
+        try:
+            dt_now = datetime.now()
+            dt_str = dt_now.strftime("%d%m%y_%H%M%S")
+            hr_str = dt_now.strftime("%H%M%S")
+            nome_sanitizado = re.sub(r'[<>:"/\\|?*]', '_', nome_arquivo_base)
+
+            # Subpasta dentro do diretório TXT de saída (criada só na gravação)
+            pasta_pedido = os.path.join(self.output_txt_dir, nome_sanitizado)
+
+            prefixo = f"pd{usuario}_{nome_sanitizado}_{dt_str}"
+            path_txt = sequencia.proximo(os.path.join(pasta_pedido, prefixo), lambda numero: os.path.join(
+                pasta_pedido, f"{prefixo}.txt" if numero == 1 else f"{prefixo}_{numero}.txt"))
+            nome_txt = os.path.basename(path_txt)
+
+            logs.append(f"    -> Preparando para salvar TXT em: {path_txt}")
+            payload = (nome_arquivo_base, nome_sanitizado, colunas, usuario, forma_pagamento_codigo, hr_str)
+            return path_txt, pasta_pedido, nome_txt, payload
+        except Exception as e:
+            import traceback
+            logs.append(f"ERRO CRÍTICO ao gerar TXT '{nome_arquivo_base}': {e}")
+            logs.append(traceback.format_exc())
+            return None
+
+    def _gravar_txt(self, path_txt, pasta_pedido, nome_txt, nome_arquivo_base, resultado, sequencia, gravar=True):
+        """
+        Grava o TXT renderizado (uma única escrita; com gravar=False ele fica só em
+        memória, para envio direto). 'resultado': (bytes, erro, pedidos) de
+        _tarefa_renderizar_txt. Se outra execução já gravou o mesmo nome, usa o próximo
+        número livre da 'sequencia'. Devolve o caminho ou None.
+        """
+        conteudo, erro, _ = resultado
+        if erro:
+            self.log_message_safe(f"ERRO CRÍTICO ao gerar TXT '{nome_arquivo_base}': {erro[0]}")
+            self.log_message_safe(erro[1])
+            return None
+
+        if not conteudo:
+            self.log_message_safe(f"ERRO: Arquivo TXT '{nome_txt}' não foi gerado pois não continha nenhum CNPJ ou item válido na planilha para este 'NOME DO ARQUIVO'.")
+            return None # Nada a gravar (a pasta do pedido nem chega a ser criada)
+        if not gravar:
+            return path_txt
+
+        def renomear(caminho, atual):
+            novo = sequencia.renomear(caminho)
+            self.log_message_safe(f"      AVISO: {os.path.basename(caminho)} já foi gravado por outra execução; "
+                                  f"gravando como {os.path.basename(novo)}.")
+            return novo, atual
+
+        try:
+            criar_diretorios(self.log_queue, pasta_pedido)
+            path_txt = gravar_arquivo(path_txt, conteudo, renomear)
+        except Exception as e:
+            import traceback
+            self.log_message_safe(f"ERRO CRÍTICO ao gerar TXT '{nome_arquivo_base}': {e}")
+            self.log_message_safe(traceback.format_exc())
+            return None
+        return path_txt
+
+    # --- Métodos de Logging ---
+    def log_message_safe(self, message):
+        """Adiciona uma mensagem à fila de logs de forma segura para threads."""
+        try:
+            self.log_queue.put(str(message))
+        except Exception as e:
+            print(f"Erro ao adicionar à fila de log: {e}")
+
+
+class ParteGeracaoCombinada(OrderGeneratorCore):
+    """
+    Uma das metades (XML ou TXT) da geração combinada. Usa a configuração do gerador
+    principal, prefixa os logs com o formato e guarda notificações, pastas de saída e
+    linhas rejeitadas para que o principal dê um único aviso (e grave uma única
+    planilha de erros) ao final.
+    """
+    def __init__(self, principal, tipo):
+        for atributo in self.ATRIBUTOS_CONFIGURACAO:
+            setattr(self, atributo, getattr(principal, atributo))
+        self.principal = principal
+        self.log_queue = principal.log_queue
+        self.prefixo = f"[{tipo}] "
+        self.notificacoes = []
+        self.pastas_saida = []
+        self.rejeitadas = {}
+
+    def log_message_safe(self, message):
+        texto = str(message)
+        corpo = texto.lstrip("\n")
+        self.principal.log_message_safe(texto[:len(texto) - len(corpo)] + self.prefixo + corpo)
+
+    def _notificar(self, nivel, titulo, mensagem):
+        self.notificacoes.append((nivel, titulo, mensagem))
+
+    def _abrir_pasta_saida(self, caminho):
+        self.pastas_saida.append(caminho)
+
+    def _gravar_planilha_erros(self, tabelas):
+        self.rejeitadas.update(tabelas)
+
+    def _exibir_metricas(self, metricas):
+        self.principal._exibir_metricas(metricas)
+
+
+class ParteLote(ParteGeracaoCombinada):
+    """
+    A geração de uma das planilhas de um lote. Como a parte da geração combinada, guarda
+    notificações, pastas de saída e linhas rejeitadas para o resumo único do lote, e também
+    as métricas (o painel mostra só as do lote). Usa o pool de processos e a numeração de
+    arquivos do lote. Os logs não levam prefixo: cada planilha tem um cabeçalho no log.
+    """
+    def __init__(self, principal, planilha, pool_processos, sequencia_nomes):
+        super().__init__(principal, "")
+        self.prefixo = ""
+        self.planilha = planilha
+        self.pool_processos = pool_processos
+        self.sequencia_nomes = sequencia_nomes
+        self.metricas = []
+        self.sucesso = False
+
+    def _exibir_metricas(self, metricas):
+        self.metricas.append(metricas)
+
+
+class GeradorDelegado(OrderGeneratorCore):
+    """
+    Roda uma geração (ou retomada de envio) em nome de um gerador principal, com a
+    configuração copiada dele no momento do pedido e progresso próprio. É o que a fila de
+    execuções da janela executa: várias podem estar em andamento ao mesmo tempo sem
+    disputar os atributos do principal. Log, avisos, pasta de saída e métricas vão para
+    o principal; a planilha de erros é a do modo da execução ('tipo' entra no nome dela).
+    """
+    def __init__(self, principal, progresso, tipo):
+        for atributo in self.ATRIBUTOS_CONFIGURACAO:
+            setattr(self, atributo, getattr(principal, atributo))
+        self.arquivo_erros = caminho_erros_execucao(principal.arquivo_erros, tipo)
+        self.principal = principal
+        self.log_queue = principal.log_queue
+        self.progresso = progresso
+
+    def _notificar(self, nivel, titulo, mensagem):
+        self.principal._notificar(nivel, titulo, mensagem)
+
+    def _abrir_pasta_saida(self, caminho):
+        self.principal._abrir_pasta_saida(caminho)
+
+    def _exibir_metricas(self, metricas):
+        self.principal._exibir_metricas(metricas)
+
+
+# ==============================================================================
+# FILA DE EXECUÇÕES (AGENDADOR DAS GERAÇÕES DA JANELA)
+# ==============================================================================
+# Saídas ocupadas por cada modo de geração (e pela retomada de envio do mesmo tipo)
+RECURSOS_POR_MODO = {"XML": ("XML",), "TXT": ("TXT",), "AMBOS": ("XML", "TXT")}
+
+class ExecucaoAgendada:
+    """
+    Uma execução da fila (geração avulsa, combinada, lote ou retomada de envio) e seu
+    ciclo de vida: na fila -> executando -> concluída, com erros ou cancelada (ou direto
+    na fila -> cancelada). 'recursos' são as saídas que ela ocupa ('XML', 'TXT'):
+    execuções com algum recurso em comum rodam uma depois da outra.
+    """
+    NA_FILA = "na_fila"
+    EXECUTANDO = "executando"
+    CONCLUIDA = "concluida"
+    FALHOU = "falhou"
+    CANCELADA = "cancelada"
+    TRANSICOES = {NA_FILA: (EXECUTANDO, CANCELADA), EXECUTANDO: (CONCLUIDA, FALHOU, CANCELADA)}
+    NOMES = {NA_FILA: "na fila", EXECUTANDO: "executando", CONCLUIDA: "concluída", FALHOU: "com erros",
+             CANCELADA: "cancelada"}
+
+    def __init__(self, numero, descricao, recursos, alvo, argumentos, progresso):
+        self.numero = numero
+        self.descricao = descricao
+        self.recursos = frozenset(recursos)
+        self.alvo = alvo
+        self.argumentos = tuple(argumentos)
+        self.progresso = progresso
+        self.estado = self.NA_FILA
+        self.erro = None # Exceção que escapou do alvo (as gerações tratam os próprios erros)
+        self.duracao = None
+
+    @property
+    def encerrada(self):
+        return self.estado not in self.TRANSICOES
+
+    def mudar_estado(self, novo):
+        """Aplica uma transição do ciclo de vida; transições fora de TRANSICOES são erro de programação."""
+        if novo not in self.TRANSICOES.get(self.estado, ()):
+            raise RuntimeError(f"Execução #{self.numero}: transição inválida de '{self.estado}' para '{novo}'.")
+        if novo == self.EXECUTANDO:
+            self._inicio = time.perf_counter()
+        elif self.estado == self.EXECUTANDO:
+            self.duracao = time.perf_counter() - self._inicio
+        self.estado = novo
+
+    def texto(self):
+        """Uma linha para o painel: número, descrição, estado e, em andamento, o progresso."""
+        linha = f"#{self.numero} {self.descricao} ({self.NOMES[self.estado]}"
+        linha += f" em {self.duracao:.1f}s)" if self.duracao is not None else ")"
+        if self.estado == self.EXECUTANDO:
+            linha += f": {self.progresso.texto()}"
+        return linha
+
+
+class AgendadorExecucoes:
+    """
+    Fila das execuções da janela, atendida por um número limitado de threads. Uma
+    execução começa assim que os recursos dela estão livres e nenhuma execução anterior
+    ainda na fila pediu algum deles (ordem de chegada por recurso): um XML e um TXT rodam
+    juntos, dois XML rodam em sequência.
+
+    As threads de trabalho nunca tocam na interface: mudanças de estado (para
+    'ao_mudar_estado(execucao, estado)') e chamadas pedidas com na_interface() entram em
+    uma fila de retornos, que a thread da janela esvazia com processar_retornos() (via after).
+    """
+    def __init__(self, max_simultaneas=2, ao_mudar_estado=None):
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=max_simultaneas, thread_name_prefix="execucao")
+        self.ao_mudar_estado = ao_mudar_estado
+        self.execucoes = [] # Todas as execuções da sessão, na ordem de chegada
+        self._fila = []
+        self._em_uso = set()
+        self._lock = threading.Lock()
+        self._retornos = queue.Queue()
+
+    def agendar(self, descricao, recursos, alvo, argumentos=(), progresso=None):
+        """Coloca 'alvo(*argumentos)' na fila e devolve a ExecucaoAgendada. 'alvo' devolve True se deu certo."""
+        with self._lock:
+            execucao = ExecucaoAgendada(len(self.execucoes) + 1, descricao, recursos, alvo, argumentos,
+                                        progresso or ProgressoGeracao())
+            execucao.progresso.iniciar()
+            self.execucoes.append(execucao)
+            self._fila.append(execucao)
+        self._avisar(execucao, execucao.NA_FILA)
+        self._despachar()
+        return execucao
+
+    def ativas(self):
+        """Execuções na fila ou em andamento."""
+        with self._lock:
+            return [execucao for execucao in self.execucoes if not execucao.encerrada]
+
+    def cancelar(self, execucao=None):
+        """
+        Cancela uma execução (ou todas as ativas): as da fila saem dela na hora; as em
+        andamento param no próximo grupo ou arquivo (ver ProgressoGeracao).
+        """
+        canceladas = []
+        with self._lock:
+            for item in ([execucao] if execucao is not None else list(self.execucoes)):
+                item.progresso.cancelar()
+                if item.estado == item.NA_FILA:
+                    self._fila.remove(item)
+                    item.mudar_estado(item.CANCELADA)
+                    item.progresso.finalizar()
+                    canceladas.append(item)
+        for item in canceladas:
+            self._avisar(item, item.CANCELADA)
+        self._despachar() # Uma execução cancelada na fila pode liberar as seguintes
+
+    def encerrar(self):
+        """Ao fechar a janela: cancela tudo e não espera (as execuções param no próximo ponto de cancelamento)."""
+        self.cancelar()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def na_interface(self, funcao, *args):
+        """Pede que 'funcao(*args)' rode na thread da janela (no próximo processar_retornos())."""
+        self._retornos.put((funcao, args))
+
+    def processar_retornos(self, orcamento_s=0.03):
+        """Executa os retornos pendentes na thread atual (a da janela), por até 'orcamento_s' segundos."""
+        limite = time.perf_counter() + orcamento_s
+        while time.perf_counter() < limite:
+            try:
+                funcao, args = self._retornos.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                funcao(*args)
+            except Exception as e:
+                print(f"Erro em retorno da fila de execuções: {e}", file=sys.stderr)
+
+    def _avisar(self, execucao, estado):
+        if self.ao_mudar_estado is not None:
+            self.na_interface(self.ao_mudar_estado, execucao, estado)
+
+    def _despachar(self):
+        """Inicia, em ordem de chegada, cada execução da fila cujos recursos estejam livres."""
+        iniciadas = []
+        with self._lock:
+            bloqueados = set(self._em_uso)
+            for execucao in list(self._fila):
+                if execucao.recursos & bloqueados:
+                    bloqueados |= execucao.recursos # Quem chegou depois não passa na frente
+                    continue
+                bloqueados |= execucao.recursos
+                self._em_uso |= execucao.recursos
+                self._fila.remove(execucao)
+                execucao.mudar_estado(execucao.EXECUTANDO)
+                iniciadas.append(execucao)
+        for execucao in iniciadas:
+            self._avisar(execucao, execucao.EXECUTANDO)
+            self._executor.submit(self._executar, execucao)
+
+    def _executar(self, execucao):
+        estado = execucao.FALHOU
+        try:
+            ok = execucao.alvo(*execucao.argumentos)
+            if ok:
+                estado = execucao.CONCLUIDA
+            elif execucao.progresso.cancelado:
+                estado = execucao.CANCELADA
+        except GeracaoCancelada as e:
+            execucao.erro, estado = e, execucao.CANCELADA
+        except Exception as e:
+            execucao.erro = e
+        finally:
+            execucao.progresso.finalizar()
+            with self._lock:
+                self._em_uso -= execucao.recursos
+                execucao.mudar_estado(estado)
+            self._avisar(execucao, estado)
+            self._despachar()
+
+
+# ==============================================================================
+# CLASSE DA APLICAÇÃO GUI UNIFICADA
+# ==============================================================================
+class UnifiedOrderGeneratorApp(ModernAppTemplate, OrderGeneratorCore):
+    APP_VERSION = "2.1 (Abas Separadas XML/TXT)"
+    CONFIG_FILE = get_persistent_path("unified_order_gen_config.json")
+    # Log: o textbox guarda só as últimas linhas; a execução inteira vai para LOG_FILE
+    LOG_FILE = get_persistent_path("log_ultima_execucao.txt")
+    LOG_MAX_LINHAS = 5000
+    LOG_ORCAMENTO_MS = 30 # Tempo máximo por ciclo esvaziando a fila (mantém a janela responsiva)
+    LOG_INTERVALO_MS = 100
+    PROGRESSO_INTERVALO_MS = 250 # Retornos da fila de execuções e atualização da barra de progresso
+    # Benchmark de inicialização: uma linha por abertura da janela
+    BENCHMARK_INICIALIZACAO_FILE = get_persistent_path("benchmark_inicializacao.csv")
+
+    def __init__(self):
+        super().__init__()
+        self.title(f"Gerador de Pedidos Unificado - v{self.APP_VERSION}")
+        self.geometry("1024x768") # Tamanho inicial ajustado para o layout lateral
+
+        # Variáveis de estado
+        self.file_path_var = tk.StringVar()
+        self.log_queue = queue.Queue()
+        self._log_historico = None # Arquivo com o log completo da execução atual (aberto sob demanda)
+        self._log_cortado = False # Se o textbox já descartou linhas antigas nesta execução
+        self._config_salva = None # Último JSON gravado/lido de CONFIG_FILE (evita regravar o mesmo conteúdo)
+        self._resumos_metricas = [] # Resumos exibidos no painel de métricas (dois na geração combinada)
+        # Fila das gerações e envios; as threads de trabalho só falam com a janela através dela
+        self.agendador = AgendadorExecucoes(ao_mudar_estado=self._ao_mudar_estado_execucao)
+        self._painel_em_andamento = False # Se o painel de progresso mostra execuções ativas
+        self._primeiro_quadro_medido = False
+
+        # Variáveis específicas para Geração XML
+        self.manual_login_var = tk.StringVar()
+        self.manual_oferta_var = tk.StringVar()
+        self.manual_nome_base_var = tk.StringVar()
+        self.enviar_xml_ftp_var = tk.BooleanVar(value=False)
+
+        # Variáveis específicas para Geração TXT
+        self.usuario_txt_var = tk.StringVar()
+        self.destino_txt_var = tk.StringVar(value="EPP")
+        self.forma_pagamento_txt_var = tk.StringVar(value="Boleto")
+        self.enviar_txt_ftp_padrao_var = tk.BooleanVar(value=False)
+        self.enviar_txt_ftp_pessoal_var = tk.BooleanVar(value=False)
+        self.ftp_pessoal_user_var = tk.StringVar()
+        self.ftp_pessoal_pass_var = tk.StringVar()
+
+        # Motor de leitura das planilhas (Configurações)
+        self.leitor_planilha_var = tk.StringVar(value="auto")
+        # Processos de renderização (Configurações)
+        self.processos_var = tk.StringVar(value="1")
+        # Conexões FTP simultâneas (Configurações)
+        self.conexoes_ftp_var = tk.StringVar(value="4")
+        # Envio FTP contínuo, durante a geração (Configurações)
+        self.envio_continuo_var = tk.BooleanVar(value=True)
+        # Cópia local dos arquivos enviados por FTP (Configurações)
+        self.copia_local_var = tk.StringVar(value="sempre")
+        # Cache em disco das planilhas lidas (Configurações)
+        self.cache_em_disco_var = tk.BooleanVar(value=False)
+        # Modo incremental: pula pedidos já gerados/enviados sem alteração (Configurações)
+        self.modo_incremental_var = tk.BooleanVar(value=False)
+
+        # --- Defina seus itens de navegação para o UnifiedOrderGeneratorApp ---
+        self.NAV_ITEMS = {
+            "xml": ("📄", "Pedidos XML"),
+            "epan_txt": ("📝", "Pedidos EPAN (TXT)"),
+            "configuracoes": ("🔧", "Configurações"),
+            "sobre": ("ℹ️", "Sobre")
+        }
+
+        # Carrega as configurações primeiro
+        self._carregar_configuracoes()
+        # Inicializa os elementos da interface do usuário (deve ser chamado depois de carregar as configurações)
+        self._initialize_ui()
+        # Configura os gatilhos de salvamento automático para variáveis específicas do aplicativo
+        self._setup_auto_save_triggers()
+        # Atualiza elementos específicos da UI que dependem da configuração carregada
+        self._update_ui_from_config() # Para o botão de tema
+        
+        # Log de mensagens (unificado e na janela principal, conforme template)
+        # O logbox é um atributo da classe principal, acessível em self.log_textbox
+        # A template já lida com a grid do content_area. Preciso apenas garantir
+        # que o log textbox seja gridado corretamente fora do content_area
+        # E que o content_area se ajuste.
+
+        # Ajuste para o log textbox na janela principal
+        self.grid_rowconfigure(0, weight=1) # Content area
+        self.grid_rowconfigure(1, weight=0) # Painel de métricas
+        self.grid_rowconfigure(2, weight=0) # Label Log
+        self.grid_rowconfigure(3, weight=1) # Log Textbox
+
+        # Painel com o resumo das métricas da última geração
+        painel_metricas = ctk.CTkFrame(self, fg_color=self.CARD_FG_COLOR, corner_radius=self.CARD_CORNER_RADIUS)
+        painel_metricas.grid(row=1, column=0, columnspan=2, padx=self.PADX, pady=(self.PADY, 0), sticky="ew")
+        painel_metricas.grid_columnconfigure(1, weight=1)
+        ctk.CTkLabel(painel_metricas, text="📊 Última execução:", font=ctk.CTkFont(weight="bold")).grid(row=0, column=0, padx=self.PADX, pady=self.PADY, sticky="nw")
+        self.resumo_metricas_label = ctk.CTkLabel(painel_metricas, text="Nenhuma geração nesta sessão.", font=("Consolas", 10),
+                                                  justify="left", anchor="w", text_color=self.TEXT_SUBTLE_COLOR)
+        self.resumo_metricas_label.grid(row=0, column=1, padx=self.PADX, pady=self.PADY, sticky="ew")
+        ctk.CTkButton(painel_metricas, text="Relatórios", width=100, corner_radius=self.BUTTON_CORNER_RADIUS,
+                      command=lambda: abrir_arquivo(self.pasta_relatorios, self.log_queue)).grid(row=0, column=2, padx=self.PADX, pady=self.PADY, sticky="ne")
+        # Progresso ao vivo das execuções da fila, com cancelamento
+        ctk.CTkLabel(painel_metricas, text="⏳ Progresso:", font=ctk.CTkFont(weight="bold")).grid(row=1, column=0, padx=self.PADX, pady=(0, self.PADY), sticky="w")
+        self.barra_progresso = ctk.CTkProgressBar(painel_metricas)
+        self.barra_progresso.set(0)
+        self.barra_progresso.grid(row=1, column=1, padx=self.PADX, pady=(0, self.PADY), sticky="ew")
+        self.button_cancelar = ctk.CTkButton(painel_metricas, text="Cancelar", width=100, corner_radius=self.BUTTON_CORNER_RADIUS,
+                                             state=tk.DISABLED, command=self.cancelar_execucao)
+        self.button_cancelar.grid(row=1, column=2, rowspan=2, padx=self.PADX, pady=(0, self.PADY), sticky="n")
+        self.progresso_label = ctk.CTkLabel(painel_metricas, text="Nenhuma execução em andamento.", font=("Consolas", 10),
+                                            justify="left", anchor="w", text_color=self.TEXT_SUBTLE_COLOR)
+        self.progresso_label.grid(row=2, column=1, padx=self.PADX, pady=(0, self.PADY), sticky="ew")
+
+        ctk.CTkLabel(self, text="Log:", font=ctk.CTkFont(weight="bold")).grid(row=2, column=0, columnspan=2, padx=self.PADX, pady=(self.PADY*2, 2), sticky="w")
+        self.log_textbox = ctk.CTkTextbox(self, wrap=tk.WORD, font=("Consolas", 9), corner_radius=self.CARD_CORNER_RADIUS, border_width=1)
+        self.log_textbox.grid(row=3, column=0, columnspan=2, padx=self.PADX, pady=(0, self.PADY), sticky="nsew")
+        self.log_textbox.configure(state=tk.DISABLED)
+
+        self.after(100, self.process_log_queue)
+        self.after(self.PROGRESSO_INTERVALO_MS, self._acompanhar_execucoes)
+        # Mede o tempo até a janela aparecer e só então carrega pandas/openpyxl/ftplib em segundo plano
+        self.bind("<Map>", self._ao_mostrar_janela, add="+")
+        
+        # Garante que o frame de FTP pessoal esteja oculto inicialmente para TXT
+        # Isso precisa ser chamado APÓS a UI ser criada
+        self.after(200, self.handle_txt_ftp_padrao_check)
+        self.after(200, self.handle_txt_ftp_pessoal_check)
+
+    # --- Métodos de População das Páginas (Implementando o template) ---
+    def setup_xml_page(self, parent_frame):
+        self._create_toolbar(parent_frame, "Pedidos XML")
+        parent_frame.grid_columnconfigure(0, weight=1)
+        
+        # Frame de controles para XML
+        controls_frame = ctk.CTkFrame(parent_frame, fg_color="transparent")
+        controls_frame.pack(fill="x", padx=self.PADX, pady=self.PADY, anchor="n")
+        controls_frame.grid_columnconfigure(1, weight=1)
+
+        # Entrada para o arquivo Excel (comum)
+        ctk.CTkLabel(controls_frame, text="Planilha de Pedidos (Excel, CSV ou Parquet) - várias ou uma pasta geram um lote:").grid(row=0, column=0, columnspan=3, padx=self.PADX, pady=(self.PADY,2), sticky="w")
+        entry_arquivo = ctk.CTkEntry(controls_frame, textvariable=self.file_path_var, corner_radius=self.BUTTON_CORNER_RADIUS)
+        entry_arquivo.grid(row=1, column=0, columnspan=2, padx=(self.PADX, self.PADY), pady=2, sticky="ew")
+        self._criar_botoes_planilha(controls_frame).grid(row=1, column=2, padx=(0, self.PADX), pady=2, sticky="e")
+
+        # Opções específicas de XML
+        xml_options_card = ctk.CTkFrame(controls_frame, corner_radius=self.CARD_CORNER_RADIUS, fg_color=self.CARD_FG_COLOR)
+        xml_options_card.grid(row=2, column=0, columnspan=3, padx=self.PADX, pady=self.PADY*2, sticky="ew")
+        xml_options_card.grid_columnconfigure(1, weight=1)
+
+        ctk.CTkLabel(xml_options_card, text="Substituir Valores (Opcional - XML):", font=self.FONT_H2).grid(row=0, column=0, columnspan=2, padx=20, pady=(20, 10), sticky="w")
+        ctk.CTkLabel(xml_options_card, text="Login:").grid(row=1, column=0, padx=(20, 5), pady=self.PADY, sticky="w")
+        ctk.CTkEntry(xml_options_card, textvariable=self.manual_login_var, placeholder_text="Padrão: pdvlinkmerck", width=180, corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=1, column=1, padx=5, pady=self.PADY, sticky="ew")
+        ctk.CTkLabel(xml_options_card, text="Oferta:").grid(row=2, column=0, padx=(20, 5), pady=self.PADY, sticky="w")
+        ctk.CTkEntry(xml_options_card, textvariable=self.manual_oferta_var, placeholder_text="Padrão: da planilha", width=180, corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=2, column=1, padx=5, pady=self.PADY, sticky="ew")
+        ctk.CTkLabel(xml_options_card, text="Nome Base Arquivo:").grid(row=3, column=0, padx=(20, 5), pady=self.PADY, sticky="w")
+        ctk.CTkEntry(xml_options_card, textvariable=self.manual_nome_base_var, placeholder_text="Padrão: da planilha", width=180, corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=3, column=1, padx=5, pady=(self.PADY, 20), sticky="ew")
+        self.check_enviar_xml_ftp = ctk.CTkCheckBox(xml_options_card, text="Enviar XML(s) via FTP após gerar", variable=self.enviar_xml_ftp_var)
+        self.check_enviar_xml_ftp.grid(row=4, column=0, columnspan=2, padx=20, pady=self.PADY, sticky="w")
+
+        # Botões de ação para XML
+        action_frame_xml = ctk.CTkFrame(parent_frame, fg_color="transparent")
+        action_frame_xml.pack(fill="x", padx=self.PADX, pady=(self.PADY*2, self.PADY), anchor="s")
+        action_frame_xml.grid_columnconfigure((0, 1, 2), weight=1)
+        self.button_gerar_xml = ctk.CTkButton(action_frame_xml, text="Gerar XML(s)", command=self.start_xml_generation_thread, corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON)
+        self.button_gerar_xml.grid(row=0, column=0, padx=5, pady=5)
+        ctk.CTkButton(action_frame_xml, text="Gerar Planilha Exemplo", command=self._generate_xml_example, corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON, fg_color="gray50", hover_color="gray60").grid(row=0, column=1, padx=5, pady=5)
+        ctk.CTkButton(action_frame_xml, text="Retomar Envio", command=lambda: self.start_retomar_envio_thread("XML"), corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON, fg_color="gray50", hover_color="gray60").grid(row=0, column=2, padx=5, pady=5)
+
+
+    def setup_epan_txt_page(self, parent_frame):
+        self._create_toolbar(parent_frame, "Pedidos EPAN (TXT)")
+        parent_frame.grid_columnconfigure(0, weight=1)
+
+        # Frame de controles para TXT
+        controls_frame = ctk.CTkFrame(parent_frame, fg_color="transparent")
+        controls_frame.pack(fill="x", padx=self.PADX, pady=self.PADY, anchor="n")
+        controls_frame.grid_columnconfigure(1, weight=1)
+
+        # Entrada para o arquivo Excel (comum)
+        ctk.CTkLabel(controls_frame, text="Planilha de Pedidos (Excel, CSV ou Parquet) - várias ou uma pasta geram um lote:").grid(row=0, column=0, columnspan=2, padx=self.PADX, pady=(self.PADY, 2), sticky="w")
+        entry_arquivo = ctk.CTkEntry(controls_frame, textvariable=self.file_path_var, corner_radius=self.BUTTON_CORNER_RADIUS)
+        entry_arquivo.grid(row=1, column=0, padx=(self.PADX, self.PADY), pady=2, sticky="ew")
+        self._criar_botoes_planilha(controls_frame).grid(row=1, column=1, padx=(0, self.PADX), pady=2, sticky="e")
+
+        # Opções específicas de TXT
+        txt_options_card = ctk.CTkFrame(controls_frame, corner_radius=self.CARD_CORNER_RADIUS, fg_color=self.CARD_FG_COLOR)
+        txt_options_card.grid(row=2, column=0, columnspan=2, padx=self.PADX, pady=self.PADY*2, sticky="ew")
+        txt_options_card.grid_columnconfigure(1, weight=1)
+
+        ctk.CTkLabel(txt_options_card, text="Configurações de Geração TXT:", font=self.FONT_H2).grid(row=0, column=0, columnspan=2, padx=20, pady=(20, 10), sticky="w")
+        ctk.CTkLabel(txt_options_card, text="Informe seu login (Ex: v001):").grid(row=1, column=0, columnspan=2, padx=20, pady=(self.PADY*2, 2), sticky="w")
+        ctk.CTkEntry(txt_options_card, textvariable=self.usuario_txt_var, width=150, corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=2, column=0, columnspan=2, padx=20, pady=2, sticky="w")
+
+        options_sub_frame = ctk.CTkFrame(txt_options_card, corner_radius=self.CARD_CORNER_RADIUS)
+        options_sub_frame.grid(row=3, column=0, columnspan=2, padx=20, pady=self.PADY, sticky="ew")
+        options_sub_frame.grid_columnconfigure(1, weight=1) # Para radio buttons
+
+        label_destino = ctk.CTkLabel(options_sub_frame, text="Destino:")
+        label_destino.grid(row=0, column=0, padx=(0, 10), pady=self.PADY, sticky="w")
+        destino_radio_frame = ctk.CTkFrame(options_sub_frame, fg_color="transparent"); destino_radio_frame.grid(row=0, column=1, padx=5, pady=self.PADY, sticky="w")
+        ctk.CTkRadioButton(destino_radio_frame, text="EPP", variable=self.destino_txt_var, value="EPP").pack(side=tk.LEFT, padx=(0, 10))
+        ctk.CTkRadioButton(destino_radio_frame, text="EPH", variable=self.destino_txt_var, value="EPH").pack(side=tk.LEFT, padx=(0, 10))
+
+        label_forma = ctk.CTkLabel(options_sub_frame, text="Pagamento:")
+        label_forma.grid(row=1, column=0, padx=(0, 10), pady=self.PADY, sticky="w")
+        forma_radio_frame = ctk.CTkFrame(options_sub_frame, fg_color="transparent"); forma_radio_frame.grid(row=1, column=1, padx=5, pady=self.PADY, sticky="w")
+        ctk.CTkRadioButton(forma_radio_frame, text="Boleto", variable=self.forma_pagamento_txt_var, value="Boleto").pack(side=tk.LEFT, padx=(0, 10))
+        ctk.CTkRadioButton(forma_radio_frame, text="Cartão", variable=self.forma_pagamento_txt_var, value="Cartão").pack(side=tk.LEFT, padx=(0, 10))
+        ctk.CTkRadioButton(forma_radio_frame, text="PIX", variable=self.forma_pagamento_txt_var, value="PIX").pack(side=tk.LEFT, padx=(0, 10))
+
+        self.check_ftp_txt_padrao = ctk.CTkCheckBox(txt_options_card, text="Enviar via FTP (Automático)", variable=self.enviar_txt_ftp_padrao_var, command=self.handle_txt_ftp_padrao_check)
+        self.check_ftp_txt_padrao.grid(row=4, column=0, columnspan=2, padx=20, pady=(self.PADY*2, 2), sticky="w")
+        self.check_ftp_txt_pessoal = ctk.CTkCheckBox(txt_options_card, text="Enviar para Pasta Pessoal (FTP)", variable=self.enviar_txt_ftp_pessoal_var, command=self.handle_txt_ftp_pessoal_check)
+        self.check_ftp_txt_pessoal.grid(row=5, column=0, columnspan=2, padx=20, pady=(2, self.PADY), sticky="w")
+
+        # Frame para as credenciais FTP Pessoal (inicialmente oculto)
+        self.ftp_pessoal_txt_frame = ctk.CTkFrame(txt_options_card, fg_color="transparent")
+        self.ftp_pessoal_txt_frame.grid(row=6, column=0, columnspan=2, padx=20, pady=0, sticky="ew")
+        self.ftp_pessoal_txt_frame.grid_columnconfigure(1, weight=1)
+        ctk.CTkLabel(self.ftp_pessoal_txt_frame, text="Usuário FTP:").grid(row=0, column=0, padx=(0, 5), pady=2, sticky="w")
+        ctk.CTkEntry(self.ftp_pessoal_txt_frame, textvariable=self.ftp_pessoal_user_var).grid(row=0, column=1, pady=2, sticky="ew")
+        ctk.CTkLabel(self.ftp_pessoal_txt_frame, text="Senha FTP:").grid(row=1, column=0, padx=(0, 5), pady=2, sticky="w")
+        ctk.CTkEntry(self.ftp_pessoal_txt_frame, textvariable=self.ftp_pessoal_pass_var, show="*").grid(row=1, column=1, pady=2, sticky="ew")
+        self.ftp_pessoal_txt_frame.grid_remove() # Inicia oculto
+
+        # Botões de ação para TXT
+        action_frame_txt = ctk.CTkFrame(parent_frame, fg_color="transparent")
+        action_frame_txt.pack(fill="x", padx=self.PADX, pady=(self.PADY*2, self.PADY), anchor="s")
+        action_frame_txt.grid_columnconfigure((0, 1, 2), weight=1)
+        self.button_gerar_txt = ctk.CTkButton(action_frame_txt, text="Gerar TXT(s)", command=self.start_txt_generation_thread, corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON)
+        self.button_gerar_txt.grid(row=0, column=0, padx=5, pady=5)
+        ctk.CTkButton(action_frame_txt, text="Gerar Planilha Exemplo", command=self._generate_txt_example, corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON, fg_color="gray50", hover_color="gray60").grid(row=0, column=1, padx=5, pady=5)
+        ctk.CTkButton(action_frame_txt, text="Retomar Envio", command=lambda: self.start_retomar_envio_thread("TXT"), corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON, fg_color="gray50", hover_color="gray60").grid(row=0, column=2, padx=5, pady=5)
+        # Geração combinada: usa as opções das abas XML e TXT com uma única leitura da planilha
+        self.button_gerar_ambos = ctk.CTkButton(action_frame_txt, text="Gerar XML + TXT", command=self.start_ambos_generation_thread, corner_radius=self.BUTTON_CORNER_RADIUS, height=35, font=self.FONT_BUTTON)
+        self.button_gerar_ambos.grid(row=1, column=0, columnspan=3, padx=5, pady=5, sticky="ew")
+
+
+    def setup_configuracoes_page(self, parent_frame):
+        self._create_toolbar(parent_frame, "Configurações")
+        
+        # Cartão de Aparência
+        card_aparencia = ctk.CTkFrame(parent_frame, corner_radius=self.CARD_CORNER_RADIUS, fg_color=self.CARD_FG_COLOR)
+        card_aparencia.pack(fill="x", padx=20, pady=(10, 15))
+        card_aparencia.grid_columnconfigure(0, weight=1)
+        
+        ctk.CTkLabel(card_aparencia, text="Aparência", font=self.FONT_H1).grid(row=0, column=0, padx=20, pady=(20, 10), sticky="w")
+        ctk.CTkLabel(card_aparencia, text="Escolha o tema visual da aplicação:").grid(row=1, column=0, padx=20, pady=(10, 5), sticky="w")
+        
+        self.theme_segmented_button = ctk.CTkSegmentedButton(card_aparencia, values=["Claro", "Escuro", "Sistema"], 
+                                                              command=self.change_appearance_mode, 
+                                                              font=self.FONT_BODY, height=35, 
+                                                              corner_radius=self.BUTTON_CORNER_RADIUS)
+        self.theme_segmented_button.grid(row=2, column=0, padx=20, pady=(5, 20), sticky="ew")
+
+        # Outro exemplo de cartão de configuração (mantido do template)
+        card_geral = ctk.CTkFrame(parent_frame, corner_radius=self.CARD_CORNER_RADIUS, fg_color=self.CARD_FG_COLOR)
+        card_geral.pack(fill="x", padx=20, pady=(0, 15))
+        card_geral.grid_columnconfigure(0, weight=1)
+        ctk.CTkLabel(card_geral, text="Configurações Gerais", font=self.FONT_H1).grid(row=0, column=0, padx=20, pady=(20, 10), sticky="w")
+        ctk.CTkLabel(card_geral, text="Motor de leitura das planilhas ('auto' usa o mais rápido instalado):").grid(row=1, column=0, padx=20, pady=(10, 5), sticky="w")
+        ctk.CTkOptionMenu(card_geral, variable=self.leitor_planilha_var, values=["auto"] + list(LEITORES_PLANILHA),
+                          corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=2, column=0, padx=20, pady=(5, 10), sticky="w")
+        ctk.CTkLabel(card_geral, text="Processos para gerar os pedidos (planilhas grandes; 'auto' usa todos os núcleos):").grid(row=3, column=0, padx=20, pady=(10, 5), sticky="w")
+        ctk.CTkOptionMenu(card_geral, variable=self.processos_var, values=["1", "2", "4", "8", "auto"],
+                          corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=4, column=0, padx=20, pady=(5, 10), sticky="w")
+        ctk.CTkLabel(card_geral, text="Conexões FTP simultâneas por envio:").grid(row=5, column=0, padx=20, pady=(10, 5), sticky="w")
+        ctk.CTkOptionMenu(card_geral, variable=self.conexoes_ftp_var, values=["1", "2", "4", "8"],
+                          corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=6, column=0, padx=20, pady=(5, 10), sticky="w")
+        ctk.CTkCheckBox(card_geral, text="Enviar cada arquivo via FTP assim que for gerado (envio contínuo)",
+                        variable=self.envio_continuo_var).grid(row=7, column=0, padx=20, pady=(10, 10), sticky="w")
+        ctk.CTkLabel(card_geral, text="Cópia local ao enviar por FTP ('sempre' grava antes de enviar; 'depois' envia da memória e grava em\nsegundo plano; 'falhas' envia da memória e só grava os arquivos que não foram enviados):",
+                     justify="left").grid(row=8, column=0, padx=20, pady=(10, 5), sticky="w")
+        ctk.CTkOptionMenu(card_geral, variable=self.copia_local_var, values=["sempre", "depois", "falhas"],
+                          corner_radius=self.BUTTON_CORNER_RADIUS).grid(row=9, column=0, padx=20, pady=(5, 10), sticky="w")
+        ctk.CTkCheckBox(card_geral, text="Guardar em disco as planilhas já lidas (reabre a mesma planilha quase na hora, mesmo após reiniciar)",
+                        variable=self.cache_em_disco_var).grid(row=10, column=0, padx=20, pady=(10, 10), sticky="w")
+        ctk.CTkCheckBox(card_geral, text="Modo incremental (gerar e enviar só pedidos novos ou alterados desde a última execução)",
+                        variable=self.modo_incremental_var).grid(row=11, column=0, padx=20, pady=(10, 20), sticky="w")
+        # Exemplo de variável específica do app que pode ser salva
+        # No seu caso, você pode adicionar configurações do FTP aqui, se quiser que sejam editáveis.
+        # ctk.CTkCheckBox(card_geral, text="Habilitar recurso experimental X", variable=self.some_app_specific_var, command=self._auto_save_on_change).grid(row=1, column=0, padx=25, pady=8, sticky="w")
+
+
+    def setup_sobre_page(self, parent_frame):
+        self._create_toolbar(parent_frame, "Sobre")
+        card_sobre = ctk.CTkFrame(parent_frame, fg_color=self.CARD_FG_COLOR, corner_radius=self.CARD_CORNER_RADIUS)
+        card_sobre.pack(fill="both", expand=True, padx=20, pady=20)
+        ctk.CTkLabel(card_sobre, text=f"Gerador de Pedidos Unificado - Versão {self.APP_VERSION}", font=self.FONT_H1).pack(pady=20)
+        ctk.CTkLabel(card_sobre, wraplength=500, justify="center", text=(
+            "Este utilitário permite gerar dois tipos de arquivos de pedido a partir de planilhas Excel, CSV ou Parquet:\n"
+            "1. XML para um formato específico.\n"
+            "2. TXT para o sistema EPAN.\n\n"
+            "Ambos os tipos de arquivo são salvos em pastas distintas ('XML_Pedidos' e 'TXT_Pedidos') dentro de 'Pedidos_Gerados_Unified').\n"
+            "Funcionalidades de upload FTP estão disponíveis para ambos os tipos de geração, com opções de destino padrão ou pasta pessoal.\n\n"
+            "Colunas esperadas para XML:\n  CNPJ, EAN, Quantidade, Oferta, NomeArquivo.\n"
+            "Colunas esperadas para TXT:\n  CNPJ, EAN, QUANTIDADE, NOME DO ARQUIVO (obrigatórias)\n  OFERTA, DEAL, CONDICAO DE PAGAMENTO, SUFIXO (opcionais).\n\n"
+            "Desenvolvido por David Soares (com o apoio moral e inspiração do Gemini).\n\n"
+            f"© {datetime.now().year} Soares Software LTDA - Todos os direitos reservados."
+        )).pack(pady=10)
+
+
+    # --- Métodos de Lógica e Callbacks da GUI ---
+    def _criar_botoes_planilha(self, parent):
+        """Botões de seleção das planilhas: um ou vários arquivos ('Procurar...') ou uma pasta inteira ('Pasta...')."""
+        frame = ctk.CTkFrame(parent, fg_color="transparent")
+        ctk.CTkButton(frame, text="Procurar...", command=self.select_excel_file, width=90, corner_radius=self.BUTTON_CORNER_RADIUS).pack(side="left")
+        ctk.CTkButton(frame, text="Pasta...", command=self.select_pasta_planilhas, width=70, corner_radius=self.BUTTON_CORNER_RADIUS).pack(side="left", padx=(5, 0))
+        return frame
+
+    def select_excel_file(self):
+        """Permite ao usuário selecionar uma ou várias planilhas de pedidos (Excel, CSV ou Parquet)."""
+        files = filedialog.askopenfilenames(title="Selecione a(s) Planilha(s)",
+                                            filetypes=[("Planilhas", " ".join(f"*{e}" for e in EXTENSOES_PLANILHA)),
+                                                       ("Excel", "*.xlsx"), ("CSV", "*.csv"), ("Parquet", "*.parquet")])
+        if files:
+            # Várias planilhas ficam no mesmo campo, separadas como no PATH do sistema (';' no Windows)
+            self.file_path_var.set(os.pathsep.join(files))
+            self._auto_save_on_change() # Salva o caminho do arquivo selecionado
+
+    def select_pasta_planilhas(self):
+        """Seleciona uma pasta: todas as planilhas dela são geradas em um único lote."""
+        pasta = filedialog.askdirectory(title="Selecione a Pasta com as Planilhas")
+        if pasta:
+            self.file_path_var.set(pasta)
+            self._auto_save_on_change()
+
+    def _planilhas_selecionadas(self):
+        """
+        Planilhas do campo de arquivo (uma, várias ou as de uma pasta). Se a seleção
+        for inválida, mostra o erro e devolve None.
+        """
         try:
-            path = os.path.join(get_persistent_path(""), "exemplo_planilha_pedidos_txt.xlsx")
+            planilhas = planilhas_do_lote(self.file_path_var.get().split(os.pathsep))
+        except FileNotFoundError as e:
+            messagebox.showerror("Erro", str(e))
+            return None
+        if not planilhas:
+            messagebox.showerror("Erro", "Selecione uma planilha válida (Excel, CSV ou Parquet) ou uma pasta com planilhas.")
+            return None
+        return planilhas
+
+    def _iniciar_geracao(self, modo, planilhas, parametros):
+        """Põe na fila a geração ('XML', 'TXT' ou 'AMBOS'): avulsa com uma planilha, em lote com várias."""
+        nome_modo = "XML + TXT" if modo == "AMBOS" else modo
+        if len(planilhas) == 1:
+            metodo = {"XML": "_generate_xml_logic", "TXT": "_generate_txt_logic", "AMBOS": "_generate_ambos_logic"}[modo]
+            argumentos = (planilhas[0],) + parametros
+            descricao = f"{nome_modo}: {os.path.basename(planilhas[0])}"
+        else:
+            metodo, argumentos = "_generate_lote_logic", (modo, planilhas) + parametros
+            descricao = f"{nome_modo}: lote de {len(planilhas)} planilha(s)"
+        self._agendar_execucao(modo, descricao, metodo, argumentos)
+
+    def _agendar_execucao(self, modo, descricao, metodo, argumentos):
+        """
+        Põe na fila a execução de 'metodo' (nome do método do núcleo) por um GeradorDelegado
+        com a configuração atual da janela. Não espera: com uma execução em andamento nos
+        recursos do 'modo' (RECURSOS_POR_MODO), esta começa quando aquela terminar.
+        """
+        progresso = ProgressoGeracao()
+        gerador = GeradorDelegado(self, progresso, modo)
+        execucao = self.agendador.agendar(descricao, RECURSOS_POR_MODO[modo], getattr(gerador, metodo), argumentos, progresso)
+        if execucao.estado == execucao.NA_FILA:
+            self.log_message_safe(f"⏳ Execução #{execucao.numero} ({descricao}) na fila.")
+        self.button_cancelar.configure(state=tk.NORMAL, text="Cancelar")
+        self._painel_em_andamento = True
+        return execucao
+
+    def _ao_mudar_estado_execucao(self, execucao, estado):
+        """Retorno da fila de execuções (na thread da janela): registra o início e o fim de cada uma."""
+        if estado == execucao.EXECUTANDO:
+            self.log_message_safe(f"▶ Execução #{execucao.numero} iniciada: {execucao.descricao}")
+        elif estado in (execucao.CONCLUIDA, execucao.FALHOU, execucao.CANCELADA):
+            if execucao.erro is not None and not isinstance(execucao.erro, GeracaoCancelada):
+                self.log_message_safe(f"❌ Erro inesperado na execução #{execucao.numero}: {execucao.erro}")
+            self.log_message_safe(f"■ Execução #{execucao.numero} ({execucao.descricao}): {execucao.NOMES[estado]}.")
+        self._atualizar_painel_execucoes()
+
+    def _acompanhar_execucoes(self):
+        """Laço da janela: entrega os retornos das threads de trabalho e atualiza o painel de progresso."""
+        try:
+            self.agendador.processar_retornos()
+            self._atualizar_painel_execucoes()
+        finally:
+            if self.winfo_exists():
+                self.after(self.PROGRESSO_INTERVALO_MS, self._acompanhar_execucoes)
+
+    def _atualizar_painel_execucoes(self):
+        """Barra da execução em andamento mais antiga e uma linha por execução ativa (ou a última, se não houver)."""
+        ativas = self.agendador.ativas()
+        if ativas:
+            em_andamento = [execucao for execucao in ativas if execucao.estado == execucao.EXECUTANDO]
+            if em_andamento:
+                self.barra_progresso.set(em_andamento[0].progresso.instantaneo()["fracao"])
+            texto = "\n".join(execucao.texto() for execucao in ativas)
+        elif self.agendador.execucoes:
+            ultima = self.agendador.execucoes[-1]
+            texto = ultima.texto()
+            if self._painel_em_andamento: # Acabou a última execução ativa
+                self._painel_em_andamento = False
+                self.button_cancelar.configure(state=tk.DISABLED, text="Cancelar")
+                if ultima.estado == ultima.CONCLUIDA:
+                    self.barra_progresso.set(1.0)
+        else:
+            return
+        if self.progresso_label.cget("text") != texto:
+            self.progresso_label.configure(text=texto)
+
+    def cancelar_execucao(self):
+        """Cancela as execuções da fila e pede às em andamento que parem no próximo grupo ou arquivo."""
+        self.agendador.cancelar()
+        self.button_cancelar.configure(state=tk.DISABLED, text="Cancelando...")
+        self.log_message_safe("⏹ Cancelamento solicitado: as execuções em andamento param no próximo grupo ou arquivo.")
+
+    def _generate_xml_example(self):
+        """Gera um exemplo de planilha para o formato XML."""
+        df = pd.DataFrame([
+            {"CNPJ": "12345678000195", "EAN": "7891234567895", "Quantidade": 5, "Oferta": "399", "NomeArquivo": "PEDIDO_EXEMPLO_XML_A"},
+            {"CNPJ": "12345678000195", "EAN": "7890000000093", "Quantidade": 10, "Oferta": "399", "NomeArquivo": "PEDIDO_EXEMPLO_XML_A"},
+            {"CNPJ": "98765432000198", "EAN": "7891111111111", "Quantidade": 20, "Oferta": "400", "NomeArquivo": "PEDIDO_EXEMPLO_XML_B"}
+        ])
+        try:
+            path = os.path.join(get_persistent_path(""), "exemplo_pedidos_xml.xlsx")
             df.to_excel(path, index=False)
+            self.log_message_safe(f"📁 Planilha exemplo XML salva: {path}")
+            messagebox.showinfo("Exemplo Gerado", f"Salvo em:\n{path}")
+            abrir_arquivo(path, self.log_queue)
+        except Exception as e:
+            self.log_message_safe(f"ERRO ao gerar exemplo XML: {e}")
+            messagebox.showerror("Erro", f"Falha:\n{e}")
+
+    def _generate_txt_example(self):
+        """Gera um exemplo de planilha para o formato TXT."""
+        exemplo_df = pd.DataFrame({
+            "CNPJ": ["12345678000195", "12345678000195", "98765432000198"],
+            "EAN": ["7891234567895", "7890987654326", "7891111222237"],
+            "QUANTIDADE": ["10", "5", "150"],
+            "NOME DO ARQUIVO": ["PEDIDO_TXT_A", "PEDIDO_TXT_A", "PEDIDO_TXT_B"],
+            "OFERTA": ["OFERTA1", "", "OFERTA2"],
+            "DEAL": ["DEAL1", "DEAL1", ""],
+            "CONDICAO DE PAGAMENTO": ["30D", "30D", "15D"],
+            "SUFIXO": ["S1", "", "S2"]
+        })
+        try:
+            path = os.path.join(get_persistent_path(""), "exemplo_planilha_pedidos_txt.xlsx")
+            exemplo_df.to_excel(path, index=False)
             self.log_message_safe(f"📁 Planilha exemplo TXT salva: {path}")
             messagebox.showinfo("Exemplo Gerado", f"Salva em:\n{path}")
             abrir_arquivo(path, self.log_queue)
@@ -545,515 +4024,237 @@ class UnifiedOrderGeneratorApp(ModernAppTemplate):
 
 
     def start_xml_generation_thread(self):
-        """Inicia a thread de geração de pedidos XML."""
-        excel_path = self.file_path_var.get()
-        if not excel_path or not os.path.exists(excel_path):
-            messagebox.showerror("Erro", "Selecione um arquivo Excel válido.")
+        """Põe na fila a geração de pedidos XML."""
+        planilhas = self._planilhas_selecionadas()
+        if not planilhas:
             return
 
-        # Limpa o log e desabilita o botão
-        if hasattr(self, 'log_textbox') and self.log_textbox.winfo_exists():
-            self.log_textbox.configure(state=tk.NORMAL)
-            self.log_textbox.delete('1.0',tk.END)
-            self.log_textbox.configure(state=tk.DISABLED)
-        if hasattr(self,'button_gerar_xml') and self.button_gerar_xml.winfo_exists():
-            self.button_gerar_xml.configure(state=tk.DISABLED, text="Gerando...")
-
+        self._limpar_log_se_ocioso()
         manual_login = self.manual_login_var.get().strip()
         manual_oferta = self.manual_oferta_var.get().strip()
         manual_nome_base = self.manual_nome_base_var.get().strip()
         enviar_ftp_flag = self.enviar_xml_ftp_var.get()
-        threading.Thread(target=self._generate_xml_logic,
-                         args=(excel_path, manual_login, manual_oferta, manual_nome_base, enviar_ftp_flag),
-                         daemon=True).start()
+        self._aplicar_configuracoes_geracao()
+        self._iniciar_geracao("XML", planilhas, (manual_login, manual_oferta, manual_nome_base, enviar_ftp_flag))
 
     def start_txt_generation_thread(self):
-        """Inicia a thread de geração de pedidos TXT."""
-        excel_path = self.file_path_var.get()
-        if not excel_path or not os.path.exists(excel_path):
-            messagebox.showerror("Erro", "Selecione um arquivo Excel válido.")
+        """Põe na fila a geração de pedidos TXT."""
+        planilhas = self._planilhas_selecionadas()
+        if not planilhas:
             return
 
-        # Limpa o log e desabilita o botão
-        if hasattr(self, 'log_textbox') and self.log_textbox.winfo_exists():
-            self.log_textbox.configure(state=tk.NORMAL)
-            self.log_textbox.delete('1.0',tk.END)
-            self.log_textbox.configure(state=tk.DISABLED)
-        if hasattr(self,'button_gerar_txt') and self.button_gerar_txt.winfo_exists():
-            self.button_gerar_txt.configure(state=tk.DISABLED, text="Gerando...")
+        usuario_login = self.usuario_txt_var.get().strip()
+        destino_txt = self.destino_txt_var.get()
+        forma_pagamento = self.forma_pagamento_txt_var.get()
+        enviar_txt_padrao = self.enviar_txt_ftp_padrao_var.get()
+        enviar_txt_pessoal = self.enviar_txt_ftp_pessoal_var.get()
+        ftp_pessoal_user = self.ftp_pessoal_user_var.get().strip()
+        ftp_pessoal_pass = self.ftp_pessoal_pass_var.get().strip()
+        self._aplicar_configuracoes_geracao()
+
+        if not usuario_login:
+            messagebox.showerror("Erro", "Informe seu login para geração TXT.")
+            return
+        if enviar_txt_pessoal and (not ftp_pessoal_user or not ftp_pessoal_pass):
+            messagebox.showerror("Erro de FTP", "Para envio à Pasta Pessoal, o Usuário e a Senha de FTP devem ser preenchidos.")
+            return
+
+        self._limpar_log_se_ocioso()
+        self._iniciar_geracao("TXT", planilhas, (usuario_login, destino_txt, forma_pagamento,
+                                                 enviar_txt_padrao, enviar_txt_pessoal, ftp_pessoal_user, ftp_pessoal_pass))
+
+    def start_ambos_generation_thread(self):
+        """Põe na fila a geração combinada (XML + TXT a partir de uma única leitura)."""
+        planilhas = self._planilhas_selecionadas()
+        if not planilhas:
+            return
 
         usuario_login = self.usuario_txt_var.get().strip()
-        destino_txt = self.destino_txt_var.get()
-        forma_pagamento = self.forma_pagamento_txt_var.get()
-        enviar_txt_padrao = self.enviar_txt_ftp_padrao_var.get()
         enviar_txt_pessoal = self.enviar_txt_ftp_pessoal_var.get()
         ftp_pessoal_user = self.ftp_pessoal_user_var.get().strip()
         ftp_pessoal_pass = self.ftp_pessoal_pass_var.get().strip()
-
         if not usuario_login:
             messagebox.showerror("Erro", "Informe seu login para geração TXT.")
-            self.after(0, lambda: self.button_gerar_txt.configure(state=tk.NORMAL, text="Gerar TXT(s)"))
             return
         if enviar_txt_pessoal and (not ftp_pessoal_user or not ftp_pessoal_pass):
             messagebox.showerror("Erro de FTP", "Para envio à Pasta Pessoal, o Usuário e a Senha de FTP devem ser preenchidos.")
-            self.after(0, lambda: self.button_gerar_txt.configure(state=tk.NORMAL, text="Gerar TXT(s)"))
             return
 
-        threading.Thread(target=self._generate_txt_logic,
-                         args=(excel_path, usuario_login, destino_txt, forma_pagamento,
-                               enviar_txt_padrao, enviar_txt_pessoal, ftp_pessoal_user, ftp_pessoal_pass),
-                         daemon=True).start()
-
-
-    # --- Lógica de Geração XML (Adaptada do Script 1) ---
-    def _generate_xml_logic(self, arquivo_excel, manual_login, manual_oferta, manual_nome_base, enviar_ftp):
-        """Lógica principal para ler Excel e gerar arquivos XML."""
-        xml_files_to_upload = []
-        process_ok = True
-        try:
-            self.log_message_safe(f"Lendo planilha: {arquivo_excel}...")
-            df = pd.read_excel(arquivo_excel, dtype=str).fillna("")
-            self.log_message_safe(f"Lido: {len(df)} linhas.")
-
-            obrigatorias = {"CNPJ", "EAN", "Quantidade", "Oferta", "NomeArquivo"}
-            col_faltantes = [c for c in obrigatorias if c not in df.columns]
-            if col_faltantes:
-                raise ValueError(f"Coluna(s) faltando para XML: {', '.join(col_faltantes)}")
-
-            try:
-                # Tenta converter 'Quantidade' para numérico, tratando erros
-                df['Quantidade'] = pd.to_numeric(df['Quantidade'], errors='coerce').fillna(0).astype(int)
-            except Exception as e:
-                self.log_message_safe(f"AVISO: Problema ao converter 'Quantidade' para numérico: {e}. Continuar.")
-
-            self.log_message_safe("Agrupando e gerando XMLs...")
-            arquivos_gerados_count = 0
-
-            # Garante que o diretório base para XML exista
-            criar_diretorios(self.log_queue, OUTPUT_XML_DIR)
-
-            for (cnpj, nome_base_excel, oferta_excel), grupo in df.groupby(["CNPJ", "NomeArquivo", "Oferta"], dropna=False):
-                cnpj_str = str(cnpj).strip()
-                nome_base_str = str(nome_base_excel).strip()
-                oferta_str = str(oferta_excel).strip()
+        self._limpar_log_se_ocioso()
+        self._aplicar_configuracoes_geracao()
+        self._iniciar_geracao("AMBOS", planilhas,
+                              (self.manual_login_var.get().strip(), self.manual_oferta_var.get().strip(),
+                               self.manual_nome_base_var.get().strip(), self.enviar_xml_ftp_var.get(),
+                               usuario_login, self.destino_txt_var.get(), self.forma_pagamento_txt_var.get(),
+                               self.enviar_txt_ftp_padrao_var.get(), enviar_txt_pessoal, ftp_pessoal_user, ftp_pessoal_pass))
 
-                if not cnpj_str or not nome_base_str:
-                    self.log_message_safe(f"AVISO: CNPJ ('{cnpj_str}') ou NomeArquivo ('{nome_base_str}') inválido/vazio. Pedido XML ignorado.")
-                    continue
-                if not isinstance(grupo, pd.DataFrame) or grupo.empty:
-                    self.log_message_safe(f"AVISO: Grupo vazio para CNPJ {cnpj_str}, Nome {nome_base_str}. Pedido XML ignorado.")
-                    continue
+    def _aplicar_configuracoes_geracao(self):
+        """Copia as opções gerais da interface para os atributos usados pelo núcleo de geração."""
+        self.leitor_planilha = self.leitor_planilha_var.get()
+        self.processos_renderizacao = self.processos_var.get()
+        self.conexoes_ftp = self.conexoes_ftp_var.get()
+        self.envio_continuo = self.envio_continuo_var.get()
+        self.copia_local = self.copia_local_var.get()
+        self.cache_em_disco = self.cache_em_disco_var.get()
+        self.modo_incremental = self.modo_incremental_var.get()
 
-                login_final = manual_login if manual_login else "pdvlinkmerck"
-                nome_arquivo_usado = manual_nome_base if manual_nome_base else nome_base_str
-                codigo_oferta_usado = manual_oferta if manual_oferta else oferta_str
+    def start_retomar_envio_thread(self, tipo):
+        """Põe na fila o reenvio dos arquivos pendentes do último envio FTP ('XML' ou 'TXT')."""
+        self._limpar_log_se_ocioso()
+        self.conexoes_ftp = self.conexoes_ftp_var.get()
+        ftp_pessoal_pass = self.ftp_pessoal_pass_var.get().strip() # Só usada se o envio pendente for para a pasta pessoal
+        self._agendar_execucao(tipo, f"Retomar Envio {tipo}", "_retomar_envio_logic", (None, tipo, ftp_pessoal_pass))
 
-                self.log_message_safe(f"\n🔧 Gerando XML: CNPJ={cnpj_str}, Nome={nome_arquivo_usado}, Oferta={codigo_oferta_usado}, Login={login_final} ({len(grupo)} itens)")
-                xml_path = self._generate_single_xml(cnpj_str, grupo, nome_arquivo_usado, codigo_oferta_usado, login_final)
-                if xml_path:
-                    arquivos_gerados_count += 1
-                    xml_files_to_upload.append(xml_path)
 
-            if enviar_ftp and xml_files_to_upload:
-                self.log_message_safe(f"\n--- Iniciando Envio FTP de XML ({len(xml_files_to_upload)} arquivos) ---")
-                self.log_message_safe(f"Destino: {FTP_XML_UPLOAD_HOST}{FTP_XML_UPLOAD_PATH}")
-                try:
-                    with ftplib.FTP(FTP_XML_UPLOAD_HOST, timeout=60) as ftp:
-                        ftp.set_pasv(True)
-                        self.log_message_safe(f"  Conectado. Login {FTP_XML_UPLOAD_USER}...")
-                        ftp.login(FTP_XML_UPLOAD_USER, FTP_XML_UPLOAD_PASS)
-                        self.log_message_safe(f"  Acessando: {FTP_XML_UPLOAD_PATH}...")
-                        ftp.cwd(FTP_XML_UPLOAD_PATH)
-                        self.log_message_safe("  Enviando...")
-                        uploads_ok = 0
-                        for file_path in xml_files_to_upload:
-                            filename = os.path.basename(file_path)
-                            try:
-                                with open(file_path, 'rb') as f_upload:
-                                    self.log_message_safe(f"    -> {filename}")
-                                    ftp.storbinary(f'STOR {filename}', f_upload)
-                                    uploads_ok += 1
-                            except ftplib.all_errors as ftp_err:
-                                self.log_message_safe(f"      ↳ ERRO FTP ao enviar {filename}: {ftp_err}")
-                            except OSError as io_err:
-                                self.log_message_safe(f"      ↳ ERRO Leitura ao enviar {filename}: {io_err}")
-                            except Exception as up_err:
-                                self.log_message_safe(f"      ↳ ERRO Inesperado ao enviar {filename}: {up_err}")
-                    self.log_message_safe(f"  Envio FTP concluído. {uploads_ok}/{len(xml_files_to_upload)} OK.")
-                except ftplib.all_errors as ftp_conn_err:
-                    self.log_message_safe(f"ERRO CRÍTICO FTP (XML): {ftp_conn_err}")
-                    messagebox.showerror("Erro FTP (XML)", f"Falha na conexão ou autenticação:\n{ftp_conn_err}")
-                    process_ok = False
-                except Exception as ftp_geral_err:
-                    self.log_message_safe(f"ERRO CRÍTICO FTP (XML): Erro inesperado: {ftp_geral_err}")
-                    import traceback
-                    self.log_message_safe(traceback.format_exc())
-                    messagebox.showerror("Erro FTP Inesperado (XML)", f"Ocorreu um erro inesperado durante o envio FTP:\n\n{ftp_geral_err}")
-                    process_ok = False
+    # --- Ganchos do núcleo de geração (versão GUI) ---
+    # Chamados pelas threads de trabalho: tudo o que toca no Tk vai para a thread da janela pela fila de execuções
+    def _notificar(self, nivel, titulo, mensagem):
+        """Exibe a notificação em um messagebox (na thread da janela)."""
+        mostrar = {"error": messagebox.showerror, "warning": messagebox.showwarning}.get(nivel, messagebox.showinfo)
+        self.agendador.na_interface(mostrar, titulo, mensagem)
 
-            if arquivos_gerados_count > 0:
-                msg_final = f"{arquivos_gerados_count} XML(s) gerado(s)."
-                if enviar_ftp:
-                    msg_final += f"\nEnviado(s) via FTP." if process_ok else "\nErro no envio FTP."
-                else:
-                    msg_final += "\nEnvio FTP não selecionado."
-                self.log_message_safe(f"\n✅ Processo concluído! {msg_final}")
-                messagebox.showinfo("Sucesso", msg_final)
-                abrir_arquivo(OUTPUT_XML_DIR, self.log_queue)
-            else:
-                self.log_message_safe("\n⚠ Nenhum XML gerado.")
-                messagebox.showwarning("Atenção", "Nenhum XML gerado.")
+    def _abrir_pasta_saida(self, caminho):
+        """Abre a pasta de saída no explorador de arquivos (na thread da janela)."""
+        self.agendador.na_interface(abrir_arquivo, caminho, self.log_queue)
 
-        except (ValueError, FileNotFoundError, RuntimeError) as e:
-            self.log_message_safe(f"ERRO: {e}")
-            messagebox.showerror("Erro", str(e))
-            process_ok = False
-        except Exception as e:
-            self.log_message_safe(f"❌ Erro inesperado: {e}")
-            import traceback
-            self.log_message_safe(traceback.format_exc())
-            messagebox.showerror("Erro Inesperado", f"Ocorreu um erro:\n{e}")
-            process_ok = False
-        finally:
-            if hasattr(self, 'button_gerar_xml') and self.button_gerar_xml.winfo_exists():
-                self.after(0, lambda: self.button_gerar_xml.configure(state=tk.NORMAL, text="Gerar XML(s)"))
+    def _exibir_metricas(self, metricas):
+        """Mostra o resumo da geração no painel de métricas (na thread da janela)."""
+        self.agendador.na_interface(self._mostrar_resumo_metricas, metricas.resumo())
 
-    def _generate_single_xml(self, cnpj, produtos_df, nome_base, oferta, login):
-        """Gera um único arquivo XML para um grupo de produtos."""
-        try:
-            agora = datetime.now()
-            dt_str = agora.strftime("%d%m%y")
-            hr_str = agora.strftime("%H%M%S")
-            nome_xml = f"pd{login}_{nome_base}_{dt_str}_{hr_str}_1.xml"
-            
-            # Subpasta dentro do diretório XML de saída
-            pasta_destino = os.path.join(OUTPUT_XML_DIR, nome_base)
-            criar_diretorios(self.log_queue, pasta_destino) # Garante subpasta
-            path_xml = os.path.join(pasta_destino, nome_xml)
-
-            root = ET.Element("ArquivoUpload")
-            pedido = ET.SubElement(root, "PEDIDO")
-            item_p = ET.SubElement(pedido, "item")
-            cab = ET.SubElement(item_p, "CABECALHO")
-
-            # Campos do cabeçalho (Hardcoded conforme o script original)
-            campos = {
-                "CODIGOCLIENTE": "00000000",
-                "NOMECLIENTE": "",
-                "CODIGOPEDIDO": "00000000000000000000",
-                "CNPJ": cnpj,
-                "DATA": agora.strftime("%d%m%Y"),
-                "HORA": hr_str,
-                "MENSAGEM": "",
-                "PROMOCAO": oferta,
-                "CNPJFORNEC": "",
-                "NECRETORNO": "",
-                "TIPORETORNO": "",
-                "CANAL": "BBSC",
-                "CODIGOTELE": "",
-                "LOGIN": login,
-                "VALIDADESCONTO": "",
-                "TIPOPAGAMENTO": "2", # Hardcoded '2' no original
-                "TIPOPRAZO": "",
-                "CODIGOCONDPGTO": "000",
-                "CNPJPROJETO": "",
-                "IDPROJETO": "",
-                "PEDIDOPROJETO": "000000006481362",
-                "NOMEPROJETO": "FOCOPDV",
-                "NOMEARQ": nome_xml.replace(".xml", ""),
-                "GLN": "",
-                "CODIGODOPROJETO": "",
-                "CNPJENTREGA": "",
-                "CODUTCLIENTE": "",
-                "CANALPED": "",
-                "CNPJ_COMPR": "",
-                "CNPJ_LOCCOB": "",
-                "GLN_COMPR": "",
-                "GLN_LOCCOB": "",
-                "GLN_LOCENTREGA": "",
-                "GLN_DISTR": "",
-                "CNPJ_LOCENT": ""
-            }
-            for tag, value in campos.items():
-                ET.SubElement(cab, tag).text = str(value)
-
-            itenspedido = ET.SubElement(item_p, "ITENSPEDIDO")
-            itens_tag = ET.SubElement(itenspedido, "ITENS")
-            total_u = 0 # Total de unidades
-            total_i = 0 # Total de itens únicos
-
-            for prod in produtos_df.itertuples(index=False):
-                try:
-                    qtd_v = getattr(prod, 'Quantidade', 0)
-                    # Validação de quantidade (deve ser > 0 e numérica)
-                    if not isinstance(qtd_v, (int, float)) or qtd_v <= 0:
-                        self.log_message_safe(f"    AVISO: Qtd inválida '{qtd_v}' para EAN {getattr(prod, 'EAN', 'N/A')}. Item ignorado no XML.")
-                        continue
-                    qtd_s = str(int(qtd_v)).zfill(5)
+    def _mostrar_resumo_metricas(self, resumo):
+        self._resumos_metricas.append(resumo)
+        if hasattr(self, 'resumo_metricas_label') and self.resumo_metricas_label.winfo_exists():
+            self.resumo_metricas_label.configure(text="\n".join(self._resumos_metricas))
 
-                    ean_v = str(getattr(prod, 'EAN', '')).strip()
-                    # Validação de EAN (deve ser numérico e ter 13 dígitos)
-                    if not ean_v or not ean_v.isdigit() or len(ean_v) != 13:
-                        self.log_message_safe(f"    AVISO: EAN inválido '{ean_v}'. Item ignorado no XML.")
-                        continue
+    # --- Inicialização ---
+    def _ao_mostrar_janela(self, event):
+        """Na primeira vez que a janela é mapeada, agenda a medição para depois do primeiro desenho."""
+        if event.widget is not self or self._primeiro_quadro_medido:
+            return
+        self._primeiro_quadro_medido = True
+        self.after_idle(self._iniciar_pre_carregamento)
 
-                    item_a = ET.SubElement(itens_tag, "item")
-                    ET.SubElement(item_a, "QUANTIDADE").text = qtd_s
-                    ET.SubElement(item_a, "CODPROCLIENTE").text = "00000000000016924231" # Hardcoded
-                    ET.SubElement(item_a, "CODIGOEAN13").text = ean_v
-                    ET.SubElement(item_a, "PERCDESCONTO").text = "19.60" # Hardcoded
-                    ET.SubElement(item_a, "PRECOFABRICA").text = "0000.00" # Hardcoded
-                    ET.SubElement(item_a, "DESCONTOLAB").text = "0000.00" # Hardcoded
-                    ET.SubElement(item_a, "TIPORETORNO").text = "3" # Hardcoded
-                    
-                    total_u += int(qtd_v)
-                    total_i += 1
-                except Exception as item_err:
-                    self.log_message_safe(f"    ERRO ao processar item XML (EAN {getattr(prod, 'EAN', 'N/A')}): {item_err}")
-
-            # Rodapé do pedido
-            ET.SubElement(itenspedido, "NUMITENS").text = str(total_i).zfill(10)
-            ET.SubElement(itenspedido, "UNIDADESPEDIDAS").text = f"{total_u:.2f}".zfill(10) # Formato original é .2f mas zerado
-
-            tree = ET.ElementTree(root)
-            ET.indent(tree, space="\t", level=0) # Formata o XML com indentação
-            tree.write(path_xml, encoding="ISO-8859-1", xml_declaration=True)
-            self.log_message_safe(f"  ✅ XML criado: {path_xml}")
-            return path_xml
-        except Exception as e:
-            self.log_message_safe(f"  ❌ ERRO FATAL ao gerar XML para CNPJ {cnpj}, Nome {nome_base}: {e}")
-            import traceback
-            self.log_message_safe(traceback.format_exc())
-            return None
+    def _iniciar_pre_carregamento(self):
+        primeiro_quadro = time.perf_counter() - _INICIO_PROCESSO
+        threading.Thread(target=self._pre_carregar_modulos, args=(primeiro_quadro,), daemon=True).start()
 
-    # --- Lógica de Geração TXT (Adaptada do Script 2) ---
-    def _generate_txt_logic(self, path, usuario_login, destino, forma_pagamento, enviar_padrao, enviar_pessoal, ftp_user_pessoal, ftp_pass_pessoal):
-        """Lógica principal para ler Excel e gerar arquivos TXT."""
-        gerados = []
+    def _pre_carregar_modulos(self, primeiro_quadro):
+        """Importa os módulos da geração em segundo plano e registra o benchmark de inicialização."""
+        ausentes = pre_carregar_modulos()
+        if ausentes:
+            nomes = " ".join(sorted(ausentes))
+            msg = f"ERRO: Dependência(s) não encontrada(s): {nomes}\n\nInstale com: pip install {nomes}"
+            self.log_message_safe(msg)
+            self.agendador.na_interface(messagebox.showerror, "Erro Dependência", msg)
+            return
+        tempos = {nome: TEMPOS_IMPORTACAO.get(nome, 0.0) for nome in MODULOS_SOB_DEMANDA}
+        detalhes = ", ".join(f"{nome} {t:.2f}s" for nome, t in tempos.items())
+        self.log_message_safe(f"Janela pronta em {primeiro_quadro:.2f}s; módulos de geração carregados em segundo plano ({detalhes}).")
+        linha = {
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "versao": self.APP_VERSION,
+            "importacoes_iniciais_s": round(_TEMPO_IMPORTACOES_INICIAIS, 3),
+            "primeiro_quadro_s": round(primeiro_quadro, 3),
+        }
+        linha.update({f"importar_{nome}_s": round(t, 3) for nome, t in tempos.items()})
         try:
-            forma_map = {"Boleto": "", "Cartão": "2", "PIX": "1"}
-            forma_cod = forma_map.get(forma_pagamento, "") # Mapeia forma de pagamento para código
-
-            self.log_message_safe("Lendo Excel para TXT...");
-            df = pd.read_excel(path, dtype=str).fillna("")
-            self.log_message_safe(f"Lido: {len(df)} linhas.")
-
-            cols_nec = ["CNPJ", "EAN", "QUANTIDADE", "NOME DO ARQUIVO"]
-            cols_falta = [c for c in cols_nec if c not in df.columns]
-            if cols_falta:
-                raise ValueError(f"Coluna(s) faltando para TXT: {', '.join(cols_falta)}")
-
-            # Garante que o diretório base para TXT exista
-            criar_diretorios(self.log_queue, OUTPUT_TXT_DIR)
-
-            arquivos_proc = df["NOME DO ARQUIVO"].dropna().unique()
-            self.log_message_safe(f"Processando {len(arquivos_proc)} pedido(s) TXT...")
-
-            for nome_arq, grupo in df.groupby("NOME DO ARQUIVO"):
-                nome_limpo = str(nome_arq).strip().lower()
-                if not nome_limpo:
-                    self.log_message_safe(f"AVISO: 'NOME DO ARQUIVO' vazio. Pedido TXT ignorado.")
-                    continue
-                self.log_message_safe(f"  Gerando TXT: {nome_limpo}")
-                caminho = self._generate_single_txt(nome_limpo, grupo, usuario_login, forma_cod)
-                if caminho:
-                    gerados.append(caminho)
-
-            if gerados:
-                if enviar_padrao:
-                    ftp_path = FTP_TXT_PATHS_PADRAO.get(destino)
-                    if not ftp_path:
-                        raise ValueError(f"Path FTP Padrão TXT não configurado para '{destino}'.")
-                    self.log_message_safe(f"\nEnviando {len(gerados)} arq(s) para FTP Padrão TXT ({destino})...")
-                    self._send_files_ftp(gerados, ftp_path, FTP_TXT_UPLOAD_HOST, FTP_TXT_UPLOAD_PORT, FTP_TXT_USER_PADRAO, FTP_TXT_PASS_PADRAO)
-                elif enviar_pessoal:
-                    ftp_path_pessoal = f"/saptxt/ftp/{usuario_login}/envio"
-                    self.log_message_safe(f"\nEnviando {len(gerados)} arq(s) para FTP Pessoal TXT ({ftp_path_pessoal})...")
-                    self._send_files_ftp(gerados, ftp_path_pessoal, FTP_TXT_UPLOAD_HOST, FTP_TXT_UPLOAD_PORT, ftp_user_pessoal, ftp_pass_pessoal)
-            
-            msg_final = f"{len(gerados)} arquivo(s) TXT gerado(s)."
-            if gerados and (enviar_padrao or enviar_pessoal):
-                tipo_envio = "FTP Padrão" if enviar_padrao else "FTP Pessoal"
-                msg_final += f"\nEnviado(s) com sucesso via {tipo_envio}."
-            elif not gerados and (enviar_padrao or enviar_pessoal):
-                msg_final += "\nNenhum arquivo válido foi gerado para enviar via FTP."
-            elif not (enviar_padrao or enviar_pessoal):
-                msg_final += "\nNenhuma opção de envio FTP foi selecionada."
-
-            messagebox.showinfo("Concluído", msg_final)
-            if gerados:
-                abrir_arquivo(OUTPUT_TXT_DIR, self.log_queue)
-
-        except (ValueError, FileNotFoundError, RuntimeError) as e:
-            messagebox.showerror("Erro", str(e))
-            self.log_message_safe(f"ERRO: {e}")
-        except Exception as e:
-            messagebox.showerror("Erro Inesperado", f"Ocorreu um erro:\n{e}")
-            import traceback
-            self.log_message_safe(f"ERRO INESPERADO: {e}\n{traceback.format_exc()}")
-        finally:
-            if hasattr(self, 'button_gerar_txt') and self.button_gerar_txt.winfo_exists():
-                self.after(0, lambda: self.button_gerar_txt.configure(state=tk.NORMAL, text="Gerar TXT(s)"))
+            import csv
+            novo = not os.path.exists(self.BENCHMARK_INICIALIZACAO_FILE)
+            with open(self.BENCHMARK_INICIALIZACAO_FILE, "a", encoding="utf-8-sig", newline="") as f:
+                escritor = csv.DictWriter(f, fieldnames=list(linha), delimiter=";")
+                if novo:
+                    escritor.writeheader()
+                escritor.writerow(linha)
+        except OSError as e:
+            print(f"Aviso: Não foi possível registrar o benchmark de inicialização: {e}")
 
-    def _send_files_ftp(self, arquivos_locais, ftp_remote_path, ftp_host, ftp_port, ftp_user, ftp_pass):
-        """Função genérica para enviar arquivos via FTP."""
-        try:
-            with ftplib.FTP() as ftp:
-                self.log_message_safe(f"  Conectando a {ftp_host}:{ftp_port}...")
-                ftp.connect(ftp_host, ftp_port, timeout=30)
-                self.log_message_safe(f"  Login como {ftp_user}...")
-                ftp.login(ftp_user, ftp_pass)
-                self.log_message_safe(f"  Acessando diretório: {ftp_remote_path}")
-                
-                # Criar diretório remoto se não existir (opcional, mas robusto)
-                # Tenta mudar para o diretório; se falhar, tenta criá-lo.
-                try:
-                    ftp.cwd(ftp_remote_path)
-                except ftplib.error_perm:
-                    self.log_message_safe(f"  Diretório remoto '{ftp_remote_path}' não existe. Tentando criar...")
-                    # Percorrer o caminho e criar pastas uma por uma
-                    parts = ftp_remote_path.split('/')
-                    current_path = ''
-                    for part in parts:
-                        if part: # Evita o vazio inicial e múltiplos //
-                            current_path += '/' + part
-                            try:
-                                ftp.cwd(current_path)
-                            except ftplib.error_perm:
-                                ftp.mkd(current_path)
-                                ftp.cwd(current_path)
-                    self.log_message_safe(f"  Diretório remoto '{ftp_remote_path}' criado (se necessário) e acessado.")
-                
-                self.log_message_safe("  Enviando arquivos...")
-                for arq in arquivos_locais:
-                    nome = os.path.basename(arq)
-                    self.log_message_safe(f"    -> {nome}")
-                    with open(arq, 'rb') as file:
-                        ftp.storbinary(f'STOR {nome}', file)
-            self.log_message_safe("Envio FTP concluído.")
-        except ftplib.all_errors as e:
-            self.log_message_safe(f"ERRO CRÍTICO no envio FTP: {e}")
-            raise RuntimeError(f"Erro de FTP: {e}")
-        except Exception as e:
-            self.log_message_safe(f"ERRO INESPERADO no envio FTP: {e}")
-            raise RuntimeError(f"Erro inesperado durante o envio FTP: {e}")
+    # --- Métodos de Logging ---
+    def _limpar_log_se_ocioso(self):
+        """Limpa o log ao começar uma execução, a menos que outra ainda esteja na fila ou em andamento."""
+        if not self.agendador.ativas():
+            self._limpar_log()
 
-    def _generate_single_txt(self, nome_arquivo_base, grupo_df, usuario, forma_pagamento_codigo):
-        """Gera um único arquivo TXT para um grupo de pedidos."""
-        conteudo_escrito = False
+    def _limpar_log(self):
+        """Limpa o textbox e começa um novo histórico completo em LOG_FILE."""
+        if hasattr(self, 'log_textbox') and self.log_textbox.winfo_exists():
+            self.log_textbox.configure(state=tk.NORMAL)
+            self.log_textbox.delete('1.0',tk.END)
+            self.log_textbox.configure(state=tk.DISABLED)
+        self._log_cortado = False
+        self._resumos_metricas = []
+        if self._log_historico is not None:
+            self._log_historico.close()
+            self._log_historico = None
         try:
-            dt_now = datetime.now()
-            dt_str = dt_now.strftime("%d%m%y_%H%M%S")
-            hr_str = dt_now.strftime("%H%M%S")
-            nome_sanitizado = re.sub(r'[<>:"/\\|?*]', '_', nome_arquivo_base)
-            
-            # Subpasta dentro do diretório TXT de saída
-            pasta_pedido = os.path.join(OUTPUT_TXT_DIR, nome_sanitizado)
-            criar_diretorios(self.log_queue, pasta_pedido)
-            
-            nome_txt = f"pd{usuario}_{nome_sanitizado}_{dt_str}.txt"
-            path_txt = os.path.join(pasta_pedido, nome_txt)
-            
-            self.log_message_safe(f"    -> Preparando para salvar TXT em: {path_txt}")
-            with open(path_txt, "w", encoding="latin1") as f:
-                for cnpj, pedidos in grupo_df.groupby("CNPJ"):
-                    cnpj_str = str(cnpj).strip()
-                    # Correção para CNPJ de 13 dígitos adicionando '0' inicial
-                    if len(cnpj_str) == 13 and cnpj_str.isdigit():
-                        cnpj_str = '0' + cnpj_str
-                        self.log_message_safe(f"      AVISO: CNPJ com 13 dígitos detectado. Corrigido para -> {cnpj_str}")
-                    
-                    if not cnpj_str or len(cnpj_str) < 14: # Revalida após possível correção
-                        self.log_message_safe(f"      AVISO: CNPJ inválido ou ausente ('{cnpj_str}') em '{nome_arquivo_base}'. Pedido TXT para este CNPJ ignorado.")
-                        continue
-                    
-                    p = pedidos.iloc[0] # Pega a primeira linha do grupo para dados de cabeçalho
-                    cp = str(p.get("CONDICAO DE PAGAMENTO", "")).strip().upper()
-                    deal = str(p.get("DEAL", "")).strip()
-                    oft_c = str(p.get("OFERTA", "")).strip().upper()
-                    
-                    # Linha 1 (Cabeçalho do Pedido TXT)
-                    r1 = [
-                        "1", cnpj_str, "16", usuario, oft_c, "0", nome_sanitizado,
-                        "2.1.34", "01206820003708", "", "", "", "", "0", deal, cp,
-                        hr_str, forma_pagamento_codigo, "6e6079c8a0744532a84663bf5dc67f69"
-                    ]
-                    f.write(";".join(map(str, r1)) + ";\n")
-                    conteudo_escrito = True
-                    
-                    itens_ok = 0
-                    for _, item in pedidos.iterrows():
-                        ean = str(item.get("EAN", "")).strip()
-                        qtd = str(item.get("QUANTIDADE", "")).strip()
-                        oft_i = str(item.get("OFERTA", oft_c)).strip().upper() # Oferta do item ou do cabeçalho
-                        deal_i = str(item.get("DEAL", deal)).strip() # Deal do item ou do cabeçalho
-                        cond_i = str(item.get("CONDICAO DE PAGAMENTO", cp)).strip().upper() # Condição do item ou do cabeçalho
-                        suf = str(item.get("SUFIXO", "")).strip()
-                        
-                        # Validação de item (EAN e QUANTIDADE)
-                        if not ean or not qtd or not qtd.isdigit() or int(qtd) <= 0:
-                            self.log_message_safe(f"      AVISO: Item inválido (EAN='{ean}', QTD='{qtd}') em '{nome_arquivo_base}', CNPJ '{cnpj_str}'. Item TXT ignorado.")
-                            continue
-                        
-                        # Linha 2 (Item do Pedido TXT)
-                        r2 = ["2", ean, qtd, oft_i, "0", "", "", deal_i, cond_i, "0", "", suf]
-                        f.write(";".join(map(str, r2)) + ";\n")
-                        itens_ok += 1
-                    
-                    if itens_ok > 0:
-                        # Linha 3 (Rodapé do Pedido TXT)
-                        r3 = ["3", str(itens_ok), str(itens_ok)]
-                        f.write(";".join(map(str, r3)) + ";\n")
-                    else:
-                        self.log_message_safe(f"      AVISO: Nenhum item válido para o CNPJ '{cnpj_str}' em '{nome_arquivo_base}'. Rodapé TXT não gerado.")
-
-            if not conteudo_escrito:
-                self.log_message_safe(f"ERRO: Arquivo TXT '{nome_txt}' não foi gerado pois não continha nenhum CNPJ ou item válido na planilha para este 'NOME DO ARQUIVO'.")
-                # Se nada foi escrito, remove o arquivo e a pasta se estiver vazia
-                try: os.remove(path_txt)
-                except OSError: pass # Ignora se o arquivo já não existe
-                try: os.rmdir(pasta_pedido)
-                except OSError: pass # Ignora se a pasta não está vazia ou não existe
-                return None
-            
-            return path_txt
-        except Exception as e:
-            self.log_message_safe(f"ERRO CRÍTICO ao gerar TXT '{nome_arquivo_base}': {e}")
-            import traceback; traceback.print_exc()
-            return None
+            self._log_historico = open(self.LOG_FILE, "w", encoding="utf-8")
+        except OSError as e:
+            print(f"Erro ao abrir arquivo de log {self.LOG_FILE}: {e}")
 
-    # --- Métodos de Logging ---
-    def log_message_safe(self, message):
-        """Adiciona uma mensagem à fila de logs de forma segura para threads."""
+    def _gravar_historico_log(self, texto):
+        if self._log_historico is None:
+            try:
+                self._log_historico = open(self.LOG_FILE, "a", encoding="utf-8")
+            except OSError as e:
+                print(f"Erro ao abrir arquivo de log {self.LOG_FILE}: {e}")
+                return
         try:
-            self.log_queue.put(str(message))
-        except Exception as e:
-            print(f"Erro ao adicionar à fila de log: {e}")
+            self._log_historico.write(texto)
+            self._log_historico.flush()
+        except OSError as e:
+            print(f"Erro ao gravar arquivo de log: {e}")
 
     def process_log_queue(self):
-        """Processa as mensagens da fila de logs e as exibe no textbox da GUI."""
+        """
+        Esvazia a fila de logs em lotes: junta as mensagens pendentes (dentro de LOG_ORCAMENTO_MS)
+        em uma única inserção no textbox, que mantém só as últimas LOG_MAX_LINHAS linhas.
+        O histórico completo vai para LOG_FILE.
+        """
+        restam = False
         try:
-            while True:
-                message = self.log_queue.get_nowait()
+            linhas = []
+            limite = time.perf_counter() + self.LOG_ORCAMENTO_MS / 1000
+            try:
+                while True:
+                    linhas.append(self.log_queue.get_nowait())
+                    if len(linhas) % 256 == 0 and time.perf_counter() > limite:
+                        restam = True # O resto fica para o próximo ciclo, sem travar a janela
+                        break
+            except queue.Empty:
+                pass # Nenhuma mensagem na fila
+
+            if linhas:
+                ts = datetime.now().strftime("%H:%M:%S")
+                linhas = [f"[{ts}] {message}\n" for message in linhas]
+                self._gravar_historico_log("".join(linhas))
                 if hasattr(self, 'log_textbox') and self.log_textbox and self.log_textbox.winfo_exists():
                     try:
-                        self.log_textbox.configure(state=tk.NORMAL)
-                        ts = datetime.now().strftime("%H:%M:%S")
-                        self.log_textbox.insert(tk.END, f"[{ts}] {message}\n")
-                        self.log_textbox.see(tk.END) # Rola para o final
-                        self.log_textbox.configure(state=tk.DISABLED)
+                        self._inserir_no_textbox("".join(linhas[-self.LOG_MAX_LINHAS:]))
                     except Exception as e:
                         print(f"Erro ao atualizar textbox de log: {e}")
                 else:
-                    print(f"LOG: {message}")
-        except queue.Empty:
-            pass # Nenhuma mensagem na fila
+                    print("LOG: " + "LOG: ".join(linhas), end="")
         except Exception as e:
             print(f"Erro na fila de log principal: {e}")
         finally:
             # Agenda a próxima chamada para continuar processando a fila
             if self and self.winfo_exists():
-                self.after(100, self.process_log_queue)
+                self.after(1 if restam else self.LOG_INTERVALO_MS, self.process_log_queue)
+
+    def _inserir_no_textbox(self, texto):
+        """Uma inserção por lote; descarta as linhas mais antigas acima de LOG_MAX_LINHAS."""
+        self.log_textbox.configure(state=tk.NORMAL)
+        self.log_textbox.insert(tk.END, texto)
+        total = int(self.log_textbox.index('end-1c').split('.')[0])
+        excesso = total - self.LOG_MAX_LINHAS
+        if excesso > 0:
+            if not self._log_cortado:
+                self._log_cortado = True
+                self.log_textbox.insert('1.0', f"(linhas antigas omitidas; log completo em: {self.LOG_FILE})\n")
+                excesso += 1
+            # A linha 1 é o aviso acima: remove a partir da linha 2
+            self.log_textbox.delete('2.0', f'{2 + excesso}.0')
+        self.log_textbox.see(tk.END) # Rola para o final
+        self.log_textbox.configure(state=tk.DISABLED)
 
     # --- Métodos de Configuração (Sobrescrevendo o template) ---
     def _setup_auto_save_triggers(self):
@@ -1081,6 +4282,13 @@ class UnifiedOrderGeneratorApp(ModernAppTemplate):
         # Radio buttons (destino e forma pagamento) também acionam salvamento
         self.destino_txt_var.trace_add("write", self._auto_save_on_change)
         self.forma_pagamento_txt_var.trace_add("write", self._auto_save_on_change)
+        self.leitor_planilha_var.trace_add("write", self._auto_save_on_change)
+        self.processos_var.trace_add("write", self._auto_save_on_change)
+        self.conexoes_ftp_var.trace_add("write", self._auto_save_on_change)
+        self.envio_continuo_var.trace_add("write", self._auto_save_on_change)
+        self.copia_local_var.trace_add("write", self._auto_save_on_change)
+        self.cache_em_disco_var.trace_add("write", self._auto_save_on_change)
+        self.modo_incremental_var.trace_add("write", self._auto_save_on_change)
 
 
     def _salvar_configuracoes(self):
@@ -1098,12 +4306,22 @@ class UnifiedOrderGeneratorApp(ModernAppTemplate):
             "txt_enviar_ftp_padrao": self.enviar_txt_ftp_padrao_var.get(),
             "txt_enviar_ftp_pessoal": self.enviar_txt_ftp_pessoal_var.get(),
             "txt_ftp_pessoal_user": self.ftp_pessoal_user_var.get(),
-            "txt_ftp_pessoal_pass": self.ftp_pessoal_pass_var.get()
+            "txt_ftp_pessoal_pass": self.ftp_pessoal_pass_var.get(),
+            "leitor_planilha": self.leitor_planilha_var.get(),
+            "processos_renderizacao": self.processos_var.get(),
+            "conexoes_ftp": self.conexoes_ftp_var.get(),
+            "envio_continuo": self.envio_continuo_var.get(),
+            "copia_local": self.copia_local_var.get(),
+            "cache_em_disco": self.cache_em_disco_var.get(),
+            "modo_incremental": self.modo_incremental_var.get()
         }
+        texto = json.dumps(config, indent=4)
+        if texto == self._config_salva:
+            return # Nada mudou desde o último salvamento
         try:
-            with open(self.CONFIG_FILE, 'w') as f:
-                json.dump(config, f, indent=4)
-            # print(f"Configurações salvas em: {self.CONFIG_FILE}")
+            # Temporário + rename: uma queda no meio da escrita não corrompe a configuração
+            gravar_arquivo_atomico(self.CONFIG_FILE, texto.encode("utf-8"))
+            self._config_salva = texto
         except Exception as e:
             print(f"ERRO ao salvar configurações: {e}")
             # messagebox.showerror("Erro de Salvamento", f"Não foi possível salvar as configurações:\n{e}") # Evitar messagebox em threads
@@ -1114,8 +4332,10 @@ class UnifiedOrderGeneratorApp(ModernAppTemplate):
         ctk.set_appearance_mode("System") # Padrão para Sistema se não houver configuração ou erro
         try:
             if os.path.exists(self.CONFIG_FILE):
-                with open(self.CONFIG_FILE, 'r') as f:
-                    config = json.load(f)
+                with open(self.CONFIG_FILE, 'r', encoding='utf-8') as f:
+                    texto = f.read()
+                config = json.loads(texto)
+                self._config_salva = texto
                 
                 # Aplica o modo de aparência primeiro
                 modo_aparencia = config.get("modo_aparencia", "System")
@@ -1134,6 +4354,13 @@ class UnifiedOrderGeneratorApp(ModernAppTemplate):
                 self.enviar_txt_ftp_pessoal_var.set(config.get("txt_enviar_ftp_pessoal", False))
                 self.ftp_pessoal_user_var.set(config.get("txt_ftp_pessoal_user", ""))
                 self.ftp_pessoal_pass_var.set(config.get("txt_ftp_pessoal_pass", ""))
+                self.leitor_planilha_var.set(config.get("leitor_planilha", "auto"))
+                self.processos_var.set(config.get("processos_renderizacao", "1"))
+                self.conexoes_ftp_var.set(config.get("conexoes_ftp", "4"))
+                self.envio_continuo_var.set(config.get("envio_continuo", True))
+                self.copia_local_var.set(config.get("copia_local", "sempre"))
+                self.cache_em_disco_var.set(config.get("cache_em_disco", False))
+                self.modo_incremental_var.set(config.get("modo_incremental", False))
 
             # print(f"Configurações carregadas de: {self.CONFIG_FILE}")
         except Exception as e:
@@ -1152,47 +4379,574 @@ class UnifiedOrderGeneratorApp(ModernAppTemplate):
             self.enviar_txt_ftp_pessoal_var.set(False)
             self.ftp_pessoal_user_var.set("")
             self.ftp_pessoal_pass_var.set("")
+            self.leitor_planilha_var.set("auto")
+            self.processos_var.set("1")
+            self.conexoes_ftp_var.set("4")
+            self.envio_continuo_var.set(True)
+            self.copia_local_var.set("sempre")
+            self.cache_em_disco_var.set(False)
+            self.modo_incremental_var.set(False)
             ctk.set_appearance_mode("System") # Redefine o tema
 
     def on_closing(self):
         """Lida com o evento de fechamento da janela."""
-        self._salvar_configuracoes()
+        self._cancelar_auto_save()
+        self._salvar_configuracoes() # Grava na hora o que ainda estava agendado
+        self.agendador.encerrar() # As execuções em andamento param no próximo grupo ou arquivo
+        encerrar_sessoes_ftp()
+        if self._log_historico is not None:
+            self._log_historico.close()
         self.destroy()
 
+def criar_janela():
+    """Importa a interface gráfica e cria a janela (UnifiedOrderGeneratorApp sobre ctk.CTk)."""
+    class JanelaPedidos(UnifiedOrderGeneratorApp, ctk.CTk):
+        pass
+    return JanelaPedidos()
+
 # ==============================================================================
-# BLOCO DE EXECUÇÃO PRINCIPAL
+# MODO HEADLESS (LINHA DE COMANDO, SEM TK)
 # ==============================================================================
-if __name__ == "__main__":
-    dependencias_ok = True
-    libs_necessarias = ['customtkinter', 'pandas', 'openpyxl']
-    
-    # Verifica se as dependências estão instaladas
+class LogConsole:
+    """Substituto da fila de logs para o modo headless: imprime cada mensagem na hora."""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def put(self, message):
+        ts = datetime.now().strftime("%H:%M:%S")
+        with self._lock:
+            print(f"[{ts}] {message}", file=self.stream, flush=True)
+
+
+class HeadlessOrderGenerator(OrderGeneratorCore):
+    """Executa a mesma geração/envio da GUI sem criar janela (cron, containers)."""
+    def __init__(self, output_base_dir=None, log_queue=None):
+        self.log_queue = log_queue if log_queue is not None else LogConsole()
+        if output_base_dir:
+            self.output_xml_dir = os.path.join(output_base_dir, "XML_Pedidos")
+            self.output_txt_dir = os.path.join(output_base_dir, "TXT_Pedidos")
+            self.pasta_diarios_envio = os.path.join(output_base_dir, "Diarios_Envio_FTP")
+            self.pasta_relatorios = os.path.join(output_base_dir, "Relatorios_Execucao")
+            self.arquivo_registro_pedidos = os.path.join(output_base_dir, "registro_pedidos.sqlite3")
+            self.arquivo_erros = os.path.join(output_base_dir, os.path.basename(arquivo_erro_xlsx))
+
+    def _notificar(self, nivel, titulo, mensagem):
+        """Notificações viram linhas de log (erros também vão para o stderr)."""
+        texto = mensagem.replace("\n", " ")
+        self.log_message_safe(f"[{titulo}] {texto}")
+        if nivel == "error":
+            print(f"{titulo}: {texto}", file=sys.stderr, flush=True)
+
+
+# ==============================================================================
+# MONITORAMENTO DE PASTA (PROCESSO SEMPRE NO AR)
+# ==============================================================================
+# Subpastas da pasta monitorada que definem o modo de geração (o resto é decidido pelas colunas)
+SUBPASTAS_MODO = {"xml": "XML", "txt": "TXT", "ambos": "AMBOS"}
+PASTA_MONITOR_PROCESSADOS = "Processados"
+PASTA_MONITOR_FALHAS = "Falhas"
+
+def modo_pelas_colunas(colunas):
+    """'XML' ou 'TXT' conforme a coluna de nome do arquivo presente (NomeArquivo ou NOME DO ARQUIVO); None se não der para decidir."""
+    xml, txt = "NomeArquivo" in colunas, "NOME DO ARQUIVO" in colunas
+    if xml == txt:
+        return None
+    return "XML" if xml else "TXT"
+
+def planilha_completa(caminho):
+    """
+    Confere o fim do arquivo, para não ler uma planilha ainda sendo copiada: um .xlsx
+    precisa terminar com o diretório central do zip e um .parquet com a marca 'PAR1'.
+    CSV não tem marca de fim; vale só a estabilidade do tamanho.
+    """
+    extensao = os.path.splitext(caminho)[1].lower()
     try:
-        for lib in libs_necessarias:
-            __import__(lib)
-    except ImportError as import_err:
-        dependencias_ok = False
-        error_msg = f"ERRO: Dependência '{import_err.name}' não encontrada!\n\nInstale com: pip install {' '.join(libs_necessarias)}"
-        print(error_msg)
-        # Tenta mostrar um messagebox de erro antes de sair
+        if extensao == ".xlsx":
+            import zipfile
+            return zipfile.is_zipfile(caminho)
+        if extensao == ".parquet":
+            with open(caminho, "rb") as f:
+                f.seek(-4, os.SEEK_END)
+                return f.read(4) == b"PAR1"
+        with open(caminho, "rb"):
+            return True
+    except OSError: # Ainda bloqueado por quem está copiando (Windows) ou removido
+        return False
+
+class ObservadorInotify:
+    """
+    Acorda o monitor quando um arquivo é fechado após escrita, movido ou criado nas
+    pastas observadas (inotify do Linux, chamado pela libc via ctypes). Os eventos não
+    são interpretados: qualquer um faz a pasta ser relida.
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            erro = ctypes.get_errno()
+            raise OSError(erro, f"inotify_init1: {os.strerror(erro)}")
+        self._pastas = set()
+
+    def adicionar(self, pasta):
+        if pasta in self._pastas:
+            return
+        import ctypes
+        mascara = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if self._libc.inotify_add_watch(self._fd, os.fsencode(pasta), mascara) < 0:
+            erro = ctypes.get_errno()
+            raise OSError(erro, f"inotify_add_watch({pasta}): {os.strerror(erro)}")
+        self._pastas.add(pasta)
+
+    def aguardar(self, timeout):
+        """Espera um evento por até 'timeout' segundos e descarta os eventos acumulados."""
+        import select
+        prontos, _, _ = select.select([self._fd], [], [], timeout)
+        if not prontos:
+            return
         try:
-            root_temp = tk.Tk()
-            root_temp.withdraw() # Oculta a janela principal do Tkinter
-            messagebox.showerror("Erro Dependência", error_msg)
-            root_temp.destroy()
-        except:
-            pass # Se o messagebox falhar, apenas sai
-        sys.exit(1)
-
-    if dependencias_ok:
-        # DPI awareness para Windows
-        if sys.platform == "win32":
+            while os.read(self._fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def fechar(self):
+        os.close(self._fd)
+
+class ObservadorPolling:
+    """Alternativa ao inotify (Windows, macOS, compartilhamentos de rede): a pasta é relida a cada intervalo."""
+    def adicionar(self, pasta):
+        pass
+
+    def aguardar(self, timeout):
+        time.sleep(timeout)
+
+    def fechar(self):
+        pass
+
+class MonitorPasta(HeadlessOrderGenerator):
+    """
+    Processo que fica no ar observando uma pasta de entrada. Cada planilha que chega,
+    depois de totalmente gravada, passa pela geração XML, TXT ou combinada e é movida
+    para Processados/ ou Falhas/ (com a planilha de erros dela, se houver linhas
+    rejeitadas). O modo vem da subpasta (XML/, TXT/ ou AMBOS/) ou, na raiz, das
+    colunas da planilha. Módulos, processos de renderização e sessões FTP ficam
+    abertos entre uma planilha e outra.
+
+    'parametros' tem, por modo, os argumentos da geração avulsa sem a planilha.
+    """
+    # Segundos com tamanho e data inalterados para a planilha ser considerada completa
+    espera_estabilidade = 2.0
+    # Segundos entre releituras da pasta sem inotify (com inotify, só a verificação de segurança)
+    intervalo = 5.0
+    intervalo_inotify = 30.0
+    # Segundos entre os NOOPs que mantêm vivas as sessões FTP ociosas
+    intervalo_manter_ftp = 60.0
+
+    def __init__(self, pasta, parametros, output_base_dir=None, log_queue=None, usar_inotify=True):
+        super().__init__(output_base_dir=output_base_dir, log_queue=log_queue)
+        self.pasta = os.path.abspath(pasta)
+        self.parametros = parametros
+        self.usar_inotify = usar_inotify
+        self.pasta_processados = os.path.join(self.pasta, PASTA_MONITOR_PROCESSADOS)
+        self.pasta_falhas = os.path.join(self.pasta, PASTA_MONITOR_FALHAS)
+        self._candidatas = {} # caminho -> (tamanho, mtime, instante em que parou de mudar)
+        self._recusadas = {} # caminho -> (tamanho, mtime) das que não puderam ser movidas
+        self._processando = False
+        self._fim_ultima = 0.0
+        self.parar = threading.Event()
+
+    def _criar_observador(self):
+        if self.usar_inotify and sys.platform.startswith("linux"):
             try:
-                from ctypes import windll
-                windll.shcore.SetProcessDpiAwareness(1)
-            except Exception as e:
-                print(f"Aviso: Não foi possível definir DPI awareness: {e}")
-        
-        app = UnifiedOrderGeneratorApp()
-        app.protocol("WM_DELETE_WINDOW", app.on_closing) # Garante que a configuração seja salva ao fechar
-        app.mainloop()
+                observador = ObservadorInotify()
+                self.log_message_safe("Monitorando com inotify.")
+                return observador, self.intervalo_inotify
+            except OSError as e:
+                self.log_message_safe(f"AVISO: inotify indisponível ({e}). Usando releitura periódica da pasta.")
+        self.log_message_safe(f"Monitorando com releitura da pasta a cada {self.intervalo:g}s.")
+        return ObservadorPolling(), self.intervalo
+
+    def _pastas_entrada(self):
+        """[(pasta, modo)]: a raiz (modo pelas colunas) e as subpastas de modo existentes."""
+        pastas = [(self.pasta, None)]
+        for nome in sorted(os.listdir(self.pasta)):
+            caminho = os.path.join(self.pasta, nome)
+            if nome.lower() in SUBPASTAS_MODO and os.path.isdir(caminho):
+                pastas.append((caminho, SUBPASTAS_MODO[nome.lower()]))
+        return pastas
+
+    def _prontas(self, observador):
+        """Relê as pastas de entrada e devolve [(planilha, modo)] das que já terminaram de ser gravadas."""
+        agora = time.monotonic()
+        vistas = set()
+        prontas = []
+        for pasta, modo in self._pastas_entrada():
+            observador.adicionar(pasta)
+            for caminho in planilhas_do_lote([pasta]):
+                vistas.add(caminho)
+                try:
+                    st = os.stat(caminho)
+                except OSError:
+                    continue
+                assinatura = (st.st_size, st.st_mtime_ns)
+                if self._recusadas.get(caminho) == assinatura:
+                    continue
+                anterior = self._candidatas.get(caminho)
+                if anterior is None or anterior[:2] != assinatura:
+                    self._candidatas[caminho] = assinatura + (agora,)
+                elif agora - anterior[2] >= self.espera_estabilidade and planilha_completa(caminho):
+                    prontas.append((caminho, modo))
+        for caminho in set(self._candidatas) - vistas:
+            del self._candidatas[caminho]
+        return prontas
+
+    def executar(self):
+        """Laço principal: só termina com parar.set(), Ctrl+C ou SIGTERM (cancelando a planilha em andamento)."""
+        os.makedirs(self.pasta, exist_ok=True)
+        pre_carregar_modulos()
+        processos = resolver_processos(self.processos_renderizacao)
+        if processos > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool_processos = ProcessPoolExecutor(max_workers=processos)
+        self._aquecer_ftp()
+        observador, espera_maxima = self._criar_observador()
+        self.log_message_safe(f"Aguardando planilhas em {self.pasta} (subpastas {', '.join(SUBPASTAS_MODO.values())} "
+                              f"definem o modo; na raiz ele vem das colunas). Ctrl+C encerra.")
+        ultima_manutencao = time.monotonic()
+        try:
+            while not self.parar.is_set():
+                for caminho, modo in self._prontas(observador):
+                    if self.parar.is_set():
+                        break
+                    self._processando = True
+                    try:
+                        self._processar(caminho, modo)
+                    finally:
+                        self._processando = False
+                        self._candidatas.pop(caminho, None)
+                if self.parar.is_set():
+                    break
+                if time.monotonic() - ultima_manutencao >= self.intervalo_manter_ftp:
+                    manter_sessoes_ftp()
+                    ultima_manutencao = time.monotonic()
+                # Com planilhas ainda sendo copiadas, volta logo para conferir se terminaram
+                observador.aguardar(min(espera_maxima, self.espera_estabilidade) if self._candidatas else espera_maxima)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            observador.fechar()
+            if self.pool_processos is not None:
+                self.pool_processos.shutdown()
+                self.pool_processos = None
+            encerrar_sessoes_ftp()
+            self.log_message_safe("Monitoramento encerrado.")
+
+    def interromper(self, *_):
+        """
+        Pede o encerramento (sinal SIGTERM/SIGINT). Parado, sai na hora; processando, cancela a
+        planilha atual entre grupos/arquivos e ela fica na pasta de entrada para a próxima execução.
+        """
+        self.parar.set()
+        if not self._processando:
+            raise KeyboardInterrupt
+        self.log_message_safe("⏹ Cancelando a planilha atual... (Ctrl+C de novo para interromper na hora)")
+        self.progresso.cancelar()
+
+    def _aquecer_ftp(self):
+        """Abre as sessões FTP dos envios configurados antes da primeira planilha chegar."""
+        uploaders = []
+        parametros_xml = self.parametros.get("XML")
+        if parametros_xml and parametros_xml[-1]: # enviar_ftp
+            uploaders.append(self._criar_uploader_xml())
+        parametros_txt = self.parametros.get("TXT")
+        if parametros_txt:
+            usuario_login, destino, _, enviar_padrao, enviar_pessoal, ftp_user, ftp_pass = parametros_txt
+            uploaders.append(self._criar_uploader_txt(usuario_login, destino, enviar_padrao, enviar_pessoal, ftp_user, ftp_pass))
+        for uploader in uploaders:
+            if uploader is not None:
+                uploader.aquecer()
+
+    def _processar(self, caminho, modo):
+        """Gera os pedidos de uma planilha e a move para Processados/ ou Falhas/."""
+        self.log_message_safe(f"\n=== Nova planilha: {caminho} ===")
+        # Os nomes levam a hora até o segundo: a numeração só precisa continuar dentro do mesmo segundo
+        if time.time() - self._fim_ultima > 1:
+            self.sequencia_nomes = SequenciaNomes()
+        self.progresso = ProgressoGeracao()
+        self.progresso.iniciar()
+        if self.parar.is_set(): # Sinal recebido antes deste progresso existir
+            self.progresso.cancelar()
+        ok = False
+        try:
+            motor = escolher_leitor(self.leitor_planilha, caminho)
+            colunas = COLUNAS_POR_MODO[modo or "AMBOS"]
+            if self.pool_processos is not None:
+                df = self.pool_processos.submit(ler_planilha, caminho, colunas, motor).result()
+            else:
+                df = ler_planilha(caminho, colunas, motor)
+            self.log_message_safe(f"Lido: {len(df)} linhas (motor: {motor}).")
+            if modo is None:
+                modo = modo_pelas_colunas(df.columns)
+                if modo is None:
+                    raise ValueError("Não foi possível decidir entre XML e TXT pelas colunas (NomeArquivo / NOME DO ARQUIVO). "
+                                     "Coloque a planilha na subpasta XML, TXT ou AMBOS.")
+                self.log_message_safe(f"Modo {modo}, pelas colunas da planilha.")
+                df = df[[c for c in COLUNAS_POR_MODO[modo] if c in df.columns]]
+            if modo not in self.parametros:
+                raise ValueError(f"Geração {modo} não configurada neste monitor.")
+            gerar = {"XML": self._generate_xml_logic, "TXT": self._generate_txt_logic, "AMBOS": self._generate_ambos_logic}[modo]
+            ok = gerar(caminho, *self.parametros[modo], df=df)
+            # A geração trata o próprio cancelamento e só devolve False
+            self.progresso.verificar_cancelamento()
+        except GeracaoCancelada:
+            self.log_message_safe(f"⏹ Planilha cancelada; ela continua em {os.path.dirname(caminho)} e será processada na próxima execução.")
+            return
+        except Exception as e:
+            self.log_message_safe(f"ERRO: {e}")
+        finally:
+            self._fim_ultima = time.time()
+            self.progresso.finalizar()
+        self._mover(caminho, self.pasta_processados if ok else self.pasta_falhas)
+
+    def _mover(self, caminho, pasta):
+        """Move a planilha (e a planilha de erros desta geração, se houver) com a data/hora na frente do nome."""
+        nome, extensao = os.path.splitext(os.path.basename(caminho))
+        base = os.path.join(pasta, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{nome}")
+        destino, n = base + extensao, 1
+        while os.path.exists(destino):
+            n += 1
+            destino = f"{base}_{n}{extensao}"
+        try:
+            os.makedirs(pasta, exist_ok=True)
+            os.replace(caminho, destino)
+        except OSError as e:
+            st = os.stat(caminho) if os.path.exists(caminho) else None
+            if st is not None:
+                self._recusadas[caminho] = (st.st_size, st.st_mtime_ns) # Não reprocessa até a planilha mudar
+            self.log_message_safe(f"AVISO: Não foi possível mover {caminho} para {pasta}: {e}")
+            return
+        self.log_message_safe(f"Planilha movida para: {destino}")
+        if os.path.exists(self.arquivo_erros): # Só existe se esta geração rejeitou linhas
+            try:
+                os.replace(self.arquivo_erros, os.path.splitext(destino)[0] + "_erros.xlsx")
+            except OSError as e:
+                self.log_message_safe(f"AVISO: Não foi possível mover a planilha de erros: {e}")
+
+
+def criar_parser_cli():
+    """Monta o parser de argumentos do modo linha de comando."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Gera pedidos XML ou EPAN (TXT) a partir de uma planilha, sem abrir a interface gráfica.")
+    modo = parser.add_mutually_exclusive_group(required=True)
+    modo.add_argument("--xml", action="store_true", help="Gera pedidos XML.")
+    modo.add_argument("--txt", action="store_true", help="Gera pedidos EPAN (TXT).")
+    modo.add_argument("--ambos", action="store_true",
+                      help="Gera XML e TXT com uma única leitura da planilha (usa as opções XML e TXT).")
+    modo.add_argument("--benchmark", action="store_true",
+                      help="Mede as gerações XML/TXT com planilhas sintéticas e um servidor FTP local "
+                           "(benchmark_pedidos.py, fora do executável; opções em --benchmark --help).")
+    modo.add_argument("--retomar", nargs="?", const="", metavar="DIARIO",
+                      help="Reenvia só os arquivos pendentes do último envio FTP interrompido (ou do diário .jsonl informado).")
+    modo.add_argument("--monitorar", metavar="PASTA",
+                      help="Fica no ar gerando cada planilha que chegar na pasta (subpastas XML, TXT ou AMBOS; na raiz, "
+                           "o modo vem das colunas) e a move para Processados/ ou Falhas/. Usa as opções XML e TXT.")
+    parser.add_argument("planilhas", nargs="*", metavar="PLANILHA",
+                        help="Planilha(s) (.xlsx, .csv ou .parquet) ou pasta(s) com planilhas. Mais de uma planilha gera um lote.")
+    parser.add_argument("--saida", help="Pasta base de saída (padrão: Pedidos_Gerados_Unified ao lado do programa).")
+    parser.add_argument("--leitor", choices=["auto"] + list(LEITORES_PLANILHA), default="auto",
+                        help="Motor de leitura de planilhas .xlsx (padrão: o mais rápido instalado).")
+    parser.add_argument("--processos", default="1",
+                        help="Processos para renderizar os pedidos: N ou 'auto' (todos os núcleos). Padrão: 1.")
+    parser.add_argument("--conexoes-ftp", type=int, default=4, help="Conexões FTP simultâneas por envio (padrão: 4).")
+    parser.add_argument("--envio-em-lote", action="store_true",
+                        help="Envia via FTP só depois de gerar todos os arquivos (padrão: envia cada um assim que é gravado).")
+    parser.add_argument("--copia-local", choices=["sempre", "depois", "falhas"], default="sempre",
+                        help="Com envio FTP: 'sempre' grava antes de enviar; 'depois' envia da memória e grava em segundo plano; "
+                             "'falhas' envia da memória e só grava o que não foi enviado.")
+    parser.add_argument("--cache-disco", action="store_true",
+                        help="Guarda a planilha lida no cache em disco (execuções seguintes na mesma planilha não a releem).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Gera e envia só os pedidos novos ou alterados desde a última execução (registro em registro_pedidos.sqlite3).")
+    parser.add_argument("--login", default="", help="XML: login (padrão pdvlinkmerck). TXT e --ambos: login do usuário (obrigatório).")
+    parser.add_argument("--login-xml", default="", help="Com --ambos: login dos XMLs (padrão pdvlinkmerck).")
+
+    grupo_xml = parser.add_argument_group("opções XML")
+    grupo_xml.add_argument("--oferta", default="", help="Substitui a oferta da planilha.")
+    grupo_xml.add_argument("--nome-base", default="", help="Substitui o NomeArquivo da planilha.")
+    grupo_xml.add_argument("--ftp", action="store_true", help="Envia os XMLs via FTP após gerar.")
+
+    grupo_txt = parser.add_argument_group("opções TXT")
+    grupo_txt.add_argument("--destino", choices=sorted(FTP_TXT_PATHS_PADRAO), default="EPP", help="Destino do FTP padrão.")
+    grupo_txt.add_argument("--pagamento", choices=["Boleto", "Cartão", "PIX"], default="Boleto", help="Forma de pagamento.")
+    envio_txt = grupo_txt.add_mutually_exclusive_group()
+    envio_txt.add_argument("--ftp-padrao", action="store_true", help="Envia os TXTs para o FTP padrão do destino.")
+    envio_txt.add_argument("--ftp-pessoal", action="store_true", help="Envia os TXTs para a pasta pessoal no FTP.")
+    grupo_txt.add_argument("--ftp-user", default="", help="Usuário do FTP pessoal.")
+    grupo_txt.add_argument("--ftp-pass", default=os.environ.get("PEDIDOS_FTP_PASS", ""),
+                           help="Senha do FTP pessoal (ou variável de ambiente PEDIDOS_FTP_PASS).")
+
+    grupo_monitor = parser.add_argument_group("opções do monitoramento (--monitorar; o login dos XMLs é --login-xml)")
+    grupo_monitor.add_argument("--intervalo", type=float, default=MonitorPasta.intervalo,
+                               help="Segundos entre as releituras da pasta sem inotify (padrão: %(default)s).")
+    grupo_monitor.add_argument("--estabilidade", type=float, default=MonitorPasta.espera_estabilidade,
+                               help="Segundos sem mudar de tamanho para a planilha ser considerada completa (padrão: %(default)s).")
+    grupo_monitor.add_argument("--sem-inotify", action="store_true",
+                               help="Relê a pasta a cada intervalo em vez de usar inotify (ex.: pasta em compartilhamento de rede).")
+
+    return parser
+
+
+def executar_benchmark_cli(argv):
+    """
+    --benchmark: a suíte (planilhas sintéticas, servidor FTP local) fica em benchmark_pedidos.py,
+    ao lado do script, importada só aqui para não entrar no executável.
+    """
+    import importlib
+    try:
+        benchmark = importlib.import_module("benchmark_pedidos")
+    except ModuleNotFoundError as e:
+        if e.name != "benchmark_pedidos":
+            raise
+        print("ERRO: --benchmark requer o arquivo benchmark_pedidos.py ao lado do script (não faz parte do executável).",
+              file=sys.stderr)
+        return 2
+    return benchmark.executar_cli(argv)
+
+
+def executar_cli(argv=None):
+    """Ponto de entrada headless. Retorna o código de saída do processo (0 = sucesso)."""
+    import signal
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if "--benchmark" in argv:
+        return executar_benchmark_cli(argv)
+    parser = criar_parser_cli()
+    args = parser.parse_args(argv)
+
+    if args.monitorar is not None:
+        return executar_monitor(args, parser)
+
+    if args.retomar is None:
+        if not args.planilhas:
+            parser.error("Informe a planilha.")
+        try:
+            planilhas = planilhas_do_lote(args.planilhas)
+        except FileNotFoundError as e:
+            parser.error(str(e))
+        if not planilhas:
+            parser.error(f"Nenhuma planilha encontrada em: {', '.join(args.planilhas)}")
+    elif args.retomar and not os.path.exists(args.retomar):
+        parser.error(f"Diário de envio não encontrado: {args.retomar}")
+
+    gerador = HeadlessOrderGenerator(output_base_dir=args.saida)
+    gerador.leitor_planilha = args.leitor
+    gerador.processos_renderizacao = args.processos
+    gerador.conexoes_ftp = args.conexoes_ftp
+    gerador.envio_continuo = not args.envio_em_lote
+    gerador.copia_local = args.copia_local
+    gerador.cache_em_disco = args.cache_disco
+    gerador.modo_incremental = args.incremental
+    gerador.progresso = ProgressoGeracao()
+    gerador.progresso.iniciar()
+    # Primeiro Ctrl+C: cancela entre grupos/arquivos, mantendo o que já foi gerado e o diário de
+    # envio em ordem; o segundo interrompe na hora
+    def cancelar(*_):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        gerador.log_message_safe("⏹ Cancelando... (Ctrl+C de novo para interromper na hora)")
+        gerador.progresso.cancelar()
+    tratador_anterior = signal.signal(signal.SIGINT, cancelar)
+    try:
+        ok = _executar_geracao_cli(gerador, args, parser, planilhas if args.retomar is None else None)
+    finally:
+        signal.signal(signal.SIGINT, tratador_anterior)
+    encerrar_sessoes_ftp()
+    return 0 if ok else 1
+
+def _executar_geracao_cli(gerador, args, parser, planilhas):
+    """Retomada de envio ou geração (avulsa ou em lote) pedida na linha de comando. Devolve True se deu certo."""
+    if args.retomar is not None:
+        return gerador._retomar_envio_logic(args.retomar or None, None, args.ftp_pass.strip())
+    parametros_xml = (args.oferta.strip(), args.nome_base.strip(), args.ftp)
+    parametros_txt = (args.destino, args.pagamento, args.ftp_padrao, args.ftp_pessoal,
+                      args.ftp_user.strip(), args.ftp_pass.strip())
+    if args.xml:
+        modo, parametros = "XML", (args.login.strip(),) + parametros_xml
+    else:
+        if not args.login.strip():
+            parser.error("Informe o login (--login) para geração TXT.")
+        if args.ftp_pessoal and (not args.ftp_user.strip() or not args.ftp_pass.strip()):
+            parser.error("Para envio à Pasta Pessoal, informe --ftp-user e --ftp-pass.")
+        if args.ambos:
+            modo, parametros = "AMBOS", (args.login_xml.strip(),) + parametros_xml + (args.login.strip(),) + parametros_txt
+        else:
+            modo, parametros = "TXT", (args.login.strip(),) + parametros_txt
+    if len(planilhas) > 1:
+        return gerador._generate_lote_logic(modo, planilhas, *parametros)
+    gerar = {"XML": gerador._generate_xml_logic, "TXT": gerador._generate_txt_logic,
+             "AMBOS": gerador._generate_ambos_logic}[modo]
+    return gerar(planilhas[0], *parametros)
+
+def executar_monitor(args, parser):
+    """Modo --monitorar da linha de comando: configura o MonitorPasta e só volta quando ele é encerrado."""
+    import signal
+    if args.ftp_pessoal and (not args.ftp_user.strip() or not args.ftp_pass.strip()):
+        parser.error("Para envio à Pasta Pessoal, informe --ftp-user e --ftp-pass.")
+    parametros_xml = (args.login_xml.strip(), args.oferta.strip(), args.nome_base.strip(), args.ftp)
+    parametros = {"XML": parametros_xml}
+    if args.login.strip(): # Sem login não há geração TXT: essas planilhas vão para Falhas/
+        parametros_txt = (args.login.strip(), args.destino, args.pagamento, args.ftp_padrao, args.ftp_pessoal,
+                          args.ftp_user.strip(), args.ftp_pass.strip())
+        parametros["TXT"] = parametros_txt
+        parametros["AMBOS"] = parametros_xml + parametros_txt
+    monitor = MonitorPasta(args.monitorar, parametros, output_base_dir=args.saida, usar_inotify=not args.sem_inotify)
+    monitor.intervalo = args.intervalo
+    monitor.espera_estabilidade = args.estabilidade
+    monitor.leitor_planilha = args.leitor
+    monitor.processos_renderizacao = args.processos
+    monitor.conexoes_ftp = args.conexoes_ftp
+    monitor.envio_continuo = not args.envio_em_lote
+    monitor.copia_local = args.copia_local
+    monitor.modo_incremental = args.incremental
+    # Primeiro sinal: encerra depois de cancelar a planilha em andamento; o segundo Ctrl+C interrompe na hora
+    def interromper(*_):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        monitor.interromper()
+    signal.signal(signal.SIGINT, interromper)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, interromper)
+    monitor.executar()
+    return 0
+
+# ==============================================================================
+# BLOCO DE EXECUÇÃO PRINCIPAL
+# ==============================================================================
+if __name__ == "__main__":
+    # Necessário para os processos de renderização no executável congelado (PyInstaller)
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+    # Com argumentos, roda em modo linha de comando (sem janela)
+    if len(sys.argv) > 1:
+        sys.exit(executar_cli(sys.argv[1:]))
+
+    # Dependências pesadas (pandas, openpyxl) são verificadas no pré-carregamento,
+    # depois que a janela aparece (ver UnifiedOrderGeneratorApp._pre_carregar_modulos)
+
+    # DPI awareness para Windows
+    if sys.platform == "win32":
+        try:
+            from ctypes import windll
+            windll.shcore.SetProcessDpiAwareness(1)
+        except Exception as e:
+            print(f"Aviso: Não foi possível definir DPI awareness: {e}")
+
+    app = criar_janela()
+    app.protocol("WM_DELETE_WINDOW", app.on_closing) # Garante que a configuração seja salva ao fechar
+    app.mainloop()
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def carregar(nome, arquivo):
+    spec = importlib.util.spec_from_file_location(nome, os.path.join(RAIZ, arquivo))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nome] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+@pytest.fixture(scope="session")
+def nucleo():
+    """O script principal, carregado pelo caminho (o nome com espaços não permite 'import')."""
+    return carregar("gerar_pedido", "gerar Pedido Epan ou XML.py")
+
+
+@pytest.fixture(scope="session")
+def benchmark(nucleo):
+    """benchmark_pedidos (planilhas sintéticas e ServidorFtpLocal), usando o mesmo núcleo dos testes."""
+    return carregar("benchmark_pedidos", "benchmark_pedidos.py")
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Envio FTP contra o ServidorFtpLocal do benchmark: retentativas e retomada pelo diário."""
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture
+def arquivos(tmp_path):
+    caminhos = []
+    for nome in ("a.xml", "b.xml", "c.xml", "d.xml"):
+        caminho = tmp_path / nome
+        caminho.write_bytes(nome.encode() * 1000)
+        caminhos.append(str(caminho))
+    return caminhos
+
+
+def criar_uploader(nucleo, servidor, log):
+    return nucleo.FtpUploader(servidor.host, servidor.porta, "u", "p", "/pedidos", conexoes=1, timeout=5,
+                              log=log.append, espera_inicial=0.01)
+
+
+def test_queda_no_meio_do_stor_e_repetida(nucleo, benchmark, arquivos, tmp_path):
+    log = []
+    with benchmark.ServidorFtpLocal(quedas=1) as servidor:
+        uploader = criar_uploader(nucleo, servidor, log)
+        diario = nucleo.DiarioEnvio.criar(str(tmp_path / "diarios"), "XML", "padrao", uploader)
+        resultados = uploader.enviar(arquivos[:1], diario)
+        nucleo.encerrar_sessoes_ftp()
+    assert resultados == [(arquivos[0], None)]
+    assert any("Falha transitória em a.xml" in linha for linha in log)
+    assert servidor.arquivos == {"/pedidos/a.xml": 5000}
+    assert nucleo.DiarioEnvio.carregar(diario.caminho).arquivos[arquivos[0]]["estado"] == nucleo.DiarioEnvio.ENVIADO
+
+
+def test_diario_gravado_pela_metade(nucleo, benchmark, arquivos, tmp_path):
+    """Programa fechado no meio do envio: a retomada envia só o que faltou, e o diário continua legível."""
+    log = []
+    with benchmark.ServidorFtpLocal() as servidor:
+        uploader = criar_uploader(nucleo, servidor, log)
+        diario = nucleo.DiarioEnvio.criar(str(tmp_path / "diarios"), "XML", "padrao", uploader, arquivos)
+        diario.registrar(arquivos[0], None)
+        diario.registrar(arquivos[1], None)
+        interrompida = json.dumps({"arquivo": arquivos[2], "estado": "enviado"})[:25]
+        with open(diario.caminho, "a", encoding="utf-8") as f:
+            f.write(interrompida) # Programa fechado durante a gravação
+
+        retomado = nucleo.DiarioEnvio.carregar(diario.caminho)
+        assert retomado.pendentes() == arquivos[2:]
+        assert uploader.enviar(retomado.pendentes(), retomado) == [(arquivos[2], None), (arquivos[3], None)]
+        nucleo.encerrar_sessoes_ftp()
+    assert sorted(servidor.arquivos) == ["/pedidos/c.xml", "/pedidos/d.xml"]
+    assert nucleo.DiarioEnvio.carregar(diario.caminho).pendentes() == []
+    # Os eventos da retomada começam em linha nova: só a linha interrompida fica ilegível
+    with open(diario.caminho, encoding="utf-8") as f:
+        linhas = f.read().splitlines()
+    assert [linha for linha in linhas if not linha.endswith("}")] == [interrompida]
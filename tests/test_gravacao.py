@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Publicação dos arquivos de saída: numeração por execução sem nunca substituir um arquivo existente."""
+import os
+
+import pytest
+
+
+def formatar(pasta, prefixo):
+    return lambda numero: os.path.join(pasta, f"{prefixo}_{numero}.xml")
+
+
+def test_sequencia_pula_arquivos_existentes(nucleo, tmp_path):
+    (tmp_path / "pd_A_1.xml").write_bytes(b"outra execucao")
+    sequencia = nucleo.SequenciaNomes()
+    base = os.path.join(tmp_path, "pd_A")
+    assert sequencia.proximo(base, formatar(tmp_path, "pd_A")) == os.path.join(tmp_path, "pd_A_2.xml")
+    assert sequencia.proximo(base, formatar(tmp_path, "pd_A")) == os.path.join(tmp_path, "pd_A_3.xml")
+
+
+def test_gravar_arquivo_nao_substitui(nucleo, tmp_path):
+    caminho = str(tmp_path / "pedido.txt")
+    nucleo.gravar_arquivo(caminho, b"primeiro")
+    with pytest.raises(FileExistsError):
+        nucleo.gravar_arquivo(caminho, b"segundo")
+    assert open(caminho, "rb").read() == b"primeiro"
+    assert os.listdir(tmp_path) == ["pedido.txt"] # Sem temporários esquecidos
+
+
+def test_outra_execucao_publica_o_nome_primeiro(nucleo, tmp_path):
+    """Duas execuções no mesmo segundo escolhem _1; a segunda a publicar vai para _2, com o NOMEARQ certo."""
+    pasta = str(tmp_path)
+    minha, outra = nucleo.SequenciaNomes(), nucleo.SequenciaNomes()
+    base = os.path.join(pasta, "pd_A")
+    caminho = minha.proximo(base, formatar(pasta, "pd_A"))
+    caminho_outra = outra.proximo(base, formatar(pasta, "pd_A"))
+    assert caminho == caminho_outra
+    nucleo.gravar_arquivo(caminho_outra, b"<NOMEARQ>pd_A_1</NOMEARQ>")
+
+    def renomear(atual, dados):
+        novo = minha.renomear(atual)
+        return novo, nucleo.trocar_nome_xml(dados, atual, novo)
+
+    publicado = nucleo.gravar_arquivo(caminho, b"<NOMEARQ>pd_A_1</NOMEARQ>", renomear)
+    assert publicado == os.path.join(pasta, "pd_A_2.xml")
+    assert open(publicado, "rb").read() == b"<NOMEARQ>pd_A_2</NOMEARQ>"
+    assert open(caminho_outra, "rb").read() == b"<NOMEARQ>pd_A_1</NOMEARQ>"
+    assert sorted(os.listdir(pasta)) == ["pd_A_1.xml", "pd_A_2.xml"]
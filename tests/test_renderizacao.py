@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Testes de referência (golden) da geração: uma planilha fixa é renderizada pela lógica
+original do script (iterrows no TXT, ElementTree no XML, copiadas abaixo sem os logs)
+e pelo pipeline atual (pré-validação, PedidosCompactos, renderizar_txt/renderizar_xml);
+os bytes de cada arquivo têm de ser idênticos. Também cobre os dígitos verificadores
+de CNPJ e GTIN-13 usados na pré-validação.
+"""
+import io
+import os
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+AGORA = datetime(2024, 3, 5, 9, 7, 3)
+HORA = AGORA.strftime("%H%M%S")
+
+
+def planilha(colunas, linhas):
+    """Planilha como a leitura devolve: tudo texto, células vazias como ''."""
+    return pd.DataFrame(linhas, columns=colunas, dtype=object)
+
+
+# Só linhas que a lógica original e a pré-validação tratam igual: CNPJs e EANs com
+# dígitos verificadores válidos ou itens que as duas descartam (EAN vazio, quantidade
+# inválida), sem ser a primeira linha do CNPJ.
+PLANILHA_TXT = (
+    ["CNPJ", "EAN", "QUANTIDADE", "NOME DO ARQUIVO", "OFERTA", "DEAL", "CONDICAO DE PAGAMENTO", "SUFIXO"],
+    [
+        ["11222333000181", "7891000315507", "10", "Pedido_A", "of1", "D1", "30d", ""],
+        ["60746948000112", "4006381333931", "0002", "pedido_b", " x ", "Y", "z", "W"],
+        ["11222333000181", " 7894900011517 ", "3", "Pedido_A", "of1", "D1", "30d", "S"],
+        ["11222333000181", "", "5", "Pedido_A", "of1", "D1", "30d", ""],
+        ["6990590000123", "4006381333931", "7", "Pedido_A", "OF2", "Ação", "60D", ""],
+        ["6990590000123", "7891234567895", "abc", "Pedido_A", "OF2", "Ação", "60D", ""],
+        ["6990590000123", "7891000053508", "0", "Pedido_A", "OF2", "Ação", "60D", ""],
+        ["6990590000123", "7891000053508", "12", "Pedido_A", "of3", "outro", "90d", "Ç"],
+        ["33000167000101", "7891000315507", "1", "pedido_b", "", "", "", ""],
+        ["33000167000101", "7894900011517", "4", "Pedido/C?", "OF", "", "", ""],
+    ],
+)
+
+PLANILHA_XML = (
+    ["CNPJ", "EAN", "Quantidade", "Oferta", "NomeArquivo"],
+    [
+        ["11222333000181", "7891000315507", "5", "399", "PEDIDO_A"],
+        ["11222333000181", "7894900011517", "12", "399", "PEDIDO_A"],
+        ["11222333000181", "", "3", "399", "PEDIDO_A"],
+        ["11222333000181", "4006381333931", "abc", "399", "PEDIDO_A"],
+        ["33000167000101", " 7891234567895", "100000", "O&F<1>", "PEDIDO_B"],
+        ["11222333000181", "7891000053508", "1", "400", "PEDIDO_A"],
+        ["60746948000112", "7891000315507", "-2", "399", "Pedido €"],
+        ["60746948000112", "4006381333931", "7", "399", "Pedido €"],
+    ],
+)
+
+
+# ==============================================================================
+# LÓGICA ORIGINAL (REFERÊNCIA)
+# ==============================================================================
+def txt_original(df, usuario, forma_pagamento_codigo, hr_str, pasta):
+    """_generate_txt_logic/_generate_single_txt originais: {nome do arquivo: bytes gravados}."""
+    arquivos = {}
+    for nome_arq, grupo_df in df.groupby("NOME DO ARQUIVO"):
+        nome_arquivo_base = str(nome_arq).strip().lower()
+        nome_sanitizado = re.sub(r'[<>:"/\\|?*]', '_', nome_arquivo_base)
+        path_txt = os.path.join(pasta, f"{nome_sanitizado}.txt")
+        with open(path_txt, "w", encoding="latin1") as f:
+            for cnpj, pedidos in grupo_df.groupby("CNPJ"):
+                cnpj_str = str(cnpj).strip()
+                if len(cnpj_str) == 13 and cnpj_str.isdigit():
+                    cnpj_str = '0' + cnpj_str
+                if not cnpj_str or len(cnpj_str) < 14:
+                    continue
+                p = pedidos.iloc[0]
+                cp = str(p.get("CONDICAO DE PAGAMENTO", "")).strip().upper()
+                deal = str(p.get("DEAL", "")).strip()
+                oft_c = str(p.get("OFERTA", "")).strip().upper()
+                r1 = [
+                    "1", cnpj_str, "16", usuario, oft_c, "0", nome_sanitizado,
+                    "2.1.34", "01206820003708", "", "", "", "", "0", deal, cp,
+                    hr_str, forma_pagamento_codigo, "6e6079c8a0744532a84663bf5dc67f69"
+                ]
+                f.write(";".join(map(str, r1)) + ";\n")
+                itens_ok = 0
+                for _, item in pedidos.iterrows():
+                    ean = str(item.get("EAN", "")).strip()
+                    qtd = str(item.get("QUANTIDADE", "")).strip()
+                    oft_i = str(item.get("OFERTA", oft_c)).strip().upper()
+                    deal_i = str(item.get("DEAL", deal)).strip()
+                    cond_i = str(item.get("CONDICAO DE PAGAMENTO", cp)).strip().upper()
+                    suf = str(item.get("SUFIXO", "")).strip()
+                    if not ean or not qtd or not qtd.isdigit() or int(qtd) <= 0:
+                        continue
+                    r2 = ["2", ean, qtd, oft_i, "0", "", "", deal_i, cond_i, "0", "", suf]
+                    f.write(";".join(map(str, r2)) + ";\n")
+                    itens_ok += 1
+                if itens_ok > 0:
+                    r3 = ["3", str(itens_ok), str(itens_ok)]
+                    f.write(";".join(map(str, r3)) + ";\n")
+        with open(path_txt, "rb") as f:
+            arquivos[nome_arquivo_base] = f.read()
+    return arquivos
+
+
+def xml_original(df, login, agora):
+    """_generate_xml_logic/_generate_single_xml originais: {(CNPJ, NomeArquivo, Oferta): bytes gravados}."""
+    df = df.copy()
+    df['Quantidade'] = pd.to_numeric(df['Quantidade'], errors='coerce').fillna(0).astype(int)
+    arquivos = {}
+    for (cnpj, nome_base, oferta), produtos_df in df.groupby(["CNPJ", "NomeArquivo", "Oferta"], dropna=False):
+        hr_str = agora.strftime("%H%M%S")
+        nome_xml = f"pd{login}_{nome_base}_{agora.strftime('%d%m%y')}_{hr_str}_1.xml"
+        root = ET.Element("ArquivoUpload")
+        pedido = ET.SubElement(root, "PEDIDO")
+        item_p = ET.SubElement(pedido, "item")
+        cab = ET.SubElement(item_p, "CABECALHO")
+        campos = {
+            "CODIGOCLIENTE": "00000000", "NOMECLIENTE": "", "CODIGOPEDIDO": "00000000000000000000",
+            "CNPJ": cnpj, "DATA": agora.strftime("%d%m%Y"), "HORA": hr_str, "MENSAGEM": "",
+            "PROMOCAO": oferta, "CNPJFORNEC": "", "NECRETORNO": "", "TIPORETORNO": "", "CANAL": "BBSC",
+            "CODIGOTELE": "", "LOGIN": login, "VALIDADESCONTO": "", "TIPOPAGAMENTO": "2", "TIPOPRAZO": "",
+            "CODIGOCONDPGTO": "000", "CNPJPROJETO": "", "IDPROJETO": "", "PEDIDOPROJETO": "000000006481362",
+            "NOMEPROJETO": "FOCOPDV", "NOMEARQ": nome_xml.replace(".xml", ""), "GLN": "", "CODIGODOPROJETO": "",
+            "CNPJENTREGA": "", "CODUTCLIENTE": "", "CANALPED": "", "CNPJ_COMPR": "", "CNPJ_LOCCOB": "",
+            "GLN_COMPR": "", "GLN_LOCCOB": "", "GLN_LOCENTREGA": "", "GLN_DISTR": "", "CNPJ_LOCENT": ""
+        }
+        for tag, value in campos.items():
+            ET.SubElement(cab, tag).text = str(value)
+        itenspedido = ET.SubElement(item_p, "ITENSPEDIDO")
+        itens_tag = ET.SubElement(itenspedido, "ITENS")
+        total_u = 0
+        total_i = 0
+        for prod in produtos_df.itertuples(index=False):
+            qtd_v = getattr(prod, 'Quantidade', 0)
+            if not isinstance(qtd_v, (int, float)) or qtd_v <= 0:
+                continue
+            qtd_s = str(int(qtd_v)).zfill(5)
+            ean_v = str(getattr(prod, 'EAN', '')).strip()
+            if not ean_v or not ean_v.isdigit() or len(ean_v) != 13:
+                continue
+            item_a = ET.SubElement(itens_tag, "item")
+            ET.SubElement(item_a, "QUANTIDADE").text = qtd_s
+            ET.SubElement(item_a, "CODPROCLIENTE").text = "00000000000016924231"
+            ET.SubElement(item_a, "CODIGOEAN13").text = ean_v
+            ET.SubElement(item_a, "PERCDESCONTO").text = "19.60"
+            ET.SubElement(item_a, "PRECOFABRICA").text = "0000.00"
+            ET.SubElement(item_a, "DESCONTOLAB").text = "0000.00"
+            ET.SubElement(item_a, "TIPORETORNO").text = "3"
+            total_u += int(qtd_v)
+            total_i += 1
+        ET.SubElement(itenspedido, "NUMITENS").text = str(total_i).zfill(10)
+        ET.SubElement(itenspedido, "UNIDADESPEDIDAS").text = f"{total_u:.2f}".zfill(10)
+        tree = ET.ElementTree(root)
+        ET.indent(tree, space="\t", level=0)
+        saida = io.BytesIO()
+        tree.write(saida, encoding="ISO-8859-1", xml_declaration=True)
+        arquivos[(cnpj, nome_base, oferta)] = saida.getvalue().replace(b"\n", os.linesep.encode())
+    return arquivos
+
+
+# ==============================================================================
+# PIPELINE ATUAL (MESMOS PASSOS DE _generate_txt_logic / _generate_xml_logic)
+# ==============================================================================
+def txt_atual(nucleo, df, usuario, forma_pagamento_codigo, hr_str):
+    itens = nucleo.preparar_itens_txt(df)
+    motivos = nucleo.motivos_rejeicao(itens["NOME DO ARQUIVO"].str.strip(), itens["_cnpj"], itens["_ean"],
+                                      nucleo.quantidades_txt_ok(itens["_qtd"]), nucleo.linhas_vazias(df))
+    pedidos = nucleo.pedidos_txt(itens[(motivos == "").to_numpy()])
+    arquivos = {}
+    for (nome_arq,), inicio, fim in pedidos.grupos(niveis=1):
+        nome_limpo = str(nome_arq).strip().lower()
+        nome_sanitizado = re.sub(r'[<>:"/\\|?*]', '_', nome_limpo)
+        payload = (nome_limpo, nome_sanitizado, nucleo.colunas_txt_do_grupo(pedidos, inicio, fim),
+                   usuario, forma_pagamento_codigo, hr_str)
+        conteudo, erro, _ = nucleo._tarefa_renderizar_txt(payload)
+        assert erro is None
+        arquivos[nome_limpo] = conteudo
+    return arquivos
+
+
+def xml_atual(nucleo, df, login, agora):
+    cnpj, _ = nucleo.corrigir_cnpj(df["CNPJ"])
+    ean = df["EAN"].astype(str).str.strip()
+    quantidade = pd.to_numeric(df["Quantidade"], errors="coerce")
+    motivos = nucleo.motivos_rejeicao(df["NomeArquivo"].astype(str).str.strip(), cnpj, ean,
+                                      quantidade.between(1, 1e15), nucleo.linhas_vazias(df))
+    limpas = (motivos == "").to_numpy()
+    df = df[limpas].assign(CNPJ=cnpj[limpas], EAN=ean[limpas], Quantidade=quantidade[limpas].astype(np.int64))
+    pedidos = nucleo.PedidosCompactos(df, ("CNPJ", "NomeArquivo", "Oferta"), {"EAN": "S13", "Quantidade": np.int64})
+    arquivos = {}
+    for (cnpj, nome_base, oferta), inicio, fim in pedidos.grupos():
+        nome_xml = f"pd{login}_{nome_base}_{agora.strftime('%d%m%y')}_{agora.strftime('%H%M%S')}_1.xml"
+        payload = (cnpj, pedidos.colunas["Quantidade"][inicio:fim], pedidos.colunas["EAN"][inicio:fim],
+                   oferta, login, nome_xml, agora)
+        conteudo, erro = nucleo._tarefa_renderizar_xml(payload)
+        assert erro is None
+        arquivos[(cnpj, nome_base, oferta)] = conteudo
+    return arquivos
+
+
+# ==============================================================================
+# TESTES
+# ==============================================================================
+@pytest.mark.parametrize("forma_pagamento_codigo", ["", "2"])
+def test_txt_igual_a_logica_original(nucleo, tmp_path, forma_pagamento_codigo):
+    df = planilha(*PLANILHA_TXT)
+    esperado = txt_original(df, "v001", forma_pagamento_codigo, HORA, tmp_path)
+    obtido = txt_atual(nucleo, df, "v001", forma_pagamento_codigo, HORA)
+    assert sorted(obtido) == sorted(esperado) == ["pedido/c?", "pedido_a", "pedido_b"]
+    for nome, conteudo in esperado.items():
+        assert obtido[nome] == conteudo, nome
+
+
+def test_txt_conta_pedidos_pelos_cabecalhos(nucleo):
+    df = planilha(*PLANILHA_TXT)
+    itens = nucleo.preparar_itens_txt(df)
+    motivos = nucleo.motivos_rejeicao(itens["NOME DO ARQUIVO"].str.strip(), itens["_cnpj"], itens["_ean"],
+                                      nucleo.quantidades_txt_ok(itens["_qtd"]), nucleo.linhas_vazias(df))
+    pedidos = nucleo.pedidos_txt(itens[(motivos == "").to_numpy()])
+    for (nome_arq,), inicio, fim in pedidos.grupos(niveis=1):
+        texto, quantidade = nucleo.renderizar_txt(nome_arq, nome_arq, nucleo.colunas_txt_do_grupo(pedidos, inicio, fim),
+                                                  "v001", "", HORA)
+        assert quantidade == sum(linha.startswith("1;") for linha in texto.splitlines())
+
+
+def test_txt_mudancas_da_pre_validacao(nucleo):
+    """
+    Onde o pipeline atual difere da lógica original de propósito: o cabeçalho (OFERTA, DEAL,
+    CONDICAO) vem da primeira linha válida do CNPJ, não da primeira da planilha, e um CNPJ
+    sem itens válidos não grava a linha 1 sozinha.
+    """
+    df = planilha(PLANILHA_TXT[0], [
+        ["11222333000181", "", "5", "Pedido_A", "ruim", "D0", "0d", ""],
+        ["11222333000181", "7891000315507", "10", "Pedido_A", "boa", "D1", "30d", ""],
+        ["60746948000112", "4006381333932", "2", "Pedido_A", "of2", "D2", "60d", ""],
+        ["60746948000112", "7891000315507", "0", "Pedido_A", "of2", "D2", "60d", ""],
+    ])
+    obtido = txt_atual(nucleo, df, "v001", "", HORA)
+    assert obtido["pedido_a"].decode("latin1").splitlines() == [
+        f"1;11222333000181;16;v001;BOA;0;pedido_a;2.1.34;01206820003708;;;;;0;D1;30D;{HORA};;6e6079c8a0744532a84663bf5dc67f69;",
+        "2;7891000315507;10;BOA;0;;;D1;30D;0;;;",
+        "3;1;1;",
+    ]
+
+
+def test_xml_igual_a_logica_original(nucleo):
+    df = planilha(*PLANILHA_XML)
+    esperado = xml_original(df, "pdvlinkmerck", AGORA)
+    obtido = xml_atual(nucleo, df, "pdvlinkmerck", AGORA)
+    assert sorted(obtido) == sorted(esperado)
+    assert len(esperado) == 4
+    for chave, conteudo in esperado.items():
+        assert obtido[chave] == conteudo, chave
+
+
+@pytest.mark.parametrize("cnpj, valido", [
+    ("11222333000181", True),
+    ("06990590000123", True),
+    ("33000167000101", True),
+    ("60746948000112", True),
+    ("11222333000182", False), # Segundo dígito errado
+    ("11222333000171", False), # Primeiro dígito errado
+    ("00000000000000", False), # Dígitos corretos, mas todos repetidos
+    ("11111111111111", False),
+])
+def test_digitos_cnpj(nucleo, cnpj, valido):
+    assert nucleo._cnpj_digitos_ok(nucleo._matriz_digitos([cnpj], 14)).tolist() == [valido]
+
+
+@pytest.mark.parametrize("ean, valido", [
+    ("4006381333931", True),
+    ("7891000315507", True),
+    ("7894900011517", True),
+    ("7891234567895", True),
+    ("0000000000000", True),
+    ("4006381333932", False),
+    ("7891000315500", False),
+])
+def test_digito_ean(nucleo, ean, valido):
+    assert nucleo._ean_digito_ok(nucleo._matriz_digitos([ean], 13)).tolist() == [valido]
+
+
+def test_motivos_rejeicao(nucleo):
+    cnpj, corrigidos = nucleo.corrigir_cnpj(pd.Series(["11222333000181", "6990590000123", "11222333000182",
+                                                       "1122233300018", "", "11222333000181", "11222333000181"]))
+    ean = pd.Series(["7891000315507", "7891000315507", "7891000315507", "7891000315507",
+                     "7891000315507", "4006381333932", "78910003155"])
+    motivos = nucleo.motivos_rejeicao(pd.Series(["A"] * 7), cnpj, ean, [True] * 7, [False] * 7)
+    assert corrigidos.tolist() == [False, True, False, True, False, False, False]
+    assert motivos.tolist() == ["", "", "cnpj_digito_invalido", "cnpj_digito_invalido", "cnpj_vazio",
+                                "ean_digito_invalido", "ean_tamanho_invalido"]